@@ -0,0 +1,5 @@
+"""SeeSea Analytics API"""
+from dotenv import load_dotenv
+
+# Load environment variables once, before any module reads its settings
+load_dotenv()
@@ -0,0 +1,137 @@
+"""
+Response Compression
+gzip / Brotli / Zstandard compression of buffered responses
+"""
+import os
+import gzip
+import asyncio
+import functools
+from typing import Callable, Dict, Optional
+from starlette.datastructures import Headers, MutableHeaders
+
+# Bodies above this size are compressed in a worker thread
+THREAD_COMPRESSION_BYTES = 1024 * 1024
+
+# Content types worth compressing (prefixes)
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "application/xml", "text/")
+
+
+@functools.lru_cache(maxsize=None)
+def load_encoders() -> Dict[str, Callable[[bytes], bytes]]:
+    """
+    Content-Encoding -> compress function, in order of preference
+
+    brotli and zstandard are optional dependencies; without them only the
+    encodings that can be produced are offered.
+    """
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    try:
+        import zstandard
+
+        def zstd_compress(body: bytes) -> bytes:
+            # Compressor objects are not thread-safe, so one per body
+            return zstandard.ZstdCompressor(level=3).compress(body)
+
+        encoders["zstd"] = zstd_compress
+    except ImportError:
+        pass
+    try:
+        import brotli
+        encoders["br"] = functools.partial(brotli.compress, quality=4)
+    except ImportError:
+        pass
+    encoders["gzip"] = functools.partial(gzip.compress, compresslevel=6, mtime=0)
+    return encoders
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Supported encoding the client prefers (highest q > 0), or None
+
+    Ties go to the server's preference order (load_encoders); `*` stands
+    for any encoding not listed explicitly.
+    """
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in load_encoders():
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing response bodies with zstd, br or gzip
+
+    Only responses sent in a single body message are compressed, which
+    covers JSON routes and leaves streamed bodies (SSE, exports) untouched
+    so they still flush chunk by chunk. Bodies under COMPRESSION_MIN_BYTES,
+    non-text content types and responses that already have a
+    Content-Encoding are passed through. Compressible responses always
+    carry `Vary: Accept-Encoding`, compressed or not, so shared caches
+    (nginx) keep one variant per encoding.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.minimum_size = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held until the body shows whether it can be compressed
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+                and "content-encoding" not in headers
+            )
+            if not compressible or message.get("more_body", False):
+                await send(start)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is not None and len(body) >= self.minimum_size:
+                compress = load_encoders()[encoding]
+                if len(body) > THREAD_COMPRESSION_BYTES:
+                    body = await asyncio.to_thread(compress, body)
+                else:
+                    body = compress(body)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                message = {"type": "http.response.body", "body": body}
+
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
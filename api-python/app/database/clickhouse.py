@@ -2,62 +2,537 @@
 ClickHouse Database Connection
 """
 import os
-from typing import Optional, Dict, List, Any
+import json
+import math
+import uuid
+import functools
+import time
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional, Dict, List, Any, AsyncIterator, Set, Union
 import httpx
-from dotenv import load_dotenv
+import numpy as np
+from app.database.query_builder import BoundQuery, format_param
+from app.deadlines import DeadlineExceeded, current_deadline
+from app.metrics import CLICKHOUSE_QUERIES_KILLED, CLICKHOUSE_QUERY_ERRORS, observe_clickhouse_query
+
+# ClickHouse error for queries stopped by max_execution_time (TIMEOUT_EXCEEDED)
+TIMEOUT_EXCEEDED_ERROR = b"Code: 159."
+
+
+@functools.lru_cache(maxsize=None)
+def load_pyarrow():
+    """
+    Import pyarrow on first use, or return None if it is not installed
+
+    pyarrow is an optional dependency that takes a noticeable time to
+    import, so it is not loaded with this module; prewarm() loads it
+    ahead of the first query that needs it.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def as_dates(values: np.ndarray) -> np.ndarray:
+    """
+    A Date column from query_columns as datetime64[D]
+
+    Accepts ClickHouse's Arrow encoding (integer days since the epoch) as
+    well as ISO date strings (JSON) and datetime64 values.
+    """
+    if values.dtype.kind in "iu":
+        return values.astype(np.int64).astype("datetime64[D]")
+    return values.astype("datetime64[D]")
+
+
+class ClickHouseStream:
+    """
+    An open ClickHouse response relayed in its raw output format
+
+    Iterating yields body chunks as they arrive, without decoding them.
+    aclose() closes the response and, if it was not read to the end, kills
+    the query (safe to call more than once, and needed even if the stream
+    was never iterated).
+    """
+
+    def __init__(self, owner: "ClickHouseClient", response: httpx.Response, stack: AsyncExitStack,
+                 query_id: str, template: str, result_format: str, started: float):
+        self._owner = owner
+        self._response = response
+        self._stack = stack
+        self._query_id = query_id
+        self._template = template
+        self._format = result_format
+        self._started = started
+        self._finished = False
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._response.aiter_bytes():
+            yield chunk
+        self._finished = True
+
+    async def aclose(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        if self._finished:
+            observe_clickhouse_query(
+                self._template,
+                self._format,
+                time.perf_counter() - self._started,
+                0.0,
+                self._response.num_bytes_downloaded,
+                self._response.headers.get("X-ClickHouse-Summary"),
+            )
+        else:
+            self._owner._kill(self._query_id, self._template, "cancelled")
+        await self._stack.aclose()
 
-load_dotenv()
 
 class ClickHouseClient:
-    """ClickHouse HTTP client for analytics queries"""
+    """
+    ClickHouse HTTP client for analytics queries
+
+    A single pooled httpx.AsyncClient is shared for the lifetime of the
+    application: connect() is called at startup and close() at shutdown.
+    Connection health is refreshed by a background task so request handlers
+    can read is_healthy instead of pinging on every call. Every query is
+    timed and recorded per template (see app.metrics).
+
+    Every query gets a generated query_id and a deadline: the deadline of
+    the request being handled (see app.deadlines), capped at `timeout`
+    seconds. The remaining time is sent as max_execution_time and enforced
+    client-side; if the deadline passes or the calling task is cancelled
+    (e.g. the client disconnected), the query is killed with KILL QUERY so
+    abandoned work does not keep running on the server.
+    """
 
     def __init__(self):
         self.url = os.getenv("CLICKHOUSE_URL", "http://localhost:8123")
         self.database = "seesea_analytics"
-        self.timeout = 30.0
+        # Seconds a query may run when no earlier request deadline applies
+        self.timeout = float(os.getenv("CLICKHOUSE_QUERY_TIMEOUT", "30"))
+        # Seconds a streamed export may run (not bound by the request deadline)
+        self.export_timeout = float(os.getenv("CLICKHOUSE_EXPORT_TIMEOUT", "600"))
+
+        # Connection pool settings
+        self.max_connections = int(os.getenv("CLICKHOUSE_MAX_CONNECTIONS", "20"))
+        self.max_keepalive_connections = int(os.getenv("CLICKHOUSE_MAX_KEEPALIVE_CONNECTIONS", "10"))
+        self.keepalive_expiry = float(os.getenv("CLICKHOUSE_KEEPALIVE_EXPIRY", "30"))
+
+        # Pooled connections opened by prewarm()
+        self.prewarm_connections = min(
+            int(os.getenv("CLICKHOUSE_PREWARM_CONNECTIONS", "4")),
+            self.max_keepalive_connections
+        )
+
+        # Seconds between background health checks
+        self.health_check_interval = float(os.getenv("CLICKHOUSE_HEALTH_CHECK_INTERVAL", "10"))
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._healthy = False
+        self._kill_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled HTTP client (created lazily if connect() was not called)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return self._client
+
+    @property
+    def is_healthy(self) -> bool:
+        """Last known health state, refreshed by the background health check"""
+        return self._healthy
+
+    async def connect(self):
+        """Open the connection pool and start the background health check"""
+        # ping() goes through the shared client, which opens the pool
+        await self.ping()
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_check_loop())
+
+    async def close(self):
+        """Stop the health check and close all pooled connections"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except asyncio.CancelledError:
+                pass
+            self._health_task = None
 
-    async def execute_query(self, query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        # Let pending KILL QUERY requests go out before the pool closes
+        if self._kill_tasks:
+            await asyncio.gather(*self._kill_tasks, return_exceptions=True)
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._healthy = False
+        self._kill_tasks: Set[asyncio.Task] = set()
+
+    async def prewarm(self) -> int:
+        """
+        Get ready for the first queries
+
+        Opens prewarm_connections pooled keep-alive connections by running
+        that many `SELECT 1` queries concurrently, and imports the result
+        decoder (pyarrow) off the event loop.
+
+        Returns:
+            Number of connections that answered
+        """
+        await asyncio.to_thread(load_pyarrow)
+
+        async def select_one() -> bool:
+            try:
+                response = await self.client.post(
+                    self.url,
+                    params={"database": self.database},
+                    content="SELECT 1",
+                    timeout=5.0
+                )
+                return response.status_code == 200
+            except Exception:
+                return False
+
+        results = await asyncio.gather(*(select_one() for _ in range(self.prewarm_connections)))
+        return sum(results)
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.ping()
+
+    @staticmethod
+    def _template_name(query: Union[str, BoundQuery]) -> str:
+        """Metrics label for a query: its template name, or "raw" for ad-hoc SQL"""
+        return query.name if isinstance(query, BoundQuery) else "raw"
+
+    def _query_deadline(self, template: str) -> float:
+        """
+        Deadline (time.monotonic()) for a query starting now
+
+        Raises:
+            DeadlineExceeded: If the request deadline has already passed
+        """
+        now = time.monotonic()
+        deadline = now + self.timeout
+        request_deadline = current_deadline()
+        if request_deadline is not None:
+            deadline = min(deadline, request_deadline)
+        if deadline <= now:
+            CLICKHOUSE_QUERY_ERRORS.labels(template=template).inc()
+            raise DeadlineExceeded(f"No time left to run ClickHouse query {template}")
+        return deadline
+
+    def _request_params(self, query: Union[str, BoundQuery], params: Optional[Dict[str, Any]], deadline: float) -> tuple[str, Dict[str, str]]:
+        """Build the SQL body and URL parameters for a raw or bound query"""
+        request_params = {
+            "database": self.database,
+            "default_format": "JSONEachRow",
+            "query_id": uuid.uuid4().hex,
+            # Whole seconds (the server's granularity), never less than one
+            "max_execution_time": str(max(1, math.ceil(deadline - time.monotonic()))),
+            # Also stop read-only queries if the connection is dropped
+            "cancel_http_readonly_queries_on_client_close": "1",
+        }
+
+        if isinstance(query, BoundQuery):
+            sql = query.sql
+            # Tag the query so system.query_log can be grouped per template
+            request_params["log_comment"] = query.name
+            bound = dict(query.params)
+        else:
+            sql = query
+            bound = {}
+
+        if params:
+            bound.update({name: format_param(value) for name, value in params.items()})
+
+        for name, value in bound.items():
+            request_params[f"param_{name}"] = value
+
+        return sql, request_params
+
+    @asynccontextmanager
+    async def _killed_on_abort(self, query_id: str, template: str) -> AsyncIterator[None]:
+        """
+        Kill the query if the block times out or is cancelled
+
+        Raises:
+            DeadlineExceeded: Instead of the client-side timeout
+        """
+        try:
+            yield
+        except asyncio.CancelledError:
+            self._kill(query_id, template, "cancelled")
+            raise
+        except (TimeoutError, httpx.TimeoutException) as e:
+            self._kill(query_id, template, "deadline")
+            raise DeadlineExceeded(f"ClickHouse query {template} did not finish before the deadline") from e
+
+    def _kill(self, query_id: str, template: str, reason: str):
+        """Send KILL QUERY in the background (the caller is already unwinding)"""
+        CLICKHOUSE_QUERIES_KILLED.labels(template=template, reason=reason).inc()
+        task = asyncio.create_task(self.kill_query(query_id))
+        self._kill_tasks.add(task)
+        task.add_done_callback(self._kill_tasks.discard)
+
+    async def kill_query(self, query_id: str) -> bool:
+        """
+        Kill a running query by its query_id
+
+        ASYNC returns without waiting for the query to stop. query_id must be
+        one generated by this client (hex), as it is inlined into the SQL.
+
+        Returns:
+            True if ClickHouse accepted the KILL QUERY
+        """
+        if not all(c in "0123456789abcdef" for c in query_id):
+            raise ValueError(f"Invalid query_id {query_id!r}")
+        try:
+            response = await self.client.post(
+                self.url,
+                content=f"KILL QUERY WHERE query_id = '{query_id}' ASYNC",
+                timeout=5.0
+            )
+            return response.status_code == 200
+        except Exception:
+            return False
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response):
+        """
+        Raise for error responses (the body must have been read)
+
+        Raises:
+            DeadlineExceeded: If ClickHouse stopped the query at max_execution_time
+            httpx.HTTPStatusError: For other errors
+        """
+        if response.is_error and TIMEOUT_EXCEEDED_ERROR in response.content:
+            raise DeadlineExceeded("ClickHouse stopped the query at max_execution_time")
+        response.raise_for_status()
+
+    async def stream_query(self, query: Union[str, BoundQuery], params: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Execute a query and yield rows as they arrive
+
+        JSONEachRow output is decoded line by line from the response stream,
+        so the full result set is never buffered in memory.
+
+        Args:
+            query: SQL query string or a BoundQuery from the query builder
+            params: Optional values for {name:Type} placeholders in the query
+
+        Yields:
+            One dictionary per result row
+
+        Raises:
+            DeadlineExceeded: If the query did not finish before its deadline
+        """
+        template = self._template_name(query)
+        deadline = self._query_deadline(template)
+        sql, request_params = self._request_params(query, params, deadline)
+
+        started = time.perf_counter()
+        decode_seconds = 0.0
+        # Time the caller spends between rows is not query time
+        paused = 0.0
+
+        try:
+            async with self._killed_on_abort(request_params["query_id"], template), self.client.stream(
+                "POST",
+                self.url,
+                params=request_params,
+                content=sql,
+                timeout=deadline - time.monotonic()
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                self._raise_for_status(response)
+
+                async for line in response.aiter_lines():
+                    if time.monotonic() > deadline:
+                        raise TimeoutError
+                    if line:
+                        decode_started = time.perf_counter()
+                        row = json.loads(line)
+                        decode_seconds += time.perf_counter() - decode_started
+
+                        yield_started = time.perf_counter()
+                        yield row
+                        paused += time.perf_counter() - yield_started
+        except Exception:
+            CLICKHOUSE_QUERY_ERRORS.labels(template=template).inc()
+            raise
+
+        observe_clickhouse_query(
+            template,
+            request_params["default_format"],
+            time.perf_counter() - started - paused,
+            decode_seconds,
+            response.num_bytes_downloaded,
+            response.headers.get("X-ClickHouse-Summary"),
+        )
+
+    async def execute_query(self, query: Union[str, BoundQuery], params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Execute a query and return results as list of dictionaries
 
         Args:
-            query: SQL query string
-            params: Optional parameters for query
+            query: SQL query string or a BoundQuery from the query builder
+            params: Optional values for {name:Type} placeholders in the query
 
         Returns:
             List of dictionaries with query results
         """
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            # Format query with database
-            full_query = f"USE {self.database};\n{query}"
+        return [row async for row in self.stream_query(query, params)]
 
-            # Execute query with JSON format
-            response = await client.post(
-                self.url,
-                params={
-                    "query": full_query,
-                    "default_format": "JSONEachRow"
-                }
-            )
-            response.raise_for_status()
+    async def query_columns(self, query: Union[str, BoundQuery], params: Optional[Dict[str, Any]] = None) -> Dict[str, np.ndarray]:
+        """
+        Execute a query and return results as one NumPy array per column
+
+        Results are fetched as ArrowStream and converted column by column
+        without building per-row Python objects. When pyarrow is not
+        installed, JSONColumns is used instead (one JSON array per column).
+        Strings are str either way. ClickHouse sends Date columns in Arrow
+        as UInt16 days since the epoch (DateTime as UInt32 seconds), and as
+        ISO strings in JSON; callers convert them (see as_dates).
+
+        Args:
+            query: SQL query string or a BoundQuery from the query builder
+            params: Optional values for {name:Type} placeholders in the query
+
+        Returns:
+            Dictionary of column name -> array, in SELECT order
+
+        Raises:
+            DeadlineExceeded: If the query did not finish before its deadline
+        """
+        template = self._template_name(query)
+        deadline = self._query_deadline(template)
+        sql, request_params = self._request_params(query, params, deadline)
+
+        pyarrow = load_pyarrow()
+        if pyarrow is not None:
+            request_params["default_format"] = "ArrowStream"
+            request_params["output_format_arrow_string_as_string"] = "1"
+        else:
+            request_params["default_format"] = "JSONColumns"
+            request_params["output_format_json_quote_64bit_integers"] = "0"
+
+        started = time.perf_counter()
+
+        try:
+            async with self._killed_on_abort(request_params["query_id"], template):
+                async with asyncio.timeout(deadline - time.monotonic()):
+                    response = await self.client.post(self.url, params=request_params, content=sql)
+            self._raise_for_status(response)
+        except Exception:
+            CLICKHOUSE_QUERY_ERRORS.labels(template=template).inc()
+            raise
+
+        fetched = time.perf_counter()
+
+        if not response.content:
+            columns = {}
+        elif pyarrow is None:
+            columns = {name: np.asarray(values) for name, values in json.loads(response.content).items()}
+        else:
+            table = pyarrow.ipc.open_stream(response.content).read_all()
+            columns = {
+                name: column.to_numpy()
+                for name, column in zip(table.column_names, table.columns)
+            }
+
+        observe_clickhouse_query(
+            template,
+            request_params["default_format"],
+            fetched - started,
+            time.perf_counter() - fetched,
+            response.num_bytes_downloaded,
+            response.headers.get("X-ClickHouse-Summary"),
+        )
+        return columns
+
+    async def open_stream(
+        self,
+        query: Union[str, BoundQuery],
+        result_format: str,
+        params: Optional[Dict[str, Any]] = None,
+        settings: Optional[Dict[str, str]] = None
+    ) -> ClickHouseStream:
+        """
+        Start a query whose result is relayed as raw bytes
+
+        The body is produced by ClickHouse in `result_format` (e.g. Parquet)
+        and never buffered or decoded here, so memory stays constant however
+        large the result is. The query may run for export_timeout seconds
+        rather than until the request deadline. The response is opened
+        before this returns, so callers can still answer with an error
+        status. The caller must aclose() the returned stream.
 
-            # Parse JSON lines response
-            results = []
-            for line in response.text.strip().split('\n'):
-                if line:
-                    import json
-                    results.append(json.loads(line))
+        Args:
+            query: SQL query string or a BoundQuery from the query builder
+            result_format: ClickHouse output format
+            params: Optional values for {name:Type} placeholders in the query
+            settings: Optional extra ClickHouse settings
+
+        Raises:
+            DeadlineExceeded: If ClickHouse does not start answering in time
+            httpx.HTTPError: If the query fails before its result is streamed
+        """
+        template = self._template_name(query)
+        sql, request_params = self._request_params(query, params, time.monotonic() + self.export_timeout)
+        request_params["default_format"] = result_format
+        request_params.update(settings or {})
 
-            return results
+        started = time.perf_counter()
+        stack = AsyncExitStack()
+        try:
+            async with self._killed_on_abort(request_params["query_id"], template):
+                response = await stack.enter_async_context(self.client.stream(
+                    "POST",
+                    self.url,
+                    params=request_params,
+                    content=sql,
+                    timeout=self.timeout
+                ))
+                if response.is_error:
+                    await response.aread()
+                self._raise_for_status(response)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                CLICKHOUSE_QUERY_ERRORS.labels(template=template).inc()
+            await stack.aclose()
+            raise
+
+        return ClickHouseStream(self, response, stack, request_params["query_id"], template, result_format, started)
 
     async def ping(self) -> bool:
-        """Check if ClickHouse is accessible"""
+        """Check if ClickHouse is accessible and update the cached health state"""
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.url}/ping")
-                return response.status_code == 200
+            response = await self.client.get(f"{self.url}/ping", timeout=5.0)
+            self._healthy = response.status_code == 200
         except Exception:
-            return False
+            self._healthy = False
+        return self._healthy
 
 
 # Global instance
@@ -0,0 +1,100 @@
+"""
+Request Deadlines
+Per-request deadline for database work and cancellation of requests whose
+client went away
+"""
+import os
+import time
+import asyncio
+from contextvars import ContextVar
+from typing import Optional
+from app.metrics import HTTP_REQUESTS_ABANDONED, route_label
+
+# Deadline of the request being handled (time.monotonic() value)
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a query cannot finish before the request's deadline"""
+
+
+def current_deadline() -> Optional[float]:
+    """Deadline (time.monotonic()) of the request being handled, if any"""
+    return _deadline.get()
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each HTTP request a deadline and cancelling
+    requests whose client disconnected
+
+    The deadline is REQUEST_DEADLINE_SECONDS after arrival, or sooner if the
+    client sends a shorter X-Request-Timeout (seconds). It only bounds
+    database queries (see ClickHouseClient); streaming routes are not cut off.
+
+    Incoming messages are relayed through a queue by a watcher task, so a
+    disconnect is noticed while the handler is still busy. The handler is
+    then cancelled, which aborts its in-flight queries. Disconnects after
+    the response has been fully sent are ignored.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.timeout = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+
+    def _timeout(self, scope) -> float:
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-timeout":
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0:
+                    return min(requested, self.timeout)
+                break
+        return self.timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages: "asyncio.Queue[dict]" = asyncio.Queue()
+        response_sent = False
+        disconnected = False
+
+        async def send_wrapper(message):
+            nonlocal response_sent
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_sent = True
+            await send(message)
+
+        # The handler task copies the context, deadline included
+        token = _deadline.set(time.monotonic() + self._timeout(scope))
+        try:
+            handler = asyncio.create_task(self.app(scope, messages.get, send_wrapper))
+        finally:
+            _deadline.reset(token)
+
+        async def watch():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                messages.put_nowait(message)
+                if message["type"] == "http.disconnect":
+                    if not response_sent and not handler.done():
+                        disconnected = True
+                        HTTP_REQUESTS_ABANDONED.labels(route=route_label(scope)).inc()
+                        handler.cancel()
+                    return
+
+        watcher = asyncio.create_task(watch())
+        try:
+            await handler
+        except asyncio.CancelledError:
+            # Swallow only our own cancellation of an abandoned request
+            if not disconnected or asyncio.current_task().cancelling():
+                handler.cancel()
+                raise
+        finally:
+            watcher.cancel()
@@ -2,31 +2,99 @@
 FastAPI Application
 Handles complex analytics and LangGraph Agent
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import Optional, AsyncGenerator
-from dotenv import load_dotenv
+from typing import Optional, AsyncGenerator, Literal
+from contextlib import AsyncExitStack, asynccontextmanager
 from prometheus_client import make_asgi_app
 import os
 import httpx
 import json
 import asyncio
+from datetime import date
 
 # Import analytics models and services
-from app.models.analytics import TrendResponse, CompareRequest
-from app.services.analytics import analytics_service
+from app.models.analytics import TrendResponse, CompareRequest, CompareResponse
+from app.services.analytics import analytics_service, EXPORT_FORMATS
+from app.services.cache import analytics_cache
+from app.services.admission import analytics_admission, AnalyticsBusyError, query_cost, range_cost
+from app.responses import (
+    AnalyticsJSONResponse, RelayStreamingResponse, columnar_trend,
+    data_etag, etag_matches, cache_headers, not_modified
+)
 from app.database.clickhouse import clickhouse_client
+from app.services.agent import agent_client, AgentBusyError
+from app.services.vessels import vessel_store, parse_bbox
+from app.services.vessel_feed import vessel_feed
+from app.metrics import MetricsMiddleware
+from app.compression import CompressionMiddleware
+from app.deadlines import DeadlineMiddleware, DeadlineExceeded
+
+# Trend results computed at startup for the seeded chokepoints (empty to disable)
+PREWARM_CHOKEPOINTS = [
+    chokepoint.strip()
+    for chokepoint in os.getenv(
+        "PREWARM_CHOKEPOINTS",
+        "suez-canal,strait-of-hormuz,strait-of-malacca,panama-canal,bosporus-strait,bab-el-mandeb"
+    ).split(",")
+    if chokepoint.strip()
+]
+PREWARM_TIMEOUT_SECONDS = float(os.getenv("PREWARM_TIMEOUT_SECONDS", "30"))
+
+# Startup warm-up, see /ready
+warmup_task: Optional[asyncio.Task] = None
+
+
+async def warm_up():
+    """Open ClickHouse connections and load the default trend of each seeded chokepoint into the cache"""
+    await clickhouse_client.prewarm()
+    if not PREWARM_CHOKEPOINTS or not clickhouse_client.is_healthy:
+        return
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(
+                *(load_trend(chokepoint, 5, "month") for chokepoint in PREWARM_CHOKEPOINTS),
+                return_exceptions=True
+            ),
+            timeout=PREWARM_TIMEOUT_SECONDS
+        )
+    except asyncio.TimeoutError:
+        print(f"⚠️  Trend prewarm did not finish within {PREWARM_TIMEOUT_SECONDS:.0f}s")
+
+
+# ClickHouse / agent connection pools, cache and vessel store lifecycle
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global warmup_task
+
+    await clickhouse_client.connect()
+    await analytics_cache.connect()
+    await agent_client.connect()
+    await vessel_store.connect()
+    await vessel_feed.start()
+    # Warm up in the background so /health answers right away
+    warmup_task = asyncio.create_task(warm_up())
+
+    yield
+
+    if not warmup_task.done():
+        warmup_task.cancel()
+    await vessel_feed.stop()
+    await vessel_store.close()
+    await agent_client.close()
+    await analytics_cache.close()
+    await clickhouse_client.close()
 
-# Load environment variables
-load_dotenv()
 
 # Initialize FastAPI
 app = FastAPI(
     title="SeeSea Analytics API",
     description="Complex analytics and AI agent for maritime intelligence",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # CORS
@@ -38,11 +106,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# zstd / br / gzip for buffered responses (inside metrics, so it is timed)
+app.add_middleware(CompressionMiddleware)
+
+# Request latency per route (exported on /metrics)
+app.add_middleware(MetricsMiddleware)
+
+# Request deadlines; cancels requests whose client disconnected (outermost)
+app.add_middleware(DeadlineMiddleware)
+
 # Add prometheus metrics endpoint
 metrics_app = make_asgi_app()
 app.mount("/metrics", metrics_app)
 
-# Health check
+# Health check (liveness: the process is up)
 @app.get("/health")
 async def health_check():
     return {
@@ -51,23 +128,75 @@ async def health_check():
         "version": "2.0.0"
     }
 
+# Readiness check: 503 until warm-up has finished and ClickHouse is reachable.
+# The vessel store (PostgreSQL) is reported but does not gate readiness, so a
+# PostgreSQL outage does not take the analytics routes down with it; the
+# /ships routes answer 503 on their own until the store is loaded.
+@app.get("/ready")
+async def readiness_check():
+    checks = {
+        "warmed_up": warmup_task is not None and warmup_task.done(),
+        "clickhouse": clickhouse_client.is_healthy,
+    }
+    ready = all(checks.values())
+    return JSONResponse(
+        {
+            "status": "ready" if ready else "not_ready",
+            "checks": checks,
+            "vessel_store": "ready" if vessel_store.is_ready else "unavailable",
+        },
+        status_code=200 if ready else 503
+    )
+
 # Root
 @app.get("/")
 async def root():
     return {
         "message": "SeeSea Analytics API",
         "docs": "/docs",
-        "health": "/health"
+        "health": "/health",
+        "ready": "/ready"
     }
 
 # Analytics routes
+def analytics_busy(e: AnalyticsBusyError) -> HTTPException:
+    """429 with Retry-After for a rejected analytics request"""
+    return HTTPException(
+        status_code=429,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+async def load_trend(chokepoint: str, years: int, granularity: str) -> TrendResponse:
+    """
+    Get trend analysis (cached per chokepoint, years, granularity and query day)
+
+    Cache misses go through admission control before querying ClickHouse.
+    """
+    return await analytics_cache.get_or_load(
+        f"trend:{chokepoint}:{years}:{granularity}:{date.today().isoformat()}",
+        lambda: analytics_admission.run(
+            query_cost(years, 1),
+            lambda: analytics_service.get_trend_analysis(chokepoint, years, granularity)
+        ),
+        TrendResponse
+    )
+
 @app.get("/api/v1/analytics/trend", response_model=TrendResponse)
-async def get_trend(chokepoint: str, years: int = 5):
+async def get_trend(
+    http_request: Request,
+    chokepoint: str,
+    years: int = 5,
+    granularity: Literal["day", "week", "month", "quarter"] = "month",
+    format: Literal["rows", "columnar"] = "rows",
+    x_api_key: Optional[str] = Header(None)
+):
     """
     Multi-year trend analysis for a chokepoint
 
-    Returns monthly aggregated vessel data including:
-    - Total vessels per month
+    Returns aggregated vessel data per day, week, month or quarter including:
+    - Total vessels per bucket (every bucket in the range is present;
+      empty ones are zero with has_data = false)
     - Average, peak, and minimum daily vessels
     - Breakdown by vessel type (container, tanker, bulk, etc.)
     - Summary statistics
@@ -75,6 +204,18 @@ async def get_trend(chokepoint: str, years: int = 5):
     Args:
         chokepoint: Chokepoint name (e.g., 'suez-canal', 'panama-canal')
         years: Number of years to analyze (default: 5, max: 10)
+        granularity: Bucket size (default: month); weeks are ISO weeks
+            starting on Monday, and each bucket's `month` is its first day
+        format: 'rows' (array of monthly objects) or 'columnar'
+            (monthly_data as one array per field)
+
+    Returns 429 with Retry-After when the caller (a known X-API-Key, or the
+    client address) is over its rate limit or analytics queries are at capacity.
+
+    Responses carry an ETag derived from the data version (advanced only
+    when an ETL sync changes rows) and the query; a matching If-None-Match
+    is answered with 304 without querying ClickHouse. Responses to a known
+    X-API-Key are private, so nginx does not serve them past the rate limit.
     """
     try:
         # Validate years parameter
@@ -84,99 +225,320 @@ async def get_trend(chokepoint: str, years: int = 5):
                 detail="Years parameter must be between 1 and 10"
             )
 
-        # Check ClickHouse connection
-        if not await clickhouse_client.ping():
+        keyed = analytics_admission.known_key(x_api_key)
+        etag = data_etag(http_request, await analytics_cache.data_version())
+        if etag_matches(http_request, etag):
+            return not_modified(etag, private=keyed)
+
+        # Check ClickHouse connection (cached by background health check)
+        if not clickhouse_client.is_healthy:
             raise HTTPException(
                 status_code=503,
                 detail="Analytics database is unavailable"
             )
 
-        # Get trend analysis
-        result = await analytics_service.get_trend_analysis(chokepoint, years)
-        return result
+        analytics_admission.check_rate(
+            analytics_admission.tenant(x_api_key, http_request.client.host if http_request.client else None),
+            query_cost(years, 1)
+        )
+        result = await load_trend(chokepoint, years, granularity)
+        if format == "columnar":
+            return AnalyticsJSONResponse(columnar_trend(result), headers=cache_headers(etag, private=keyed))
+        return AnalyticsJSONResponse(result, headers=cache_headers(etag, private=keyed))
 
     except HTTPException:
         raise
+    except AnalyticsBusyError as e:
+        raise analytics_busy(e) from e
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error analyzing trend: {str(e)}"
         )
 
-@app.post("/api/v1/analytics/compare")
-async def compare_chokepoints(chokepoints: list[str]):
-    """Compare multiple chokepoints"""
-    return {
-        "chokepoints": chokepoints,
-        "message": "Comparison analysis will be implemented"
-    }
+@app.post("/api/v1/analytics/compare", response_model=CompareResponse)
+async def compare_chokepoints(
+    request: CompareRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    Compare a metric across multiple chokepoints
+
+    Returns monthly series aligned on a shared month axis plus:
+    - Total, average monthly value and share of total per chokepoint
+    - Pairwise correlation of the monthly series
+
+    Args:
+        request: Chokepoints, metric (vessel_count, container, dry_bulk,
+            general_cargo, roro, tanker) and optional start/end dates (YYYY-MM-DD)
+
+    Returns 429 with Retry-After when the caller is over its rate limit or
+    analytics queries are at capacity.
+    """
+    try:
+        # Check ClickHouse connection (cached by background health check)
+        if not clickhouse_client.is_healthy:
+            raise HTTPException(
+                status_code=503,
+                detail="Analytics database is unavailable"
+            )
+
+        cost = range_cost(request.chokepoints, request.start_date, request.end_date)
+        analytics_admission.check_rate(
+            analytics_admission.tenant(x_api_key, http_request.client.host if http_request.client else None),
+            cost
+        )
+
+        chokepoints_key = ",".join(sorted(set(request.chokepoints)))
+        result = await analytics_cache.get_or_load(
+            f"compare:{chokepoints_key}:{request.metric}:{request.start_date}:{request.end_date}:{date.today().isoformat()}",
+            lambda: analytics_admission.run(cost, lambda: analytics_service.compare_chokepoints(request)),
+            CompareResponse
+        )
+        return AnalyticsJSONResponse(result)
+
+    except HTTPException:
+        raise
+    except AnalyticsBusyError as e:
+        raise analytics_busy(e) from e
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error comparing chokepoints: {str(e)}"
+        )
+
+@app.get("/api/v1/analytics/export")
+async def export_arrivals(
+    http_request: Request,
+    chokepoints: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    format: Literal["csv", "parquet", "arrow"] = "csv",
+    x_api_key: Optional[str] = Header(None)
+):
+    """
+    Bulk export of raw daily vessel arrivals
+
+    Rows (date, chokepoint, vessel_count and per-type counts) are streamed
+    from ClickHouse to the client as ClickHouse encodes them, ordered by
+    chokepoint and date, so any range is one transfer with constant memory.
+    If ClickHouse fails mid-stream, the body ends early with its error text.
+
+    Args:
+        chokepoints: Comma-separated chokepoint names
+        start_date: First day (YYYY-MM-DD, default: one year before end_date)
+        end_date: Last day (YYYY-MM-DD, default: today)
+        format: 'csv' (CSVWithNames), 'parquet' or 'arrow' (Arrow IPC
+            stream, in which ClickHouse encodes date as UInt16 days since
+            1970-01-01)
+
+    Returns 429 with Retry-After when the caller is over its rate limit or
+    ANALYTICS_EXPORT_CONCURRENCY exports are already streaming, and 304 for
+    a matching If-None-Match (the ETag follows the data version; nginx does
+    not store exports).
+    """
+    etag = data_etag(http_request, await analytics_cache.data_version())
+    if etag_matches(http_request, etag):
+        return not_modified(etag, shared=False)
+
+    if not clickhouse_client.is_healthy:
+        raise HTTPException(status_code=503, detail="Analytics database is unavailable")
+
+    names = [name.strip() for name in chokepoints.split(",") if name.strip()]
+    stack = AsyncExitStack()
+    try:
+        cost = range_cost(names, start_date, end_date)
+        analytics_admission.check_rate(
+            analytics_admission.tenant(x_api_key, http_request.client.host if http_request.client else None),
+            cost
+        )
+        # The export holds its slot until the stream is closed
+        await stack.enter_async_context(analytics_admission.export_slot())
+        export = await analytics_service.open_export(names, start_date, end_date, format)
+        stack.push_async_callback(export.aclose)
+    except BaseException as e:
+        await stack.aclose()
+        if isinstance(e, AnalyticsBusyError):
+            raise analytics_busy(e) from e
+        if isinstance(e, DeadlineExceeded):
+            raise HTTPException(status_code=504, detail=str(e)) from e
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        if isinstance(e, httpx.HTTPError):
+            raise HTTPException(status_code=500, detail=f"Error exporting arrivals: {str(e)}") from e
+        raise
+
+    _, media_type, extension, _ = EXPORT_FORMATS[format]
+    return RelayStreamingResponse(
+        export,
+        on_close=stack.aclose,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="vessel_arrivals.{extension}"',
+            **cache_headers(etag, shared=False)
+        }
+    )
 
 # Ships/Vessels routes
 @app.get("/api/v1/ships")
-async def get_ships():
-    """Get all ships with real-time positions (mock data for now)"""
-    # TODO: Replace with real data from database
-    ships = [
-        {
-            "id": "1",
-            "mmsi": "477123456",
-            "name": "MAERSK ALPHA",
-            "position": {
-                "lng": 121.5,
-                "lat": 31.2
-            },
-            "destination": "洛杉磯",
-            "cargo": "電子產品",
-            "teu": 8000,
-            "speed": 18.5,
-            "heading": 85,
-            "status": "underway",
-            "eta": "2024-02-15T10:00:00Z"
-        },
-        {
-            "id": "2",
-            "mmsi": "244567890",
-            "name": "EVERGREEN BETA",
-            "position": {
-                "lng": 4.4,
-                "lat": 51.9
-            },
-            "destination": "鹿特丹",
-            "cargo": "汽車零件",
-            "teu": 12000,
-            "speed": 20.2,
-            "heading": 270,
-            "status": "moored",
-            "eta": "2024-02-10T14:30:00Z"
-        },
-        {
-            "id": "3",
-            "mmsi": "412789012",
-            "name": "COSCO GAMMA",
-            "position": {
-                "lng": -118.2,
-                "lat": 33.7
-            },
-            "destination": "上海",
-            "cargo": "原材料",
-            "teu": 14000,
-            "speed": 19.8,
-            "heading": 310,
-            "status": "underway",
-            "eta": "2024-02-20T08:00:00Z"
-        }
-    ]
-    return {
+async def get_ships(
+    bbox: Optional[str] = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Get ships with real-time positions
+
+    Without filters all ships are returned (paginated). Filter either by
+    viewport or by distance from a point:
+    - bbox: min_lng,min_lat,max_lng,max_lat (min_lng > max_lng crosses the antimeridian)
+    - lat, lng, radius_km: ships within radius_km, nearest first, with distance_km
+
+    Args:
+        limit: Page size (default 500, max 5000)
+        offset: Number of ships to skip
+    """
+    if not vessel_store.is_ready:
+        raise HTTPException(status_code=503, detail="Vessel positions are not loaded yet")
+
+    distances = None
+    try:
+        if radius_km is not None:
+            if lat is None or lng is None:
+                raise ValueError("radius_km requires lat and lng")
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius_km <= 20000:
+                raise ValueError("lat, lng or radius_km out of range")
+            rows, distances = vessel_store.within_radius(lat, lng, radius_km)
+        elif bbox is not None:
+            rows = vessel_store.in_bbox(parse_bbox(bbox))
+        else:
+            rows = vessel_store.all_rows()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    page = slice(offset, offset + limit)
+    ships = [vessel_store.ship(row) for row in rows[page].tolist()]
+    if distances is not None:
+        for ship, distance in zip(ships, distances[page].tolist()):
+            ship["distance_km"] = round(distance, 3)
+
+    return AnalyticsJSONResponse({
         "ships": ships,
-        "total": len(ships),
-        "timestamp": "2024-02-07T13:00:00Z"
-    }
+        "total": len(rows),
+        "limit": limit,
+        "offset": offset,
+        "timestamp": vessel_store.updated_at.isoformat() if vessel_store.updated_at else None
+    })
+
+WORLD_BBOX = (-180.0, -90.0, 180.0, 90.0)
+
+@app.websocket("/api/v1/ships/live")
+async def ships_live(websocket: WebSocket, bbox: Optional[str] = None):
+    """
+    Live vessel positions for a bounding box over WebSocket
+
+    The server sends JSON messages: first {"type": "snapshot", "ships": [...]},
+    then {"type": "delta", "entered": [...], "updated": [...], "left": [mmsi...]}
+    at most once per tick (VESSEL_FEED_TICK_SECONDS) when something changed.
+    Send {"bbox": "min_lng,min_lat,max_lng,max_lat"} to move the viewport;
+    a new snapshot follows. The initial bbox query parameter defaults to
+    the whole world.
+    """
+    await websocket.accept()
+    if not vessel_store.is_ready:
+        await websocket.close(code=1013, reason="Vessel positions are not loaded yet")
+        return
+
+    try:
+        initial_bbox = parse_bbox(bbox) if bbox else WORLD_BBOX
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    subscription = vessel_feed.subscribe(initial_bbox)
+
+    async def receive_viewports():
+        try:
+            while True:
+                data = await websocket.receive_json()
+                try:
+                    vessel_feed.update_bbox(subscription, parse_bbox(data["bbox"]))
+                except (KeyError, TypeError, AttributeError, ValueError) as e:
+                    subscription.offer(("error", json.dumps({"type": "error", "error": str(e)}).encode()))
+        except (WebSocketDisconnect, ValueError):
+            pass
+        finally:
+            subscription.close()
+
+    receiver = asyncio.create_task(receive_viewports())
+    try:
+        async for event, payload in subscription:
+            if event != "keepalive":
+                await websocket.send_text(payload.decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        vessel_feed.unsubscribe(subscription)
+
+@app.get("/api/v1/ships/stream")
+async def ships_stream(bbox: Optional[str] = None):
+    """
+    Live vessel positions for a bounding box over Server-Sent Events
+
+    Same messages as the WebSocket endpoint, as `event: snapshot` and
+    `event: delta`; the bbox is fixed for the stream (reconnect to move it).
+    """
+    if not vessel_store.is_ready:
+        raise HTTPException(status_code=503, detail="Vessel positions are not loaded yet")
+
+    try:
+        subscription = vessel_feed.subscribe(parse_bbox(bbox) if bbox else WORLD_BBOX)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def event_stream() -> AsyncGenerator[bytes, None]:
+        async for event, payload in subscription:
+            if event == "keepalive":
+                yield b": keepalive\n\n"
+            else:
+                yield b"event: " + event.encode() + b"\ndata: " + payload + b"\n\n"
+
+    async def unsubscribe():
+        vessel_feed.unsubscribe(subscription)
+
+    return RelayStreamingResponse(
+        event_stream(),
+        on_close=unsubscribe,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
 
+# Registered after /ships/stream so {ship_id} does not capture it
 @app.get("/api/v1/ships/{ship_id}")
 async def get_ship(ship_id: str):
-    """Get specific ship details"""
-    # TODO: Query from database
-    raise HTTPException(status_code=404, detail="Ship not found")
+    """Get specific ship details by MMSI"""
+    if not vessel_store.is_ready:
+        raise HTTPException(status_code=503, detail="Vessel positions are not loaded yet")
+
+    ship = vessel_store.get(ship_id)
+    if ship is None:
+        raise HTTPException(status_code=404, detail="Ship not found")
+    return AnalyticsJSONResponse(ship)
 
 # ============================================================================
 # Request/Response Models
@@ -198,10 +560,6 @@ class ChatResponse(BaseModel):
 # Chat/Agent Routes
 # ============================================================================
 
-# Agent server URL
-AGENT_SERVER_URL = os.getenv("AGENT_SERVER_URL", "http://localhost:8002")
-
-
 @app.post("/api/v1/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     """
@@ -209,21 +567,17 @@ async def chat(request: ChatRequest):
     Proxies request to the AI Agent server
     """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{AGENT_SERVER_URL}/chat",
-                json={
-                    "message": request.message,
-                    "session_id": request.session_id
-                },
-                timeout=60.0
-            )
-            response.raise_for_status()
-            data = response.json()
-            return ChatResponse(
-                response=data.get("response", ""),
-                session_id=data.get("session_id")
-            )
+        data = await agent_client.chat(request.message, request.session_id)
+        return ChatResponse(
+            response=data.get("response", ""),
+            session_id=data.get("session_id")
+        )
+    except AgentBusyError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        ) from e
     except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
@@ -231,6 +585,11 @@ async def chat(request: ChatRequest):
         ) from e
 
 
+def sse_error(message: str) -> bytes:
+    """Encode an SSE error event"""
+    return f"event: error\ndata: {json.dumps({'error': message})}\n\n".encode()
+
+
 @app.post("/api/v1/chat/stream")
 async def chat_stream(request: ChatRequest):
     """
@@ -243,39 +602,43 @@ async def chat_stream(request: ChatRequest):
     - event: content - AI response content (streamed)
     - event: done - Stream complete
     - event: error - Error occurred
+
+    Returns 429 with Retry-After when too many streams are open.
     """
-    async def event_stream() -> AsyncGenerator[str, None]:
-        try:
-            # Connect to agent server SSE stream
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                async with client.stream(
-                    "POST",
-                    f"{AGENT_SERVER_URL}/chat/stream",
-                    json={
-                        "message": request.message,
-                        "session_id": request.session_id
-                    }
-                ) as response:
-                    response.raise_for_status()
-
-                    # Forward SSE events from agent to frontend
-                    async for line in response.aiter_lines():
-                        if line:
-                            yield f"{line}\n"
-                            await asyncio.sleep(0)  # Allow other tasks to run
-                        else:
-                            # Empty line (SSE message separator)
-                            yield "\n"
+    try:
+        # Connect to agent server SSE stream
+        upstream = await agent_client.open_stream(request.message, request.session_id)
+    except AgentBusyError as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        ) from e
+    except httpx.HTTPError as e:
+        upstream = None
+        connect_error = f"Agent connection error: {str(e)}"
 
+    async def event_stream() -> AsyncGenerator[bytes, None]:
+        if upstream is None:
+            yield sse_error(connect_error)
+            return
+
+        try:
+            # Forward SSE bytes from agent to frontend as they arrive
+            async for chunk in upstream:
+                yield chunk
         except httpx.HTTPError as e:
-            yield f"event: error\n"
-            yield f"data: {json.dumps({'error': f'Agent connection error: {str(e)}'})}\n\n"
+            yield sse_error(f"Agent connection error: {str(e)}")
         except Exception as e:
-            yield f"event: error\n"
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield sse_error(str(e))
+
+    async def close_upstream():
+        if upstream is not None:
+            await upstream.aclose()
 
-    return StreamingResponse(
+    return RelayStreamingResponse(
         event_stream(),
+        on_close=close_upstream,
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
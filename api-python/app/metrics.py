@@ -0,0 +1,213 @@
+"""
+Prometheus Metrics
+Request latency middleware and ClickHouse query instrumentation
+"""
+import json
+import time
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+from prometheus_client import Counter, Gauge, Histogram
+
+# Sizes from 1 KiB to ~10 GiB / rows from 10 to 1e9
+BYTE_BUCKETS = tuple(1024 * 4 ** i for i in range(13))
+ROW_BUCKETS = tuple(10 ** i for i in range(1, 10))
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency until the response is fully sent",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_ABANDONED = Counter(
+    "http_requests_abandoned_total",
+    "Requests cancelled because the client disconnected before the response was sent",
+    ["route"],
+)
+RESPONSE_RENDER_DURATION = Histogram(
+    "api_response_render_seconds",
+    "Time spent serializing analytics responses",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+CLICKHOUSE_QUERY_DURATION = Histogram(
+    "clickhouse_query_duration_seconds",
+    "ClickHouse query latency as seen by the API (network + server + transfer)",
+    ["template", "format"],
+)
+CLICKHOUSE_SERVER_ELAPSED = Histogram(
+    "clickhouse_server_elapsed_seconds",
+    "Server-side query time reported in X-ClickHouse-Summary",
+    ["template"],
+)
+CLICKHOUSE_DECODE_DURATION = Histogram(
+    "clickhouse_decode_duration_seconds",
+    "Time spent decoding ClickHouse results in the API",
+    ["template", "format"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+CLICKHOUSE_READ_ROWS = Histogram(
+    "clickhouse_read_rows",
+    "Rows read by ClickHouse per query",
+    ["template"],
+    buckets=ROW_BUCKETS,
+)
+CLICKHOUSE_READ_BYTES = Histogram(
+    "clickhouse_read_bytes",
+    "Bytes read by ClickHouse per query",
+    ["template"],
+    buckets=BYTE_BUCKETS,
+)
+CLICKHOUSE_RESPONSE_BYTES = Histogram(
+    "clickhouse_response_bytes",
+    "Bytes transferred from ClickHouse per query",
+    ["template", "format"],
+    buckets=BYTE_BUCKETS,
+)
+CLICKHOUSE_QUERY_ERRORS = Counter(
+    "clickhouse_query_errors_total",
+    "Failed ClickHouse queries",
+    ["template"],
+)
+CLICKHOUSE_QUERIES_KILLED = Counter(
+    "clickhouse_queries_killed_total",
+    "ClickHouse queries killed because their deadline passed or their request was cancelled",
+    ["template", "reason"],
+)
+
+ANALYTICS_ADMISSION_WAIT = Histogram(
+    "analytics_admission_wait_seconds",
+    "Time analytics queries waited for capacity in their cost lane",
+    ["lane"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+ANALYTICS_INFLIGHT_COST = Gauge(
+    "analytics_inflight_cost",
+    "Estimated cost (years x chokepoints) of analytics queries currently admitted",
+    ["lane"],
+)
+ANALYTICS_EXPORTS_INFLIGHT = Gauge(
+    "analytics_exports_inflight",
+    "Bulk exports currently streaming",
+)
+ANALYTICS_ADMISSION_REJECTED = Counter(
+    "analytics_admission_rejected_total",
+    "Analytics requests rejected with 429 (rate_limited or overloaded)",
+    ["lane", "reason"],
+)
+
+AGENT_ACTIVE_REQUESTS = Gauge(
+    "agent_active_requests",
+    "Chat requests and streams currently open to the agent server",
+)
+AGENT_REJECTED_REQUESTS = Counter(
+    "agent_rejected_requests_total",
+    "Chat requests rejected with 429 because the agent server was at capacity",
+)
+
+VESSEL_FEED_SUBSCRIBERS = Gauge(
+    "vessel_feed_subscribers",
+    "Open live vessel position subscriptions (WebSocket and SSE)",
+)
+
+# Scope of the request being handled, for metrics recorded below the route handler
+_current_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_scope", default=None)
+
+
+def route_label(scope: Optional[Dict[str, Any]]) -> str:
+    """Route template (e.g. /api/v1/analytics/trend), never the raw path"""
+    route = scope.get("route") if scope else None
+    return getattr(route, "path", "unmatched")
+
+
+def current_route() -> str:
+    """Route template of the request being handled"""
+    return route_label(_current_scope.get())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template
+
+    Labelling by route template rather than URL path keeps the label set
+    bounded. Timing covers the whole response, including streamed bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        token = _current_scope.set(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except asyncio.CancelledError:
+            # Client went away before the response was sent (nginx's 499)
+            if status == "500":
+                status = "499"
+            raise
+        finally:
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=route_label(scope),
+                status=status,
+            ).observe(time.perf_counter() - started)
+            _current_scope.reset(token)
+
+
+def parse_clickhouse_summary(header: Optional[str]) -> Dict[str, int]:
+    """Parse an X-ClickHouse-Summary header ({"read_rows":"10",...}) into ints"""
+    if not header:
+        return {}
+    try:
+        return {name: int(value) for name, value in json.loads(header).items()}
+    except (ValueError, TypeError, AttributeError):
+        return {}
+
+
+def observe_clickhouse_query(
+    template: str,
+    result_format: str,
+    duration: float,
+    decode_seconds: float,
+    response_bytes: int,
+    summary_header: Optional[str],
+):
+    """
+    Record one ClickHouse query
+
+    The summary header is sent with the response headers, so for results
+    streamed before the query finishes it can undercount rows and bytes read.
+
+    Args:
+        template: Query template name ("raw" for ad-hoc SQL)
+        result_format: Result format (JSONEachRow, ArrowStream, ...)
+        duration: Seconds from sending the query to the last byte received,
+            excluding time the caller spent between streamed rows
+        decode_seconds: Seconds spent decoding the result
+        response_bytes: Response body size as transferred
+        summary_header: Value of the X-ClickHouse-Summary header
+    """
+    CLICKHOUSE_QUERY_DURATION.labels(template=template, format=result_format).observe(duration)
+    CLICKHOUSE_DECODE_DURATION.labels(template=template, format=result_format).observe(decode_seconds)
+    CLICKHOUSE_RESPONSE_BYTES.labels(template=template, format=result_format).observe(response_bytes)
+
+    summary = parse_clickhouse_summary(summary_header)
+    if "read_rows" in summary:
+        CLICKHOUSE_READ_ROWS.labels(template=template).observe(summary["read_rows"])
+    if "read_bytes" in summary:
+        CLICKHOUSE_READ_BYTES.labels(template=template).observe(summary["read_bytes"])
+    if "elapsed_ns" in summary:
+        CLICKHOUSE_SERVER_ELAPSED.labels(template=template).observe(summary["elapsed_ns"] / 1e9)
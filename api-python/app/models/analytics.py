@@ -2,7 +2,7 @@
 Analytics Data Models
 """
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import date
 
 
@@ -16,13 +16,14 @@ class VesselTypeData(BaseModel):
 
 
 class MonthlyData(BaseModel):
-    """Monthly aggregated data"""
-    month: str  # YYYY-MM format
+    """Aggregated data for one time bucket (a month unless another granularity was requested)"""
+    month: str  # First day of the bucket, YYYY-MM-DD
     total_vessels: int
     avg_vessels: float
     peak_vessels: int
     min_vessels: int
     vessel_types: VesselTypeData
+    has_data: bool = True  # False for empty buckets filled in with zeros
 
 
 class TrendResponse(BaseModel):
@@ -31,6 +32,7 @@ class TrendResponse(BaseModel):
     years: int
     start_date: str
     end_date: str
+    granularity: str = "month"  # day, week (ISO, starting Monday), month or quarter
     monthly_data: List[MonthlyData]
     summary: dict
 
@@ -41,3 +43,21 @@ class CompareRequest(BaseModel):
     metric: str = "vessel_count"
     start_date: Optional[str] = None
     end_date: Optional[str] = None
+
+
+class ChokepointStats(BaseModel):
+    """Per-chokepoint comparison statistics"""
+    total: int
+    average_monthly: float
+    share_of_total: float  # Fraction of the metric total across all chokepoints
+
+
+class CompareResponse(BaseModel):
+    """Compare chokepoints response"""
+    metric: str
+    start_date: str
+    end_date: str
+    months: List[str]
+    series: Dict[str, List[int]]  # Chokepoint -> values aligned with months
+    statistics: Dict[str, ChokepointStats]
+    correlation: Dict[str, Dict[str, Optional[float]]]  # Pearson correlation of monthly series
@@ -0,0 +1,159 @@
+"""
+Fast JSON Responses
+orjson-based responses and HTTP validators for analytics routes
+"""
+import os
+import time
+import hashlib
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, Optional
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from app.models.analytics import TrendResponse, VesselTypeData
+from app.metrics import RESPONSE_RENDER_DURATION, current_route
+
+# Seconds clients and nginx may reuse an analytics response without revalidating
+ANALYTICS_HTTP_MAX_AGE = int(os.getenv("ANALYTICS_HTTP_MAX_AGE", "60"))
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class AnalyticsJSONResponse(JSONResponse):
+    """
+    JSON response rendered by pydantic-core or orjson
+
+    Accepts pre-validated pydantic models, plain dicts and NumPy arrays.
+    A model is serialized by its own (compiled) serializer, which is faster
+    than dumping it to Python objects for orjson; dicts (e.g. the columnar
+    trend) go through orjson. Returning it from a route bypasses FastAPI's
+    response_model validation and jsonable_encoder, so only pass data that
+    is already well-formed.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        if isinstance(content, BaseModel):
+            body = content.model_dump_json().encode()
+        else:
+            body = orjson.dumps(
+                content,
+                default=_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            )
+        RESPONSE_RENDER_DURATION.labels(route=current_route()).observe(time.perf_counter() - started)
+        return body
+
+
+class RelayStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that always runs on_close once the response ends
+
+    Unlike a finally block in the body generator or a background task,
+    on_close also runs when the client disconnects before the first chunk
+    is sent, so upstream resources held for the stream are not leaked.
+    """
+
+    def __init__(self, content: Any, on_close: Callable[[], Awaitable[None]], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.on_close()
+
+
+def data_etag(request: Request, version: Optional[int]) -> Optional[str]:
+    """
+    Weak ETag for a GET analytics response
+
+    Derived from the data version, the route, the query parameters and the
+    current day (default date ranges end today), so it changes exactly when
+    the response could: the ETL only advances the version when a sync
+    changes rows. Weak, since compressed variants differ in bytes. None
+    when the data version is unknown.
+    """
+    if version is None:
+        return None
+    params = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    digest = hashlib.sha1(f"{request.url.path}?{params}|{date.today().isoformat()}".encode()).hexdigest()[:20]
+    return f'W/"{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Whether If-None-Match matches the ETag (weak comparison)"""
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def cache_headers(etag: Optional[str], shared: bool = True, private: bool = False) -> Dict[str, str]:
+    """
+    Validator and Cache-Control headers for an analytics response
+
+    Args:
+        etag: ETag from data_etag(); without one, caches must revalidate
+        shared: Whether the response may be reused without revalidating
+            (False for exports, which clients may still revalidate)
+        private: Keep the response out of nginx (requests with a known API
+            key, so each one reaches the per-tenant rate limit)
+    """
+    if etag is None:
+        return {"Cache-Control": "no-cache"}
+    if not shared:
+        return {"ETag": etag, "Cache-Control": "no-cache"}
+    scope = "private" if private else "public"
+    return {
+        "ETag": etag,
+        "Cache-Control": f"{scope}, max-age={ANALYTICS_HTTP_MAX_AGE}, stale-while-revalidate={ANALYTICS_HTTP_MAX_AGE}",
+    }
+
+
+def not_modified(etag: str, shared: bool = True, private: bool = False) -> Response:
+    """304 response for a matching If-None-Match"""
+    return Response(status_code=304, headers=cache_headers(etag, shared, private))
+
+
+def columnar_trend(trend: TrendResponse) -> Dict[str, Any]:
+    """
+    Convert a TrendResponse to the compact columnar shape
+
+    monthly_data becomes one array per field (and per vessel type) instead
+    of an array of objects; all other fields are unchanged.
+    """
+    monthly = trend.monthly_data
+    return {
+        "chokepoint": trend.chokepoint,
+        "years": trend.years,
+        "start_date": trend.start_date,
+        "end_date": trend.end_date,
+        "granularity": trend.granularity,
+        "monthly_data": {
+            "month": [m.month for m in monthly],
+            "total_vessels": [m.total_vessels for m in monthly],
+            "avg_vessels": [m.avg_vessels for m in monthly],
+            "peak_vessels": [m.peak_vessels for m in monthly],
+            "min_vessels": [m.min_vessels for m in monthly],
+            "has_data": [m.has_data for m in monthly],
+            "vessel_types": {
+                field: [getattr(m.vessel_types, field) for m in monthly]
+                for field in VesselTypeData.model_fields
+            }
+        },
+        "summary": trend.summary
+    }
@@ -0,0 +1,339 @@
+"""
+Analytics Admission Control
+Cost-weighted concurrency limits on ClickHouse analytics queries and
+per-tenant rate limits, shedding load with 429 instead of queueing
+"""
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional, Tuple, TypeVar
+from app.deadlines import current_deadline
+from app.metrics import (
+    ANALYTICS_ADMISSION_REJECTED, ANALYTICS_ADMISSION_WAIT, ANALYTICS_EXPORTS_INFLIGHT, ANALYTICS_INFLIGHT_COST
+)
+
+T = TypeVar("T")
+
+# Weight of the latest hold time in a lane's moving average
+HOLD_TIME_SMOOTHING = 0.2
+
+# Retry-After for exports rejected because every export slot is taken
+EXPORT_RETRY_AFTER_SECONDS = 10
+
+
+class AnalyticsBusyError(Exception):
+    """Raised when an analytics request is rate limited or shed under load"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def query_cost(years: float, chokepoints: int) -> int:
+    """Estimated cost of an analytics query: years scanned x chokepoints"""
+    return max(1, math.ceil(years)) * max(1, chokepoints)
+
+
+def range_cost(chokepoints: List[str], start_date: Optional[str], end_date: Optional[str]) -> int:
+    """
+    Estimated cost of a query over a date range (compare, export), with the
+    services' defaults of one year up to today
+
+    Raises:
+        ValueError: If a date is not YYYY-MM-DD
+    """
+    end = date.fromisoformat(end_date) if end_date else date.today()
+    start = date.fromisoformat(start_date) if start_date else end - timedelta(days=365)
+    years = max(0, (end - start).days) / 365
+    return query_cost(years, len(set(chokepoints)))
+
+
+class TokenBucket:
+    """Bucket of up to `burst` tokens refilled at `rate` tokens per second"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """
+        Take tokens if enough are available
+
+        Requests larger than the bucket are charged a full bucket.
+
+        Returns:
+            0 if the tokens were taken, else seconds until they would be
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        amount = min(amount, self.burst)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class WeightedSemaphore:
+    """
+    Semaphore over `capacity` units where each holder takes a weight
+
+    Waiters are admitted strictly in arrival order, so heavy waiters are
+    not starved by a stream of light ones. Weights above the capacity are
+    capped at it (the holder then runs alone).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    @property
+    def queued(self) -> int:
+        """Units requested by waiters"""
+        return sum(weight for weight, _ in self._waiters)
+
+    def available(self, weight: int) -> bool:
+        """Whether acquire(weight) would succeed without waiting"""
+        return not self._waiters and self.in_use + min(weight, self.capacity) <= self.capacity
+
+    async def acquire(self, weight: int):
+        weight = min(weight, self.capacity)
+        if self.available(weight):
+            self.in_use += weight
+            return
+
+        entry = (weight, asyncio.get_running_loop().create_future())
+        self._waiters.append(entry)
+        try:
+            await entry[1]
+        except BaseException:
+            if entry[1].done() and not entry[1].cancelled():
+                # Granted just as the waiter gave up
+                self.release(weight)
+            else:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                # A large waiter leaving the head may let others in
+                self._wake()
+            raise
+
+    def release(self, weight: int):
+        self.in_use -= min(weight, self.capacity)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters:
+            weight, future = self._waiters[0]
+            if future.cancelled():
+                self._waiters.popleft()
+                continue
+            if self.in_use + weight > self.capacity:
+                break
+            self._waiters.popleft()
+            self.in_use += weight
+            future.set_result(None)
+
+
+class Lane:
+    """A weighted semaphore that estimates its queueing delay from recent hold times"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.slots = WeightedSemaphore(capacity)
+        # Moving average of how long admitted queries hold their units
+        self.hold_seconds = 0.0
+
+    def estimated_wait(self, weight: int) -> float:
+        """Rough seconds until `weight` units would be granted"""
+        if self.slots.available(weight):
+            return 0.0
+        # Units free up at about capacity / hold_seconds per second
+        excess = self.slots.in_use + self.slots.queued + min(weight, self.slots.capacity) - self.slots.capacity
+        return max(excess, 0) * self.hold_seconds / self.slots.capacity
+
+    def observe_hold(self, seconds: float):
+        if self.hold_seconds == 0.0:
+            self.hold_seconds = seconds
+        else:
+            self.hold_seconds += HOLD_TIME_SMOOTHING * (seconds - self.hold_seconds)
+
+
+class AdmissionController:
+    """
+    Admission control for analytics queries
+
+    Each query is weighted by its estimated cost (years x chokepoints).
+    Queries costing less than heavy_cost run in the light lane, the others
+    in the heavy lane; each lane is a weighted semaphore with its own
+    capacity in cost units, so cheap queries keep predictable latency while
+    heavy reports saturate their lane.
+
+    A query waits for capacity in FIFO order for at most queue_budget
+    seconds (or until the request deadline). When the lane's estimated
+    queueing delay already exceeds that budget, it is rejected right away.
+
+    Each tenant also has a token bucket of cost units, checked before the
+    result cache so one tenant cannot monopolize the API. A tenant is a
+    known API key (ANALYTICS_API_KEYS), otherwise the client address as
+    forwarded by the trusted proxy; unknown keys count as their address so
+    made-up keys cannot mint fresh buckets. Rejections raise
+    AnalyticsBusyError with a Retry-After hint.
+
+    Only requests that reach the API are counted. Responses to known keys
+    are marked private and nginx does not cache requests carrying a key,
+    so keyed tenants are always limited. Anonymous responses are public:
+    nginx serves repeats from its cache (and 304s skip the check) without
+    charging the address, which is accepted since those cost no query.
+
+    Bulk exports stream for minutes, so they do not take lane capacity (nor
+    feed the lanes' hold-time estimates); at most export_concurrency of
+    them run at once.
+    """
+
+    def __init__(self):
+        # Cost lanes (capacities in cost units)
+        self.heavy_cost = int(os.getenv("ANALYTICS_HEAVY_COST", "6"))
+        self.light = Lane("light", int(os.getenv("ANALYTICS_LIGHT_CAPACITY", "32")))
+        self.heavy = Lane("heavy", int(os.getenv("ANALYTICS_HEAVY_CAPACITY", "60")))
+        self.queue_budget = float(os.getenv("ANALYTICS_QUEUE_BUDGET_SECONDS", "2"))
+        self.exports = WeightedSemaphore(int(os.getenv("ANALYTICS_EXPORT_CONCURRENCY", "4")))
+
+        # Per-tenant rate limits in cost units (rate 0 disables them)
+        self.tenant_rate = float(os.getenv("ANALYTICS_TENANT_RATE", "10"))
+        self.tenant_burst = float(os.getenv("ANALYTICS_TENANT_BURST", "60"))
+        self.max_tenants = int(os.getenv("ANALYTICS_MAX_TENANTS", "10000"))
+        self.api_keys = frozenset(
+            key.strip() for key in os.getenv("ANALYTICS_API_KEYS", "").split(",") if key.strip()
+        )
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def lane(self, cost: int) -> Lane:
+        return self.heavy if cost >= self.heavy_cost else self.light
+
+    def known_key(self, api_key: Optional[str]) -> bool:
+        """Whether api_key is one of ANALYTICS_API_KEYS"""
+        return bool(api_key) and api_key in self.api_keys
+
+    def tenant(self, api_key: Optional[str], client_host: Optional[str]) -> str:
+        """Rate limit identity: a known API key, else the client address"""
+        if self.known_key(api_key):
+            return f"key:{api_key}"
+        return f"ip:{client_host or 'unknown'}"
+
+    def check_rate(self, tenant: str, cost: int):
+        """
+        Charge a request to its tenant's token bucket
+
+        Raises:
+            AnalyticsBusyError: If the tenant is over its rate limit
+        """
+        if self.tenant_rate <= 0:
+            return
+
+        bucket = self._buckets.get(tenant)
+        if bucket is None:
+            bucket = self._buckets[tenant] = TokenBucket(self.tenant_rate, self.tenant_burst)
+            # Forget the least recently seen tenants (their buckets are full again by now)
+            if len(self._buckets) > self.max_tenants:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(tenant)
+
+        wait = bucket.take(cost)
+        if wait > 0:
+            ANALYTICS_ADMISSION_REJECTED.labels(lane=self.lane(cost).name, reason="rate_limited").inc()
+            raise AnalyticsBusyError(
+                "Analytics rate limit exceeded, please retry later",
+                retry_after=max(1, math.ceil(wait))
+            )
+
+    @asynccontextmanager
+    async def slot(self, cost: int) -> AsyncIterator[None]:
+        """
+        Hold `cost` units of the query's lane
+
+        Raises:
+            AnalyticsBusyError: If no capacity frees up within the queue budget
+        """
+        lane = self.lane(cost)
+        started = time.monotonic()
+
+        if lane.slots.available(cost):
+            await lane.slots.acquire(cost)
+        else:
+            budget = self.queue_budget
+            deadline = current_deadline()
+            if deadline is not None:
+                budget = min(budget, deadline - started)
+
+            estimate = lane.estimated_wait(cost)
+            if estimate > budget:
+                ANALYTICS_ADMISSION_REJECTED.labels(lane=lane.name, reason="overloaded").inc()
+                raise AnalyticsBusyError(
+                    "Analytics queries are at capacity, please retry later",
+                    retry_after=max(1, math.ceil(estimate))
+                )
+
+            try:
+                await asyncio.wait_for(lane.slots.acquire(cost), timeout=budget)
+            except asyncio.TimeoutError:
+                ANALYTICS_ADMISSION_REJECTED.labels(lane=lane.name, reason="overloaded").inc()
+                raise AnalyticsBusyError(
+                    "Analytics queries are at capacity, please retry later",
+                    retry_after=max(1, math.ceil(lane.estimated_wait(cost) or self.queue_budget))
+                ) from None
+
+        admitted = time.monotonic()
+        ANALYTICS_ADMISSION_WAIT.labels(lane=lane.name).observe(admitted - started)
+        ANALYTICS_INFLIGHT_COST.labels(lane=lane.name).inc(cost)
+        try:
+            yield
+        finally:
+            ANALYTICS_INFLIGHT_COST.labels(lane=lane.name).dec(cost)
+            lane.observe_hold(time.monotonic() - admitted)
+            lane.slots.release(cost)
+
+    @asynccontextmanager
+    async def export_slot(self) -> AsyncIterator[None]:
+        """
+        Hold one of the export slots for the duration of an export
+
+        Raises:
+            AnalyticsBusyError: If every export slot is taken
+        """
+        if not self.exports.available(1):
+            ANALYTICS_ADMISSION_REJECTED.labels(lane="export", reason="overloaded").inc()
+            raise AnalyticsBusyError(
+                "Too many exports in progress, please retry later",
+                retry_after=EXPORT_RETRY_AFTER_SECONDS
+            )
+
+        await self.exports.acquire(1)
+        ANALYTICS_EXPORTS_INFLIGHT.inc()
+        try:
+            yield
+        finally:
+            ANALYTICS_EXPORTS_INFLIGHT.dec()
+            self.exports.release(1)
+
+    async def run(self, cost: int, loader: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run a query loader once admitted
+
+        Raises:
+            AnalyticsBusyError: If no capacity frees up within the queue budget
+        """
+        async with self.slot(cost):
+            return await loader()
+
+
+# Global instance
+analytics_admission = AdmissionController()
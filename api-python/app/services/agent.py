@@ -0,0 +1,176 @@
+"""
+Agent Server Client
+Pooled HTTP client for the LangGraph agent server with a cap on
+concurrent upstream requests
+"""
+import os
+import asyncio
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+import httpx
+from app.metrics import AGENT_ACTIVE_REQUESTS, AGENT_REJECTED_REQUESTS
+
+
+class AgentBusyError(Exception):
+    """Raised when no upstream slot frees up in time"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Agent is busy, please retry later")
+        self.retry_after = retry_after
+
+
+class AgentStream:
+    """
+    An open upstream SSE stream holding an upstream slot
+
+    Iterating yields the raw body chunks; aclose() closes the upstream
+    response and releases the slot (safe to call more than once, and
+    needed even if the stream was never iterated).
+    """
+
+    def __init__(self, response: httpx.Response, stack: AsyncExitStack):
+        self._response = response
+        self._stack = stack
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        return self._response.aiter_raw()
+
+    async def aclose(self):
+        await self._stack.aclose()
+
+
+class AgentClient:
+    """
+    Client for the agent server
+
+    One pooled httpx.AsyncClient with keep-alive is shared by all chat
+    requests (connect() at startup, close() at shutdown). At most
+    max_concurrent requests/streams are open upstream at a time; further
+    requests wait in FIFO order (asyncio.Semaphore wakes waiters in
+    arrival order) for up to queue_timeout seconds, and are rejected
+    immediately when max_queued requests are already waiting.
+    """
+
+    def __init__(self):
+        self.url = os.getenv("AGENT_SERVER_URL", "http://localhost:8002")
+
+        # Upstream concurrency and queueing
+        self.max_concurrent = int(os.getenv("AGENT_MAX_CONCURRENT", "32"))
+        self.max_queued = int(os.getenv("AGENT_MAX_QUEUED", "64"))
+        self.queue_timeout = float(os.getenv("AGENT_QUEUE_TIMEOUT", "5"))
+
+        # Connection pool settings
+        self.max_keepalive_connections = int(os.getenv("AGENT_MAX_KEEPALIVE_CONNECTIONS", "16"))
+        self.keepalive_expiry = float(os.getenv("AGENT_KEEPALIVE_EXPIRY", "30"))
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots = asyncio.Semaphore(self.max_concurrent)
+        self._queued = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled HTTP client (created lazily if connect() was not called)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.url,
+                timeout=60.0,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrent,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return self._client
+
+    async def connect(self):
+        """Open the connection pool"""
+        # The pool is created on first access
+        self.client
+
+    async def close(self):
+        """Close all pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one upstream slot
+
+        Raises:
+            AgentBusyError: If the queue is full or no slot frees up in time
+        """
+        if self._slots.locked():
+            if self._queued >= self.max_queued:
+                AGENT_REJECTED_REQUESTS.inc()
+                raise AgentBusyError(retry_after=max(1, round(self.queue_timeout)))
+
+            self._queued += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                AGENT_REJECTED_REQUESTS.inc()
+                raise AgentBusyError(retry_after=max(1, round(self.queue_timeout))) from None
+            finally:
+                self._queued -= 1
+        else:
+            await self._slots.acquire()
+
+        AGENT_ACTIVE_REQUESTS.inc()
+        try:
+            yield
+        finally:
+            AGENT_ACTIVE_REQUESTS.dec()
+            self._slots.release()
+
+    async def chat(self, message: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Send a chat message and wait for the full response
+
+        Raises:
+            AgentBusyError: If no upstream slot is available
+            httpx.HTTPError: On upstream errors
+        """
+        async with self.slot():
+            response = await self.client.post(
+                "/chat",
+                json={"message": message, "session_id": session_id},
+                timeout=60.0
+            )
+            response.raise_for_status()
+            return response.json()
+
+    async def open_stream(self, message: str, session_id: Optional[str] = None) -> AgentStream:
+        """
+        Start an SSE chat stream
+
+        The slot is taken and the upstream response opened before this
+        returns, so callers can still answer with an error status. The
+        caller must aclose() the returned stream.
+
+        Raises:
+            AgentBusyError: If no upstream slot is available
+            httpx.HTTPError: If the stream cannot be opened
+        """
+        stack = AsyncExitStack()
+        try:
+            await stack.enter_async_context(self.slot())
+            response = await stack.enter_async_context(self.client.stream(
+                "POST",
+                "/chat/stream",
+                json={"message": message, "session_id": session_id},
+                # Raw chunks are relayed as-is, so they must not be compressed
+                headers={"Accept-Encoding": "identity"},
+                timeout=120.0
+            ))
+            response.raise_for_status()
+        except BaseException:
+            await stack.aclose()
+            raise
+
+        return AgentStream(response, stack)
+
+
+# Global instance
+agent_client = AgentClient()
@@ -2,97 +2,498 @@
 Analytics Service
 Handles complex analytics queries from ClickHouse
 """
-from typing import List, Dict, Any
-from datetime import datetime, timedelta
-from app.database.clickhouse import clickhouse_client
-from app.models.analytics import MonthlyData, VesselTypeData, TrendResponse
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import date, datetime, timedelta
+import numpy as np
+from app.database.clickhouse import clickhouse_client, ClickHouseStream, as_dates
+from app.database.query_builder import QueryTemplate
+from app.models.analytics import (
+    TrendResponse,
+    CompareRequest, CompareResponse, ChokepointStats
+)
+
+# Comparable metrics: raw column -> monthly_summary rollup column
+METRIC_COLUMNS = {
+    "vessel_count": ("vessel_count", "total_vessels"),
+    "container": ("container", "total_containers"),
+    "dry_bulk": ("dry_bulk", "total_dry_bulk"),
+    "general_cargo": ("general_cargo", "total_general_cargo"),
+    "roro": ("roro", "total_roro"),
+    "tanker": ("tanker", "total_tankers"),
+}
+
+MAX_COMPARE_CHOKEPOINTS = 20
+MAX_EXPORT_CHOKEPOINTS = 50
+
+# Export format -> (ClickHouse output format, media type, file extension, format settings)
+EXPORT_FORMATS = {
+    "csv": ("CSVWithNames", "text/csv; charset=utf-8", "csv", {}),
+    "parquet": ("Parquet", "application/vnd.apache.parquet", "parquet", {
+        "output_format_parquet_string_as_string": "1",
+        "output_format_parquet_compression_method": "zstd",
+    }),
+    "arrow": ("ArrowStream", "application/vnd.apache.arrow.stream", "arrows", {
+        "output_format_arrow_string_as_string": "1",
+    }),
+}
+
+# VesselTypeData field -> trend query column
+VESSEL_TYPE_COLUMNS = {
+    "container": "total_containers",
+    "dry_bulk": "total_dry_bulk",
+    "general_cargo": "total_general_cargo",
+    "roro": "total_roro",
+    "tanker": "total_tankers",
+}
+
+# Trend granularity -> (rollup table, rollup bucket column, bucket function, fill step).
+# Quarters merge the monthly rollup's aggregate states; days read raw rows only.
+GRANULARITIES = {
+    "day": (None, None, "toDate", "INTERVAL 1 DAY"),
+    "week": ("weekly_summary", "week", "toMonday", "INTERVAL 1 WEEK"),
+    "month": ("monthly_summary", "month", "toStartOfMonth", "INTERVAL 1 MONTH"),
+    "quarter": ("monthly_summary", "month", "toStartOfQuarter", "INTERVAL 1 QUARTER"),
+}
+
+
+def _trend_query(granularity: str) -> QueryTemplate:
+    """
+    Build the trend query for a granularity
+
+    Whole rollup periods ([rollup_start, rollup_end)) come from the rollup
+    table, the partial first period and the current one from raw rows
+    (FINAL collapses rows re-synced into the ReplacingMergeTree that have
+    not been merged yet). Both branches produce aggregate states that are
+    merged per bucket, so a bucket may combine rollup and raw rows. WITH
+    FILL adds empty buckets (has_data = 0) so the series is dense.
+    """
+    rollup_table, rollup_column, bucket, step = GRANULARITIES[granularity]
+
+    rollup_branch = ""
+    if rollup_table is not None:
+        rollup_branch = f"""SELECT
+            {bucket}({rollup_column}) as bucket,
+            sum(total_vessels) as total_vessels,
+            avgMergeState(avg_vessels) as avg_state,
+            maxMergeState(peak_vessels) as peak_state,
+            minMergeState(min_vessels) as min_state,
+            sum(total_containers) as total_containers,
+            sum(total_dry_bulk) as total_dry_bulk,
+            sum(total_general_cargo) as total_general_cargo,
+            sum(total_roro) as total_roro,
+            sum(total_tankers) as total_tankers
+        FROM {rollup_table}
+        WHERE chokepoint = {{chokepoint:String}}
+          AND {rollup_column} >= {{rollup_start:Date}}
+          AND {rollup_column} < {{rollup_end:Date}}
+        GROUP BY bucket
+
+        UNION ALL
+"""
+
+    return QueryTemplate(f"trend_{granularity}", f"""
+    SELECT
+        bucket,
+        sum(total_vessels) as total_vessels,
+        avgMerge(avg_state) as avg_vessels,
+        maxMerge(peak_state) as peak_vessels,
+        minMerge(min_state) as min_vessels,
+        sum(total_containers) as total_containers,
+        sum(total_dry_bulk) as total_dry_bulk,
+        sum(total_general_cargo) as total_general_cargo,
+        sum(total_roro) as total_roro,
+        sum(total_tankers) as total_tankers,
+        toUInt8(1) as has_data
+    FROM (
+        {rollup_branch}
+        SELECT
+            {bucket}(date) as bucket,
+            sum(toUInt64(vessel_count)) as total_vessels,
+            avgState(vessel_count) as avg_state,
+            maxState(vessel_count) as peak_state,
+            minState(vessel_count) as min_state,
+            sum(toUInt64(container)) as total_containers,
+            sum(toUInt64(dry_bulk)) as total_dry_bulk,
+            sum(toUInt64(general_cargo)) as total_general_cargo,
+            sum(toUInt64(roro)) as total_roro,
+            sum(toUInt64(tanker)) as total_tankers
+        FROM vessel_arrivals_analytics FINAL
+        WHERE chokepoint = {{chokepoint:String}}
+          AND ((date >= {{start_date:Date}} AND date < {{rollup_start:Date}})
+            OR (date >= {{rollup_end:Date}} AND date <= {{end_date:Date}}))
+        GROUP BY bucket
+    )
+    GROUP BY bucket
+    ORDER BY bucket WITH FILL FROM {{fill_start:Date}} TO {{fill_end:Date}} STEP {step}
+""")
+
+
+TREND_QUERIES = {granularity: _trend_query(granularity) for granularity in GRANULARITIES}
+
+# Monthly metric per chokepoint for comparisons, routed like the monthly trend query.
+# Metric columns are bound as identifiers from the METRIC_COLUMNS whitelist.
+COMPARE_MONTHLY_QUERY = QueryTemplate("compare_monthly", """
+    SELECT *
+    FROM (
+        SELECT
+            chokepoint,
+            month,
+            sum({rollup_column:Identifier}) as value
+        FROM monthly_summary
+        WHERE chokepoint IN {chokepoints:Array(String)}
+          AND month >= {rollup_start:Date}
+          AND month < {rollup_end:Date}
+        GROUP BY chokepoint, month
+
+        UNION ALL
+
+        SELECT
+            chokepoint,
+            toStartOfMonth(date) as month,
+            sum(toUInt64({raw_column:Identifier})) as value
+        FROM vessel_arrivals_analytics FINAL
+        WHERE chokepoint IN {chokepoints:Array(String)}
+          AND ((date >= {start_date:Date} AND date < {rollup_start:Date})
+            OR (date >= {rollup_end:Date} AND date <= {end_date:Date}))
+        GROUP BY chokepoint, month
+    )
+    ORDER BY month
+""")
+
+# Raw daily rows in sorting key order, so ClickHouse streams them as it reads
+EXPORT_QUERY = QueryTemplate("export_arrivals", """
+    SELECT
+        date,
+        chokepoint,
+        vessel_count,
+        container,
+        dry_bulk,
+        general_cargo,
+        roro,
+        tanker
+    FROM vessel_arrivals_analytics FINAL
+    WHERE chokepoint IN {chokepoints:Array(String)}
+      AND date >= {start_date:Date}
+      AND date <= {end_date:Date}
+    ORDER BY chokepoint, date
+""")
 
 
 class AnalyticsService:
     """Analytics service for trend analysis"""
 
     @staticmethod
-    async def get_trend_analysis(chokepoint: str, years: int = 5) -> TrendResponse:
+    async def get_trend_analysis(chokepoint: str, years: int = 5, granularity: str = "month") -> TrendResponse:
         """
         Get multi-year trend analysis for a chokepoint
 
         Args:
             chokepoint: Chokepoint name
             years: Number of years to analyze
+            granularity: Bucket size: day, week (ISO, starting Monday),
+                month or quarter
 
         Returns:
-            TrendResponse with monthly aggregated data
+            TrendResponse with one entry per bucket, including empty buckets
+
+        Raises:
+            ValueError: If the granularity is not supported
         """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity '{granularity}'. Choose from: {', '.join(GRANULARITIES)}")
+
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=years * 365)
 
-        # Query monthly summary from ClickHouse
-        query = f"""
-        SELECT
-            toStartOfMonth(date) as month,
-            sum(vessel_count) as total_vessels,
-            avg(vessel_count) as avg_vessels,
-            max(vessel_count) as peak_vessels,
-            min(vessel_count) as min_vessels,
-            sum(container) as total_containers,
-            sum(dry_bulk) as total_dry_bulk,
-            sum(general_cargo) as total_general_cargo,
-            sum(roro) as total_roro,
-            sum(tanker) as total_tankers
-        FROM vessel_arrivals_analytics
-        WHERE chokepoint = '{chokepoint}'
-          AND date >= '{start_date.strftime('%Y-%m-%d')}'
-          AND date <= '{end_date.strftime('%Y-%m-%d')}'
-        GROUP BY month
-        ORDER BY month
-        """
+        # Whole rollup periods come from the rollup, see _trend_query
+        rollup_start, rollup_end = AnalyticsService._trend_rollup_range(
+            start_date.date(), end_date.date(), granularity
+        )
 
-        results = await clickhouse_client.execute_query(query)
-
-        # Transform results to response model
-        monthly_data = []
-        total_vessels_sum = 0
-        total_months = len(results)
-
-        for row in results:
-            vessel_types = VesselTypeData(
-                container=int(row.get('total_containers', 0)),
-                dry_bulk=int(row.get('total_dry_bulk', 0)),
-                general_cargo=int(row.get('total_general_cargo', 0)),
-                roro=int(row.get('total_roro', 0)),
-                tanker=int(row.get('total_tankers', 0))
-            )
-
-            monthly = MonthlyData(
-                month=row['month'],
-                total_vessels=int(row['total_vessels']),
-                avg_vessels=round(float(row['avg_vessels']), 2),
-                peak_vessels=int(row['peak_vessels']),
-                min_vessels=int(row['min_vessels']),
-                vessel_types=vessel_types
-            )
-            monthly_data.append(monthly)
-            total_vessels_sum += monthly.total_vessels
-
-        # Calculate summary statistics
-        summary = {
-            "total_vessels": total_vessels_sum,
-            "average_monthly_vessels": round(total_vessels_sum / total_months, 2) if total_months > 0 else 0,
-            "months_analyzed": total_months,
-            "peak_month": max(monthly_data, key=lambda x: x.total_vessels).month if monthly_data else None,
-            "lowest_month": min(monthly_data, key=lambda x: x.total_vessels).month if monthly_data else None
+        # Buckets from the one containing start_date up to the one containing end_date
+        fill_start = _bucket_start(start_date.date(), granularity)
+        fill_end = _next_bucket(_bucket_start(end_date.date(), granularity), granularity)
+
+        query = TREND_QUERIES[granularity].bind(
+            chokepoint=chokepoint,
+            start_date=start_date.date(),
+            end_date=end_date.date(),
+            rollup_start=rollup_start,
+            rollup_end=rollup_end,
+            fill_start=fill_start,
+            fill_end=fill_end
+        )
+
+        columns = await clickhouse_client.query_columns(query)
+
+        buckets = _date_column(columns, 'bucket')
+        total_vessels = _column(columns, 'total_vessels', np.int64)
+        avg_vessels = np.round(_column(columns, 'avg_vessels', np.float64), 2)
+        peak_vessels = _column(columns, 'peak_vessels', np.int64)
+        min_vessels = _column(columns, 'min_vessels', np.int64)
+        has_data = _column(columns, 'has_data', bool)
+        vessel_types = {
+            field: _column(columns, column, np.int64).tolist()
+            for field, column in VESSEL_TYPE_COLUMNS.items()
         }
 
+        # Plain dicts, validated in one pass when TrendResponse is built
+        monthly_data = [
+            {
+                "month": bucket,
+                "total_vessels": total,
+                "avg_vessels": avg,
+                "peak_vessels": peak,
+                "min_vessels": low,
+                "vessel_types": {field: values[i] for field, values in vessel_types.items()},
+                "has_data": filled,
+            }
+            for i, (bucket, total, avg, peak, low, filled) in enumerate(zip(
+                buckets.tolist(), total_vessels.tolist(), avg_vessels.tolist(),
+                peak_vessels.tolist(), min_vessels.tolist(), has_data.tolist()
+            ))
+        ]
+
+        summary = AnalyticsService._trend_summary(buckets, total_vessels, has_data)
+
         return TrendResponse(
             chokepoint=chokepoint,
             years=years,
             start_date=start_date.strftime('%Y-%m-%d'),
             end_date=end_date.strftime('%Y-%m-%d'),
+            granularity=granularity,
             monthly_data=monthly_data,
             summary=summary
         )
 
+    @staticmethod
+    def _trend_summary(buckets: np.ndarray, total_vessels: np.ndarray, has_data: np.ndarray) -> Dict[str, Any]:
+        """Summary statistics of a trend, over the buckets that have data"""
+        data_buckets = buckets[has_data]
+        data_totals = total_vessels[has_data]
+        total_months = len(data_totals)
+        total_vessels_sum = int(data_totals.sum())
+        return {
+            "total_vessels": total_vessels_sum,
+            "average_monthly_vessels": round(total_vessels_sum / total_months, 2) if total_months > 0 else 0,
+            "months_analyzed": total_months,
+            "peak_month": str(data_buckets[data_totals.argmax()]) if total_months > 0 else None,
+            "lowest_month": str(data_buckets[data_totals.argmin()]) if total_months > 0 else None
+        }
+
+    @staticmethod
+    async def compare_chokepoints(request: CompareRequest) -> CompareResponse:
+        """
+        Compare a metric across multiple chokepoints
+
+        All chokepoints are fetched in a single query and aligned on a common
+        month axis; totals, shares and correlations are computed over the
+        resulting matrix in one NumPy pass.
+
+        Args:
+            request: Chokepoints, metric and optional date range (YYYY-MM-DD)
+
+        Returns:
+            CompareResponse with aligned monthly series and statistics
+
+        Raises:
+            ValueError: If the metric, chokepoints or dates are invalid
+        """
+        if request.metric not in METRIC_COLUMNS:
+            raise ValueError(f"Unsupported metric '{request.metric}'. Choose from: {', '.join(METRIC_COLUMNS)}")
+
+        chokepoints = list(dict.fromkeys(request.chokepoints))
+        if not chokepoints:
+            raise ValueError("At least one chokepoint is required")
+        if len(chokepoints) > MAX_COMPARE_CHOKEPOINTS:
+            raise ValueError(f"At most {MAX_COMPARE_CHOKEPOINTS} chokepoints can be compared")
+
+        end_date = date.fromisoformat(request.end_date) if request.end_date else date.today()
+        start_date = date.fromisoformat(request.start_date) if request.start_date else end_date - timedelta(days=365)
+        if start_date > end_date:
+            raise ValueError("start_date must not be after end_date")
+
+        raw_column, rollup_column = METRIC_COLUMNS[request.metric]
+        rollup_start, rollup_end = AnalyticsService._rollup_range(start_date, end_date)
+
+        query = COMPARE_MONTHLY_QUERY.bind(
+            chokepoints=chokepoints,
+            raw_column=raw_column,
+            rollup_column=rollup_column,
+            start_date=start_date,
+            end_date=end_date,
+            rollup_start=rollup_start,
+            rollup_end=rollup_end
+        )
+
+        columns = await clickhouse_client.query_columns(query)
+        row_chokepoints = _column(columns, 'chokepoint', str)
+        row_months = _date_column(columns, 'month')
+        values = _column(columns, 'value', np.int64)
+
+        # Align every chokepoint on a shared month axis (missing months are 0)
+        months, month_positions = np.unique(row_months, return_inverse=True)
+        chokepoint_index = {chokepoint: i for i, chokepoint in enumerate(chokepoints)}
+        chokepoint_positions = np.array([chokepoint_index[c] for c in row_chokepoints.tolist()], dtype=np.int64)
+
+        matrix = np.zeros((len(chokepoints), len(months)), dtype=np.int64)
+        matrix[chokepoint_positions, month_positions] = values
+        months = months.tolist()
+
+        totals = matrix.sum(axis=1)
+        grand_total = totals.sum()
+        shares = totals / grand_total if grand_total > 0 else np.zeros(len(chokepoints))
+        averages = matrix.mean(axis=1) if months else np.zeros(len(chokepoints))
+
+        # Constant series have no defined correlation; report them as null
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = np.corrcoef(matrix) if len(months) > 1 else np.full((len(chokepoints), len(chokepoints)), np.nan)
+        correlation = np.atleast_2d(correlation)
+
+        return CompareResponse(
+            metric=request.metric,
+            start_date=start_date.isoformat(),
+            end_date=end_date.isoformat(),
+            months=months,
+            series={c: matrix[i].tolist() for c, i in chokepoint_index.items()},
+            statistics={
+                c: ChokepointStats(
+                    total=int(totals[i]),
+                    average_monthly=round(float(averages[i]), 2),
+                    share_of_total=round(float(shares[i]), 4)
+                )
+                for c, i in chokepoint_index.items()
+            },
+            correlation={
+                a: {
+                    b: None if np.isnan(correlation[i, j]) else round(float(correlation[i, j]), 4)
+                    for b, j in chokepoint_index.items()
+                }
+                for a, i in chokepoint_index.items()
+            }
+        )
+
+    @staticmethod
+    async def open_export(
+        chokepoints: List[str],
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        export_format: str = "csv"
+    ) -> ClickHouseStream:
+        """
+        Start streaming raw daily vessel arrivals
+
+        Rows come straight from ClickHouse in the export format and are
+        relayed without being decoded, so memory use does not depend on
+        the size of the range. The caller must aclose() the stream.
+
+        Args:
+            chokepoints: Chokepoint names
+            start_date: First day (YYYY-MM-DD, default: one year before end_date)
+            end_date: Last day (YYYY-MM-DD, default: today)
+            export_format: csv, parquet or arrow (see EXPORT_FORMATS)
+
+        Returns:
+            Open ClickHouseStream of the encoded rows
+
+        Raises:
+            ValueError: If the format, chokepoints or dates are invalid
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported format '{export_format}'. Choose from: {', '.join(EXPORT_FORMATS)}")
+
+        chokepoints = list(dict.fromkeys(chokepoints))
+        if not chokepoints:
+            raise ValueError("At least one chokepoint is required")
+        if len(chokepoints) > MAX_EXPORT_CHOKEPOINTS:
+            raise ValueError(f"At most {MAX_EXPORT_CHOKEPOINTS} chokepoints can be exported at once")
+
+        end = date.fromisoformat(end_date) if end_date else date.today()
+        start = date.fromisoformat(start_date) if start_date else end - timedelta(days=365)
+        if start > end:
+            raise ValueError("start_date must not be after end_date")
+
+        result_format, _, _, settings = EXPORT_FORMATS[export_format]
+        return await clickhouse_client.open_stream(
+            EXPORT_QUERY.bind(chokepoints=chokepoints, start_date=start, end_date=end),
+            result_format,
+            settings=settings
+        )
+
+    @staticmethod
+    def _rollup_range(start: date, end: date) -> Tuple[date, date]:
+        """
+        Get the [start, end) range of whole months that can be read from the rollup
+
+        The month containing `start` is only covered if `start` is its first
+        day; the month containing `end` is never covered since it may still
+        receive rows. Without a whole month in between the range is empty
+        (start, start), so the raw branch reads exactly [start, end].
+        """
+        rollup_end = end.replace(day=1)
+        if start.day == 1:
+            rollup_start = start
+        else:
+            rollup_start = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        if rollup_start >= rollup_end:
+            return start, start
+        return rollup_start, rollup_end
+
+    @staticmethod
+    def _trend_rollup_range(start: date, end: date, granularity: str) -> Tuple[date, date]:
+        """
+        Get the [start, end) range that a trend query reads from its rollup
+
+        Weeks follow the same rules as months in _rollup_range; quarters are
+        merged from the monthly rollup. Days have no rollup, so the range is
+        empty and everything is read from raw rows.
+        """
+        if granularity == "day":
+            return start, start
+        if granularity == "week":
+            rollup_end = _bucket_start(end, "week")
+            rollup_start = start if start.weekday() == 0 else _next_bucket(_bucket_start(start, "week"), "week")
+            if rollup_start >= rollup_end:
+                return start, start
+            return rollup_start, rollup_end
+        return AnalyticsService._rollup_range(start, end)
+
+
+def _bucket_start(day: date, granularity: str) -> date:
+    """First day of the bucket containing `day` (matches the SQL bucket functions)"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "quarter":
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day
+
+
+def _next_bucket(bucket: date, granularity: str) -> date:
+    """First day of the bucket after the one starting on `bucket`"""
+    if granularity == "week":
+        return bucket + timedelta(days=7)
+    if granularity in ("month", "quarter"):
+        months = bucket.year * 12 + bucket.month - 1 + (3 if granularity == "quarter" else 1)
+        return date(months // 12, months % 12 + 1, 1)
+    return bucket + timedelta(days=1)
+
+
+def _column(columns: Dict[str, np.ndarray], name: str, dtype: Any) -> np.ndarray:
+    """Get a result column as an array of dtype (empty if the result had no rows)"""
+    if name not in columns:
+        return np.array([], dtype=dtype)
+    return columns[name].astype(dtype, copy=False)
+
+
+def _date_column(columns: Dict[str, np.ndarray], name: str) -> np.ndarray:
+    """Get a Date result column as YYYY-MM-DD strings"""
+    if name not in columns:
+        return np.array([], dtype=str)
+    return as_dates(columns[name]).astype(str)
+
 
 # Global service instance
 analytics_service = AnalyticsService()
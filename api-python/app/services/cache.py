@@ -0,0 +1,227 @@
+"""
+Analytics Result Cache
+Two-tier cache (in-process LRU + optional Redis) with single-flight loading
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable, Awaitable, Type, TypeVar
+from pydantic import BaseModel
+
+T = TypeVar("T", bound=BaseModel)
+
+# Redis key bumped by the ETL jobs after every ClickHouse sync
+GENERATION_KEY = "seesea:analytics:generation"
+KEY_PREFIX = "seesea:analytics:cache"
+
+
+class LRUCache:
+    """In-process LRU cache bounded by total payload bytes, with per-entry TTL"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self._entries: "OrderedDict[str, tuple[Any, int, float]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        value, size, expires_at = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int):
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self.current_bytes += size
+
+        # Evict least recently used entries until we are within budget
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AnalyticsCache:
+    """
+    Cache for analytics responses
+
+    Lookups go local LRU -> Redis -> loader. Concurrent misses for the same
+    key share one loader call. Cache keys include a generation number stored
+    in Redis, which the ETL bumps after syncing ClickHouse; a changed
+    generation invalidates every cached entry across all API processes.
+    """
+
+    def __init__(self):
+        self.redis_url = os.getenv("REDIS_URL")
+        self.ttl = float(os.getenv("ANALYTICS_CACHE_TTL", "21600"))
+        self.max_bytes = int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        # Seconds between checks of the Redis generation key
+        self.generation_check_interval = float(os.getenv("ANALYTICS_CACHE_GENERATION_CHECK_INTERVAL", "5"))
+
+        self.local = LRUCache(self.max_bytes, self.ttl)
+        self._redis = None
+        self._generation = 0
+        self._generation_checked_at = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def connect(self):
+        """Connect the Redis tier if REDIS_URL is configured"""
+        if not self.redis_url:
+            return
+
+        try:
+            import redis.asyncio as redis
+
+            client = redis.from_url(self.redis_url)
+            await client.ping()
+            self._redis = client
+        except Exception as e:
+            print(f"⚠️  Redis cache tier disabled: {str(e)}")
+            self._redis = None
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[T]], model: Type[T]) -> T:
+        """
+        Return a cached value, or load, cache and return it
+
+        Args:
+            key: Cache key (without generation prefix)
+            loader: Coroutine function producing the value on a miss
+            model: Pydantic model used to decode values from Redis
+
+        Returns:
+            Cached or freshly loaded value
+        """
+        full_key = f"{KEY_PREFIX}:{await self._current_generation()}:{key}"
+
+        value = self.local.get(full_key)
+        if value is not None:
+            return value
+
+        # Single-flight: join an in-progress load for the same key. If its
+        # request is cancelled (client gone), the load is retried here.
+        inflight = self._inflight.get(full_key)
+        while inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+            inflight = self._inflight.get(full_key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await self._load(full_key, loader, model)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so the loop doesn't warn when nobody was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(full_key, None)
+
+    async def data_version(self) -> Optional[int]:
+        """
+        Version of the analytics data in ClickHouse
+
+        This is the cache generation, which the ETL bumps after every sync
+        that changed data. Without Redis there is no shared version, so
+        None is returned (the data may change without notice).
+        """
+        if self._redis is None:
+            return None
+        return await self._current_generation()
+
+    async def invalidate(self):
+        """Drop all cached entries in this process and, via Redis, in every other"""
+        self.local.clear()
+        if self._redis is not None:
+            try:
+                self._generation = int(await self._redis.incr(GENERATION_KEY))
+            except Exception as e:
+                print(f"⚠️  Redis cache invalidation failed: {str(e)}")
+
+    async def _load(self, full_key: str, loader: Callable[[], Awaitable[T]], model: Type[T]) -> T:
+        payload = await self._redis_get(full_key)
+        if payload is not None:
+            value = model.model_validate_json(payload)
+        else:
+            value = await loader()
+            payload = value.model_dump_json().encode()
+            await self._redis_set(full_key, payload)
+
+        self.local.set(full_key, value, len(payload))
+        return value
+
+    async def _current_generation(self) -> int:
+        if self._redis is None:
+            return self._generation
+
+        now = time.monotonic()
+        if now - self._generation_checked_at < self.generation_check_interval:
+            return self._generation
+
+        self._generation_checked_at = now
+        try:
+            generation = int(await self._redis.get(GENERATION_KEY) or 0)
+        except Exception:
+            return self._generation
+
+        if generation != self._generation:
+            self.local.clear()
+            self._generation = generation
+        return self._generation
+
+    async def _redis_get(self, key: str) -> Optional[bytes]:
+        if self._redis is None:
+            return None
+        try:
+            return await self._redis.get(key)
+        except Exception:
+            return None
+
+    async def _redis_set(self, key: str, payload: bytes):
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(key, payload, ex=int(self.ttl))
+        except Exception:
+            pass
+
+
+# Global cache instance
+analytics_cache = AnalyticsCache()
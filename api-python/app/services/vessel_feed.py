@@ -0,0 +1,219 @@
+"""
+Live Vessel Feed
+Pushes vessel position deltas for subscribed bounding boxes, computed once
+per tick by a single shared producer
+"""
+import os
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+import orjson
+from app.metrics import VESSEL_FEED_SUBSCRIBERS
+from app.services.vessels import BBox, VesselStore, vessel_store
+
+# (event, JSON payload)
+Message = Tuple[str, bytes]
+
+_RESYNC: Message = ("resync", b"")
+_CLOSED: Message = ("closed", b"")
+
+
+class _Group:
+    """Subscribers sharing one bounding box, and the rows currently visible in it"""
+
+    def __init__(self, bbox: BBox, visible: Set[int]):
+        self.bbox = bbox
+        self.visible = visible
+        self.subscribers: Set["Subscription"] = set()
+
+
+class Subscription:
+    """
+    One client's subscription
+
+    Iterate to receive (event, payload) messages: a "snapshot" first, then
+    "delta" messages, plus "keepalive" (empty payload) when idle and
+    "error" for rejected control messages.
+    """
+
+    def __init__(self, feed: "VesselFeed", queue_size: int):
+        self.feed = feed
+        self.group: Optional[_Group] = None
+        self.queue: "asyncio.Queue[Message]" = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+
+    def offer(self, message: Message):
+        """
+        Queue a message without waiting
+
+        A client too slow to keep up has its backlog dropped and gets a
+        fresh snapshot instead, so one slow socket never stalls the producer.
+        Once closed, the close marker is never dropped and later messages
+        are discarded.
+        """
+        if self.closed and message is not _CLOSED:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_CLOSED if self.closed else _RESYNC)
+
+    def close(self):
+        """End iteration (e.g. once the client disconnected)"""
+        self.closed = True
+        self.offer(_CLOSED)
+
+    def __aiter__(self) -> AsyncIterator[Message]:
+        return self._messages()
+
+    async def _messages(self) -> AsyncIterator[Message]:
+        while True:
+            try:
+                message = await asyncio.wait_for(self.queue.get(), timeout=self.feed.keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield "keepalive", b""
+                continue
+
+            if message is _CLOSED:
+                return
+            if message is _RESYNC:
+                if self.group is None:
+                    continue
+                message = self.feed.snapshot(self.group)
+            yield message
+
+
+class VesselFeed:
+    """
+    Shared producer of vessel position deltas
+
+    Subscribers are grouped by bounding box. Every tick the producer asks
+    the store once for the rows changed since the previous tick, then for
+    each group splits them into entered, updated and left (relative to the
+    rows the group last saw) and encodes one message that all subscribers
+    of the group receive. Vessels are serialized at most once per tick.
+    """
+
+    def __init__(self, store: VesselStore):
+        self.store = store
+        self.tick_seconds = float(os.getenv("VESSEL_FEED_TICK_SECONDS", "1"))
+        self.queue_size = int(os.getenv("VESSEL_FEED_QUEUE_SIZE", "32"))
+        self.keepalive_seconds = float(os.getenv("VESSEL_FEED_KEEPALIVE_SECONDS", "15"))
+
+        self._groups: Dict[BBox, _Group] = {}
+        self._version = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the producer"""
+        self._version = self.store.version
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the producer and end all subscriptions"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        for group in self._groups.values():
+            for subscription in group.subscribers:
+                subscription.close()
+
+    def subscribe(self, bbox: BBox) -> Subscription:
+        """Subscribe to a bounding box; the first message is a snapshot"""
+        subscription = Subscription(self, self.queue_size)
+        self._join(subscription, bbox)
+        VESSEL_FEED_SUBSCRIBERS.inc()
+        return subscription
+
+    def update_bbox(self, subscription: Subscription, bbox: BBox):
+        """Move a subscription to another bounding box and send it a new snapshot"""
+        self._leave(subscription)
+        self._join(subscription, bbox)
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription.group is not None:
+            self._leave(subscription)
+            VESSEL_FEED_SUBSCRIBERS.dec()
+
+    def snapshot(self, group: _Group) -> Message:
+        """Full state of a group, as sent to new or resynced subscribers"""
+        rows = sorted(group.visible)
+        return "snapshot", orjson.dumps({
+            "type": "snapshot",
+            "version": self._version,
+            "ships": [self.store.ship(row) for row in rows]
+        })
+
+    def _join(self, subscription: Subscription, bbox: BBox):
+        group = self._groups.get(bbox)
+        if group is None:
+            group = _Group(bbox, set(self.store.in_bbox(bbox).tolist()))
+            self._groups[bbox] = group
+
+        group.subscribers.add(subscription)
+        subscription.group = group
+        subscription.offer(self.snapshot(group))
+
+    def _leave(self, subscription: Subscription):
+        group = subscription.group
+        group.subscribers.discard(subscription)
+        if not group.subscribers:
+            del self._groups[group.bbox]
+        subscription.group = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            self.publish()
+
+    def publish(self):
+        """Send every group the changes since the previous call"""
+        if self.store.version == self._version:
+            return
+
+        rows = self.store.changed_since(self._version)
+        self._version = self.store.version
+        if not self._groups or len(rows) == 0:
+            return
+
+        ships: Dict[int, dict] = {}
+
+        def ship(row: int) -> dict:
+            if row not in ships:
+                ships[row] = self.store.ship(row)
+            return ships[row]
+
+        for group in self._groups.values():
+            inside = self.store.bbox_mask(rows, group.bbox)
+            entered: List[int] = []
+            updated: List[int] = []
+            for row in rows[inside].tolist():
+                (updated if row in group.visible else entered).append(row)
+            left = [row for row in rows[~inside].tolist() if row in group.visible]
+
+            if not (entered or updated or left):
+                continue
+
+            group.visible.update(entered)
+            group.visible.difference_update(left)
+
+            message = "delta", orjson.dumps({
+                "type": "delta",
+                "version": self._version,
+                "entered": [ship(row) for row in entered],
+                "updated": [ship(row) for row in updated],
+                "left": [self.store.mmsi_of(row) for row in left]
+            })
+            for subscription in group.subscribers:
+                subscription.offer(message)
+
+
+# Global instance
+vessel_feed = VesselFeed(vessel_store)
@@ -0,0 +1,393 @@
+"""
+Vessel Position Store
+In-memory, spatially indexed latest positions per vessel, loaded from
+PostgreSQL and kept current with incremental refreshes
+"""
+import os
+import math
+import asyncio
+import itertools
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+POSITION_COLUMNS = [
+    "mmsi", "name", "latitude", "longitude", "speed", "heading",
+    "status", "destination", "cargo", "teu", "eta", "updated_at"
+]
+
+SELECT_POSITIONS_SQL = f"""
+    SELECT {', '.join(POSITION_COLUMNS)}
+    FROM vessel_positions
+    WHERE updated_at >= %s
+    ORDER BY updated_at
+"""
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(value: str) -> BBox:
+    """
+    Parse "min_lng,min_lat,max_lng,max_lat"
+
+    min_lng may be greater than max_lng for boxes crossing the antimeridian.
+
+    Raises:
+        ValueError: If the value is malformed or out of range
+    """
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(","))
+    except ValueError:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat") from None
+
+    if not (-180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        raise ValueError("bbox longitudes must be between -180 and 180")
+    if not (-90 <= min_lat <= max_lat <= 90):
+        raise ValueError("bbox latitudes must be between -90 and 90, min first")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def _same_number(a: float, b: float) -> bool:
+    """Equality that treats two NaNs (unknown speed/heading) as equal"""
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+class VesselStore:
+    """
+    Latest vessel positions, indexed for viewport queries
+
+    Positions live in columnar NumPy arrays (lat, lng, speed, heading) with
+    one row per vessel; rows are never reordered, so row order is a stable
+    pagination order. An MMSI -> row dict serves lookups, and a uniform
+    lat/lng grid (cell -> set of rows) narrows bounding-box and radius
+    queries to the cells they overlap before an exact vectorized filter.
+
+    connect() bulk-loads vessel_positions at startup; a background task
+    then applies rows changed since the last refresh (by updated_at).
+    All mutations happen on the event loop, so queries need no locking.
+    Every applied batch that changes a row bumps `version`, and each row
+    records the version that last changed it, so consumers can ask for
+    changes since a version.
+    """
+
+    def __init__(self):
+        self.database_url = os.getenv("DATABASE_URL")
+        self.refresh_interval = float(os.getenv("VESSEL_REFRESH_INTERVAL", "5"))
+        self.cell_degrees = float(os.getenv("VESSEL_GRID_CELL_DEGREES", "1.0"))
+
+        # Re-read rows this far behind the watermark, for transactions that
+        # committed after a later one; unchanged re-read rows are skipped
+        self.refresh_overlap = timedelta(seconds=float(os.getenv("VESSEL_REFRESH_OVERLAP_SECONDS", "30")))
+
+        self._size = 0
+        self._lat = np.empty(0, dtype=np.float64)
+        self._lng = np.empty(0, dtype=np.float64)
+        self._speed = np.empty(0, dtype=np.float64)
+        self._heading = np.empty(0, dtype=np.float64)
+        self._changed_in = np.empty(0, dtype=np.int64)
+        self._mmsi: List[str] = []
+        self._info: List[Dict[str, Any]] = []
+        self._cell_of: List[Optional[Tuple[int, int]]] = []
+
+        self._index: Dict[str, int] = {}
+        self._grid: Dict[Tuple[int, int], set] = {}
+
+        self.version = 0
+        self._watermark: Optional[datetime] = None
+        self._conn = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._ready = False
+
+    @property
+    def is_ready(self) -> bool:
+        """True once the initial load has completed"""
+        return self._ready
+
+    @property
+    def updated_at(self) -> Optional[datetime]:
+        """Latest updated_at applied to the store"""
+        return self._watermark
+
+    def __len__(self) -> int:
+        return self._size
+
+    async def connect(self):
+        """Load all positions and start the background refresh"""
+        try:
+            await self.refresh()
+        except Exception:
+            # Keep retrying in the background; routes answer 503 until ready
+            pass
+
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        """Stop the background refresh and close the database connection"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def refresh(self) -> int:
+        """
+        Apply positions changed since the last refresh
+
+        Returns:
+            Number of rows applied
+        """
+        since = EPOCH if self._watermark is None else self._watermark - self.refresh_overlap
+        rows = await asyncio.to_thread(self._fetch, since)
+        self.apply(rows)
+        self._ready = True
+        return len(rows)
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                # Serve the last known positions until the database is back
+                pass
+
+    def _fetch(self, since: datetime) -> List[tuple]:
+        """Fetch changed rows (runs in a worker thread)"""
+        import psycopg2
+
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(self.database_url)
+            self._conn.autocommit = True
+
+        try:
+            with self._conn.cursor() as cursor:
+                cursor.execute(SELECT_POSITIONS_SQL, (since,))
+                return cursor.fetchall()
+        except Exception:
+            self._conn.close()
+            raise
+
+    def apply(self, rows: Sequence[tuple]):
+        """
+        Insert or update positions (rows in POSITION_COLUMNS order)
+
+        Rows identical to the stored ones (e.g. re-read through the refresh
+        overlap) are skipped; `version` only advances if a row changed.
+        """
+        version = self.version + 1
+        changed = False
+        for mmsi, name, lat, lng, speed, heading, status, destination, cargo, teu, eta, updated_at in rows:
+            if self._watermark is None or updated_at > self._watermark:
+                self._watermark = updated_at
+
+            speed = np.nan if speed is None else speed
+            heading = np.nan if heading is None else heading
+            info = {
+                "name": name,
+                "status": status,
+                "destination": destination,
+                "cargo": cargo,
+                "teu": teu,
+                "eta": eta,
+                "updated_at": updated_at,
+            }
+
+            row = self._index.get(mmsi)
+            if row is None:
+                row = self._append(mmsi)
+            elif (
+                self._info[row] == info
+                and self._lat[row] == lat
+                and self._lng[row] == lng
+                and _same_number(self._speed[row], speed)
+                and _same_number(self._heading[row], heading)
+            ):
+                continue
+
+            changed = True
+            self._lat[row] = lat
+            self._lng[row] = lng
+            self._speed[row] = speed
+            self._heading[row] = heading
+            self._changed_in[row] = version
+            self._info[row] = info
+
+            cell = self._cell(lat, lng)
+            old_cell = self._cell_of[row]
+            if cell != old_cell:
+                if old_cell is not None:
+                    members = self._grid[old_cell]
+                    members.discard(row)
+                    if not members:
+                        del self._grid[old_cell]
+                self._grid.setdefault(cell, set()).add(row)
+                self._cell_of[row] = cell
+
+        if changed:
+            self.version = version
+
+    def _append(self, mmsi: str) -> int:
+        if self._size == len(self._lat):
+            capacity = max(1024, 2 * len(self._lat))
+            self._lat = np.resize(self._lat, capacity)
+            self._lng = np.resize(self._lng, capacity)
+            self._speed = np.resize(self._speed, capacity)
+            self._heading = np.resize(self._heading, capacity)
+            self._changed_in = np.resize(self._changed_in, capacity)
+
+        row = self._size
+        self._size += 1
+        self._index[mmsi] = row
+        self._mmsi.append(mmsi)
+        self._info.append({})
+        self._cell_of.append(None)
+        return row
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lng / self.cell_degrees), math.floor(lat / self.cell_degrees)
+
+    def _query_box(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float) -> np.ndarray:
+        """Rows inside a box that does not cross the antimeridian"""
+        x0, y0 = self._cell(min_lat, min_lng)
+        x1, y1 = self._cell(max_lat, max_lng)
+
+        # Visit whichever is smaller: the box's cells or the occupied cells
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(self._grid):
+            groups = [
+                self._grid[(x, y)]
+                for x in range(x0, x1 + 1)
+                for y in range(y0, y1 + 1)
+                if (x, y) in self._grid
+            ]
+        else:
+            groups = [
+                members for (x, y), members in self._grid.items()
+                if x0 <= x <= x1 and y0 <= y <= y1
+            ]
+
+        rows = np.fromiter(itertools.chain.from_iterable(groups), dtype=np.int64)
+        lat = self._lat[rows]
+        lng = self._lng[rows]
+        return rows[(lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)]
+
+    def in_bbox(self, bbox: BBox) -> np.ndarray:
+        """
+        Rows inside a bounding box, in stable row order
+
+        Args:
+            bbox: (min_lng, min_lat, max_lng, max_lat); min_lng > max_lng
+                means the box crosses the antimeridian
+        """
+        min_lng, min_lat, max_lng, max_lat = bbox
+        if min_lng <= -180 and max_lng >= 180 and min_lat <= -90 and max_lat >= 90:
+            return self.all_rows()
+        if min_lng <= max_lng:
+            rows = self._query_box(min_lng, min_lat, max_lng, max_lat)
+        else:
+            rows = np.concatenate([
+                self._query_box(min_lng, min_lat, 180.0, max_lat),
+                self._query_box(-180.0, min_lat, max_lng, max_lat),
+            ])
+        return np.sort(rows)
+
+    def within_radius(self, lat: float, lng: float, radius_km: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows within radius_km of a point, nearest first
+
+        Returns:
+            (rows, distances_km)
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+
+        widest = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+        dlng = radius_km / (KM_PER_DEGREE * widest) if widest > 1e-9 else 360.0
+        if dlng >= 180:
+            bbox = (-180.0, min_lat, 180.0, max_lat)
+        else:
+            min_lng, max_lng = lng - dlng, lng + dlng
+            bbox = (
+                min_lng + 360 if min_lng < -180 else min_lng,
+                min_lat,
+                max_lng - 360 if max_lng > 180 else max_lng,
+                max_lat,
+            )
+
+        rows = self.in_bbox(bbox)
+
+        # Haversine distance to every candidate
+        lat1, lng1 = math.radians(lat), math.radians(lng)
+        lat2, lng2 = np.radians(self._lat[rows]), np.radians(self._lng[rows])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return rows[order], distances[order]
+
+    def changed_since(self, version: int) -> np.ndarray:
+        """Rows changed after the given store version"""
+        return np.nonzero(self._changed_in[:self._size] > version)[0]
+
+    def bbox_mask(self, rows: np.ndarray, bbox: BBox) -> np.ndarray:
+        """Which of the given rows lie inside a bounding box"""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        lat = self._lat[rows]
+        lng = self._lng[rows]
+        if min_lng <= max_lng:
+            in_lng = (lng >= min_lng) & (lng <= max_lng)
+        else:
+            in_lng = (lng >= min_lng) | (lng <= max_lng)
+        return in_lng & (lat >= min_lat) & (lat <= max_lat)
+
+    def all_rows(self) -> np.ndarray:
+        """Every row, in stable row order"""
+        return np.arange(self._size)
+
+    def mmsi_of(self, row: int) -> str:
+        return self._mmsi[row]
+
+    def get(self, mmsi: str) -> Optional[Dict[str, Any]]:
+        """Look up one vessel by MMSI"""
+        row = self._index.get(mmsi)
+        return None if row is None else self.ship(row)
+
+    def ship(self, row: int) -> Dict[str, Any]:
+        """Vessel at a row, in the /ships response shape"""
+        info = self._info[row]
+        speed = float(self._speed[row])
+        heading = float(self._heading[row])
+        return {
+            "id": self._mmsi[row],
+            "mmsi": self._mmsi[row],
+            "name": info["name"],
+            "position": {
+                "lng": float(self._lng[row]),
+                "lat": float(self._lat[row])
+            },
+            "destination": info["destination"],
+            "cargo": info["cargo"],
+            "teu": info["teu"],
+            "speed": None if math.isnan(speed) else speed,
+            "heading": None if math.isnan(heading) else heading,
+            "status": info["status"],
+            "eta": info["eta"].isoformat() if info["eta"] else None,
+            "updated_at": info["updated_at"].isoformat()
+        }
+
+
+# Global instance
+vessel_store = VesselStore()
@@ -0,0 +1 @@
+"""Benchmark and load-test suite (runs offline against a ClickHouse stand-in)"""
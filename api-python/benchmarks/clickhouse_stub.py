@@ -0,0 +1,448 @@
+"""
+ClickHouse HTTP Stub
+Local stand-in for the ClickHouse HTTP interface, answering the API's
+query templates from a synthetic dataset with configurable latency
+
+Supports GET /ping, `SELECT 1`, `KILL QUERY` (recorded, not acted on),
+and the trend_*, compare_monthly and export_arrivals templates (recognized
+by their log_comment, as sent by ClickHouseClient), in JSONEachRow,
+JSONColumns, ArrowStream, Parquet, CSVWithNames and TabSeparated formats. Results are computed from raw rows
+with NumPy, equal to what the real queries return, and encoded with
+ClickHouse's types (e.g. Date as UInt16 day numbers in Arrow). Any other query is
+answered with a ClickHouse-style error, as is a query whose latency exceeds
+its max_execution_time (TIMEOUT_EXCEEDED).
+
+Usage:
+    python -m benchmarks.clickhouse_stub --scale 10 --port 8123 --latency-ms 5
+"""
+import ast
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import numpy as np
+import orjson
+from benchmarks.data import SCALES, SyntheticDataset
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Result columns in SELECT order
+Result = Dict[str, np.ndarray]
+
+TREND_TYPE_COLUMNS = {
+    "total_containers": "container",
+    "total_dry_bulk": "dry_bulk",
+    "total_general_cargo": "general_cargo",
+    "total_roro": "roro",
+    "total_tankers": "tanker",
+}
+
+
+class StubQueryError(Exception):
+    """Query the stub cannot answer"""
+
+
+def bucket_starts(days: np.ndarray, granularity: str) -> np.ndarray:
+    """First day of each day's bucket (toDate, toMonday, toStartOfMonth, toStartOfQuarter)"""
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 was a Thursday
+        return days - ((days.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+    months = days.astype("datetime64[M]")
+    if granularity == "quarter":
+        index = months.astype(np.int64)
+        months = (index - index % 3).astype("datetime64[M]")
+    return months.astype("datetime64[D]")
+
+
+def bucket_range(start: np.datetime64, end: np.datetime64, granularity: str) -> np.ndarray:
+    """Bucket starts in [start, end), as produced by WITH FILL ... STEP"""
+    if granularity in ("day", "week"):
+        step = 7 if granularity == "week" else 1
+        return np.arange(start, end, step, dtype="datetime64[D]")
+    step = 3 if granularity == "quarter" else 1
+    months = np.arange(start.astype("datetime64[M]"), end.astype("datetime64[M]"), step, dtype="datetime64[M]")
+    return months.astype("datetime64[D]")
+
+
+class StubEngine:
+    """Evaluates the supported queries against a SyntheticDataset"""
+
+    def __init__(self, dataset: SyntheticDataset):
+        self.dataset = dataset
+        # KILL QUERY statements received, in order
+        self.kills: List[str] = []
+
+    def execute(self, sql: str, params: Dict[str, str]) -> Tuple[Result, int]:
+        """
+        Run a query
+
+        Returns:
+            (result columns, rows read)
+
+        Raises:
+            StubQueryError: If the query is not supported
+        """
+        template = params.get("log_comment", "")
+        if template.startswith("trend_"):
+            return self._trend(template[len("trend_"):], params)
+        if template == "compare_monthly":
+            return self._compare(params)
+        if template == "export_arrivals":
+            return self._export(params)
+        if sql.strip().rstrip(";").upper() == "SELECT 1":
+            return {"1": np.array([1], dtype=np.uint8)}, 1
+        if sql.lstrip().upper().startswith("KILL QUERY"):
+            self.kills.append(sql.strip())
+            return {}, 0
+        raise StubQueryError(f"Query is not supported by the benchmark stub: {template or sql[:80]!r}")
+
+    @staticmethod
+    def _date(params: Dict[str, str], name: str) -> np.datetime64:
+        try:
+            return np.datetime64(params[f"param_{name}"], "D")
+        except KeyError:
+            raise StubQueryError(f"Missing query parameter {name}") from None
+
+    def _trend(self, granularity: str, params: Dict[str, str]) -> Tuple[Result, int]:
+        if granularity not in ("day", "week", "month", "quarter"):
+            raise StubQueryError(f"Unknown trend granularity {granularity!r}")
+
+        rows = self.dataset.chokepoint_rows(params.get("param_chokepoint", ""))
+        start, end = self._date(params, "start_date"), self._date(params, "end_date")
+        days = rows["date"]
+        lo, hi = np.searchsorted(days, start), np.searchsorted(days, end, side="right")
+
+        buckets, first = np.unique(bucket_starts(days[lo:hi], granularity), return_index=True)
+        counts = rows["vessel_count"][lo:hi].astype(np.uint64)
+        sizes = np.diff(np.append(first, hi - lo))
+
+        if len(buckets):
+            found = {
+                "total_vessels": np.add.reduceat(counts, first),
+                "peak_vessels": np.maximum.reduceat(counts, first),
+                "min_vessels": np.minimum.reduceat(counts, first),
+                **{
+                    name: np.add.reduceat(rows[column][lo:hi].astype(np.uint64), first)
+                    for name, column in TREND_TYPE_COLUMNS.items()
+                },
+            }
+            found["avg_vessels"] = found["total_vessels"] / sizes
+        else:
+            found = {name: np.array([], dtype=np.uint64) for name in ("total_vessels", "peak_vessels", "min_vessels", *TREND_TYPE_COLUMNS)}
+            found["avg_vessels"] = np.array([], dtype=np.float64)
+
+        # WITH FILL: every bucket in [fill_start, fill_end), empty ones zeroed
+        filled = np.union1d(bucket_range(self._date(params, "fill_start"), self._date(params, "fill_end"), granularity), buckets)
+        positions = np.searchsorted(filled, buckets)
+
+        def dense(values: np.ndarray, dtype) -> np.ndarray:
+            column = np.zeros(len(filled), dtype=dtype)
+            column[positions] = values
+            return column
+
+        has_data = np.zeros(len(filled), dtype=np.uint8)
+        has_data[positions] = 1
+
+        result = {
+            "bucket": filled,
+            "total_vessels": dense(found["total_vessels"], np.uint64),
+            "avg_vessels": dense(found["avg_vessels"], np.float64),
+            "peak_vessels": dense(found["peak_vessels"], np.uint32),
+            "min_vessels": dense(found["min_vessels"], np.uint32),
+            **{name: dense(found[name], np.uint64) for name in TREND_TYPE_COLUMNS},
+            "has_data": has_data,
+        }
+        return result, hi - lo
+
+    def _compare(self, params: Dict[str, str]) -> Tuple[Result, int]:
+        try:
+            chokepoints = ast.literal_eval(params["param_chokepoints"])
+            column = params["param_raw_column"]
+        except (KeyError, ValueError, SyntaxError):
+            raise StubQueryError("Invalid compare_monthly parameters") from None
+        if column not in ("vessel_count", *TREND_TYPE_COLUMNS.values()):
+            raise StubQueryError(f"Unknown column {column!r}")
+
+        start, end = self._date(params, "start_date"), self._date(params, "end_date")
+        names, months, values = [], [], []
+        read_rows = 0
+        for chokepoint in dict.fromkeys(chokepoints):
+            rows = self.dataset.chokepoint_rows(chokepoint)
+            lo, hi = np.searchsorted(rows["date"], start), np.searchsorted(rows["date"], end, side="right")
+            if hi <= lo:
+                continue
+            buckets, first = np.unique(bucket_starts(rows["date"][lo:hi], "month"), return_index=True)
+            names.extend([chokepoint] * len(buckets))
+            months.append(buckets)
+            values.append(np.add.reduceat(rows[column][lo:hi].astype(np.uint64), first))
+            read_rows += hi - lo
+
+        month_column = np.concatenate(months) if months else np.array([], dtype="datetime64[D]")
+        order = np.argsort(month_column, kind="stable")
+        return {
+            "chokepoint": np.array(names, dtype=object)[order],
+            "month": month_column[order],
+            "value": (np.concatenate(values) if values else np.array([], dtype=np.uint64))[order],
+        }, read_rows
+
+
+    def _export(self, params: Dict[str, str]) -> Tuple[Result, int]:
+        try:
+            chokepoints = ast.literal_eval(params["param_chokepoints"])
+        except (KeyError, ValueError, SyntaxError):
+            raise StubQueryError("Invalid export_arrivals parameters") from None
+
+        start, end = self._date(params, "start_date"), self._date(params, "end_date")
+        names, parts = [], []
+        # Sorting key order: chokepoint, then date
+        for chokepoint in sorted(set(chokepoints)):
+            rows = self.dataset.chokepoint_rows(chokepoint)
+            lo, hi = np.searchsorted(rows["date"], start), np.searchsorted(rows["date"], end, side="right")
+            names.extend([chokepoint] * (hi - lo))
+            parts.append({name: values[lo:hi] for name, values in rows.items() if name != "chokepoint"})
+
+        columns = ("date", "vessel_count", *TREND_TYPE_COLUMNS.values())
+        result = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.array([], dtype="datetime64[D]" if name == "date" else np.uint32)
+            for name in columns
+        }
+        result = {"date": result.pop("date"), "chokepoint": np.array(names, dtype=object), **result}
+        return result, len(names)
+
+
+def _json_values(values: np.ndarray, quote_64bit: bool) -> list:
+    if values.dtype.kind == "M":
+        return values.astype(str).tolist()
+    if quote_64bit and values.dtype in (np.uint64, np.int64):
+        return [str(v) for v in values.tolist()]
+    return values.tolist()
+
+
+def encode(result: Result, result_format: str, quote_64bit: bool = True,
+           string_as_string: bool = False) -> Tuple[bytes, str]:
+    """
+    Serialize a result like ClickHouse does
+
+    With ArrowStream, Date columns are UInt16 days since the epoch (Arrow
+    has no type for ClickHouse's Date) and Strings are binary unless
+    string_as_string (output_format_*_string_as_string) is set; Parquet
+    writes Date as a date.
+
+    Returns:
+        (body, content type)
+
+    Raises:
+        StubQueryError: If the format is not supported
+    """
+    if result_format == "JSONColumns":
+        columns = {name: _json_values(values, quote_64bit) for name, values in result.items()}
+        return orjson.dumps(columns), "application/json; charset=UTF-8"
+
+    if result_format == "JSONEachRow":
+        names = list(result)
+        columns = [_json_values(values, quote_64bit) for values in result.values()]
+        body = b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in zip(*columns))
+        return body, "application/x-ndjson; charset=UTF-8"
+
+    if result_format == "TabSeparated":
+        columns = [_json_values(values, False) for values in result.values()]
+        body = "".join("\t".join(map(str, row)) + "\n" for row in zip(*columns)).encode()
+        return body, "text/tab-separated-values; charset=UTF-8"
+
+    if result_format == "CSVWithNames":
+        columns = [_json_values(values, False) for values in result.values()]
+        lines = [",".join(f'"{name}"' for name in result)]
+        lines.extend(
+            ",".join(f'"{value}"' if isinstance(value, str) else str(value) for value in row)
+            for row in zip(*columns)
+        )
+        return ("\n".join(lines) + "\n").encode(), "text/csv; charset=UTF-8; header=present"
+
+    if result_format in ("ArrowStream", "Parquet"):
+        if pyarrow is None:
+            raise StubQueryError(f"{result_format} needs pyarrow")
+        arrays = []
+        for values in result.values():
+            if values.dtype.kind == "M" and result_format == "ArrowStream":
+                days = values.astype("datetime64[D]").astype(np.int64).astype(np.uint16)
+                arrays.append(pyarrow.array(days, type=pyarrow.uint16()))
+            elif values.dtype.kind == "M":
+                arrays.append(pyarrow.array(values.astype("datetime64[D]"), type=pyarrow.date32()))
+            elif values.dtype == object:
+                strings = values.tolist()
+                if string_as_string:
+                    arrays.append(pyarrow.array(strings, type=pyarrow.string()))
+                else:
+                    arrays.append(pyarrow.array([v.encode() for v in strings], type=pyarrow.binary()))
+            else:
+                arrays.append(pyarrow.array(values))
+        table = pyarrow.table(arrays, names=list(result))
+        sink = pyarrow.BufferOutputStream()
+        if result_format == "Parquet":
+            pyarrow.parquet.write_table(table, sink, compression="zstd")
+        else:
+            with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+        return sink.getvalue().to_pybytes(), "application/octet-stream"
+
+    raise StubQueryError(f"Format {result_format} is not supported by the benchmark stub")
+
+
+class ClickHouseStub:
+    """
+    Threaded HTTP server speaking the subset of the ClickHouse HTTP interface the API uses
+
+    Every query is delayed by latency_ms plus a uniform random jitter of up
+    to jitter_ms (seeded, so runs are repeatable), before the result is
+    computed. Connections are kept alive like ClickHouse's.
+    """
+
+    def __init__(
+        self,
+        dataset: SyntheticDataset,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int = 42,
+    ):
+        self.engine = StubEngine(dataset)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def delay(self) -> float:
+        """Simulated query latency in seconds"""
+        with self._random_lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms > 0 else 0.0
+        return (self.latency_ms + jitter) / 1000
+
+    def start(self) -> "ClickHouseStub":
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="clickhouse-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = urlsplit(self.path).path
+                if path in ("/", "/ping"):
+                    self._send(200, b"Ok.\n", "text/plain; charset=UTF-8")
+                else:
+                    self._send(404, b"Not found\n", "text/plain; charset=UTF-8")
+
+            def do_POST(self):
+                started = time.perf_counter()
+                params = dict(parse_qsl(urlsplit(self.path).query))
+                sql = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+
+                delay = stub.delay()
+                limit = float(params.get("max_execution_time", 0) or 0)
+                if limit and delay > limit:
+                    time.sleep(limit)
+                    self._send(500, f"Code: 159. DB::Exception: Timeout exceeded: elapsed {limit} seconds, "
+                                    f"maximum: {limit}. (TIMEOUT_EXCEEDED)\n".encode(), "text/plain; charset=UTF-8")
+                    return
+                time.sleep(delay)
+                try:
+                    result, read_rows = stub.engine.execute(sql, params)
+                    body, content_type = encode(
+                        result,
+                        params.get("default_format", "TabSeparated"),
+                        quote_64bit=params.get("output_format_json_quote_64bit_integers", "1") != "0",
+                        string_as_string="1" in (
+                            params.get("output_format_arrow_string_as_string"),
+                            params.get("output_format_parquet_string_as_string"),
+                        )
+                    )
+                except StubQueryError as e:
+                    self._send(400, f"Code: 0. DB::Exception: {e}. (BENCHMARK_STUB)\n".encode(), "text/plain; charset=UTF-8")
+                    return
+
+                summary = {
+                    "read_rows": str(read_rows),
+                    "read_bytes": str(read_rows * 26),
+                    "written_rows": "0",
+                    "written_bytes": "0",
+                    "result_rows": str(len(next(iter(result.values()), []))),
+                    "elapsed_ns": str(int((time.perf_counter() - started) * 1e9)),
+                }
+                self._send(200, body, content_type, {"X-ClickHouse-Summary": json.dumps(summary)})
+
+            def _send(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the query (deadline or cancellation)
+                    self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic dataset over a ClickHouse-compatible HTTP stub")
+    parser.add_argument("--scale", type=int, default=1, choices=SCALES, help="Volume relative to production")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="Last day of data (default: today)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added to every query")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency, up to this much")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.scale, args.seed, args.end_date)
+    stub = ClickHouseStub(dataset, args.host, args.port, args.latency_ms, args.jitter_ms, args.seed)
+    print(f"🚀 ClickHouse stub on {stub.url}: {len(dataset):,} rows, "
+          f"{len(dataset.chokepoints)} chokepoints, latency {args.latency_ms}+{args.jitter_ms}ms")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
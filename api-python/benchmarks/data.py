@@ -0,0 +1,164 @@
+"""
+Synthetic Analytics Data
+Deterministic vessel_arrivals_analytics-shaped rows at 1x, 10x and 100x volume
+
+1x is the production volume: the six seeded chokepoints with one row per
+day over DATA_YEARS years. Higher scales add synthetic chokepoints
+(synthetic-007, ...), so per-chokepoint queries keep their size while the
+table grows. The same scale, seed and end date always produce the same rows.
+
+Usage:
+    python -m benchmarks.data --scale 10 --out rows.jsonl
+"""
+import argparse
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional
+import numpy as np
+import orjson
+
+SEEDED_CHOKEPOINTS = [
+    "suez-canal", "strait-of-hormuz", "strait-of-malacca",
+    "panama-canal", "bosporus-strait", "bab-el-mandeb",
+]
+SCALES = (1, 10, 100)
+
+# Covers the longest trend request (years=10) plus a partial year
+DATA_YEARS = 11
+
+# Share of days without a row, so gap filling is exercised
+MISSING_DAY_RATIO = 0.02
+
+# vessel type column -> share of the daily vessel count
+VESSEL_TYPE_SHARES = {
+    "container": 0.32,
+    "dry_bulk": 0.27,
+    "general_cargo": 0.14,
+    "roro": 0.07,
+    "tanker": 0.20,
+}
+
+
+def chokepoint_names(scale: int) -> List[str]:
+    """Chokepoints present at a scale: the seeded ones, then synthetic-NNN"""
+    count = len(SEEDED_CHOKEPOINTS) * scale
+    return SEEDED_CHOKEPOINTS + [f"synthetic-{i:03d}" for i in range(len(SEEDED_CHOKEPOINTS) + 1, count + 1)]
+
+
+class SyntheticDataset:
+    """
+    Columnar synthetic dataset, sorted by (chokepoint, date)
+
+    Attributes:
+        columns: vessel_arrivals_analytics column -> NumPy array; dates are
+            datetime64[D], chokepoint holds indexes into `chokepoints`
+        offsets: chokepoint -> (first row, end row) into the columns
+    """
+
+    def __init__(self, scale: int = 1, seed: int = 42, end_date: Optional[date] = None):
+        if scale < 1:
+            raise ValueError("scale must be at least 1")
+
+        self.scale = scale
+        self.seed = seed
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=round(DATA_YEARS * 365.25))
+        self.chokepoints = chokepoint_names(scale)
+        self.columns, self.offsets = self._generate()
+
+    def __len__(self) -> int:
+        return len(self.columns["date"])
+
+    def _generate(self):
+        days = np.arange(
+            np.datetime64(self.start_date, "D"),
+            np.datetime64(self.end_date, "D") + 1,
+            dtype="datetime64[D]"
+        )
+        day_index = np.arange(len(days))
+        weekday = (days.astype(np.int64) + 3) % 7  # 0 = Monday
+        day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64)
+
+        parts: Dict[str, list] = {name: [] for name in ("date", "chokepoint", "vessel_count", *VESSEL_TYPE_SHARES)}
+        offsets = {}
+        position = 0
+
+        for index, chokepoint in enumerate(self.chokepoints):
+            rng = np.random.default_rng([self.seed, index])
+
+            # Level, multi-year growth, yearly and weekly seasonality and noise
+            level = rng.uniform(20, 120)
+            growth = rng.uniform(-0.00003, 0.00008)
+            season = rng.uniform(0.05, 0.2)
+            expected = (
+                level
+                * (1 + growth * day_index)
+                * (1 + season * np.sin(2 * np.pi * day_of_year / 365.25 + rng.uniform(0, 2 * np.pi)))
+                * np.where(weekday >= 5, 0.9, 1.0)
+            )
+            counts = rng.poisson(np.maximum(expected, 1)).astype(np.uint32)
+            kept = rng.random(len(days)) >= MISSING_DAY_RATIO
+
+            counts = counts[kept]
+            parts["date"].append(days[kept])
+            parts["chokepoint"].append(np.full(len(counts), index, dtype=np.uint16))
+            parts["vessel_count"].append(counts)
+
+            # Split each day's count over vessel types (they sum to vessel_count)
+            shares = rng.dirichlet([share * 50 for share in VESSEL_TYPE_SHARES.values()], size=len(counts))
+            breakdown = np.floor(shares * counts[:, None]).astype(np.uint32)
+            breakdown[:, 0] += counts - breakdown.sum(axis=1)
+            for column, values in zip(VESSEL_TYPE_SHARES, breakdown.T):
+                parts[column].append(values.astype(np.uint16))
+
+            offsets[chokepoint] = (position, position + len(counts))
+            position += len(counts)
+
+        columns = {name: np.concatenate(values) for name, values in parts.items()}
+        return columns, offsets
+
+    def chokepoint_rows(self, chokepoint: str) -> Dict[str, np.ndarray]:
+        """Columns restricted to one chokepoint (views, no copy)"""
+        start, end = self.offsets.get(chokepoint, (0, 0))
+        return {name: values[start:end] for name, values in self.columns.items()}
+
+    def iter_json_rows(self, batch_size: int = 10000):
+        """Yield JSONEachRow lines in vessel_arrivals_analytics column order"""
+        collected_at = datetime.combine(self.end_date, datetime.min.time()).strftime("%Y-%m-%d %H:%M:%S")
+        updated_at = datetime.combine(self.end_date, datetime.min.time(), tzinfo=timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+        for start in range(0, len(self), batch_size):
+            batch = {name: values[start:start + batch_size] for name, values in self.columns.items()}
+            dates = batch["date"].astype(str).tolist()
+            chokepoints = [self.chokepoints[index] for index in batch["chokepoint"].tolist()]
+            lists = {name: values.tolist() for name, values in batch.items() if name not in ("date", "chokepoint")}
+            for i, day in enumerate(dates):
+                row = {"date": day, "chokepoint": chokepoints[i], **{name: values[i] for name, values in lists.items()}}
+                row["collected_at"] = collected_at
+                row["updated_at"] = updated_at
+                yield orjson.dumps(row) + b"\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic vessel_arrivals_analytics rows as JSONEachRow")
+    parser.add_argument("--scale", type=int, default=1, choices=SCALES, help="Volume relative to production")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=None, help="Last day (default: today)")
+    parser.add_argument("--out", default="-", help="Output file (default: stdout)")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(args.scale, args.seed, args.end_date)
+    out = sys.stdout.buffer if args.out == "-" else open(args.out, "wb")
+    try:
+        for line in dataset.iter_json_rows():
+            out.write(line)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+    print(f"✅ {len(dataset):,} rows for {len(dataset.chokepoints)} chokepoints "
+          f"({dataset.start_date} to {dataset.end_date})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Load Driver
+Async HTTP load generator reporting throughput and p50/p95/p99 latency
+per endpoint
+
+By default workers run closed-loop (each sends its next request as soon as
+the previous one finished). With --rate, requests are started on a fixed
+schedule instead and latency is measured from the scheduled start, so a
+slow server is not hidden by the driver backing off.
+
+Requests are spread over --tenants API keys (bench-0, bench-1, ...) so
+per-tenant rate limits apply as they would to that many clients; the
+target API must list them in ANALYTICS_API_KEYS.
+
+--start-stack runs everything on this machine: the ClickHouse stub in
+this process and the API under uvicorn, pointed at the stub, with Redis,
+PostgreSQL and the agent server left unconfigured.
+
+Usage:
+    python -m benchmarks.load --start-stack --scale 10 --latency-ms 5 --duration 30
+    python -m benchmarks.load --base-url http://localhost:8000 --endpoints trend_month,compare
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, NamedTuple, Optional
+import httpx
+import numpy as np
+from benchmarks.data import SCALES, SyntheticDataset, chokepoint_names
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Request(NamedTuple):
+    method: str
+    url: str
+    json: Optional[dict] = None
+
+
+# Endpoint name -> request factory taking a random generator and the chokepoints
+ENDPOINTS: Dict[str, Callable[[random.Random, List[str]], Request]] = {
+    "health": lambda rng, chokepoints: Request("GET", "/health"),
+    "trend_month": lambda rng, chokepoints: Request(
+        "GET", f"/api/v1/analytics/trend?chokepoint={rng.choice(chokepoints)}&years={rng.randint(1, 10)}"
+    ),
+    "trend_week": lambda rng, chokepoints: Request(
+        "GET", f"/api/v1/analytics/trend?chokepoint={rng.choice(chokepoints)}&years={rng.randint(1, 3)}&granularity=week"
+    ),
+    "trend_day": lambda rng, chokepoints: Request(
+        "GET", f"/api/v1/analytics/trend?chokepoint={rng.choice(chokepoints)}&years=1&granularity=day"
+    ),
+    "trend_columnar": lambda rng, chokepoints: Request(
+        "GET", f"/api/v1/analytics/trend?chokepoint={rng.choice(chokepoints)}&years=5&format=columnar"
+    ),
+    "export": lambda rng, chokepoints: Request(
+        "GET", f"/api/v1/analytics/export?chokepoints={','.join(rng.sample(chokepoints, min(3, len(chokepoints))))}"
+               f"&start_date=2020-01-01&format={rng.choice(['csv', 'parquet', 'arrow'])}"
+    ),
+    "compare": lambda rng, chokepoints: Request(
+        "POST", "/api/v1/analytics/compare",
+        {"chokepoints": rng.sample(chokepoints, min(3, len(chokepoints))), "metric": "vessel_count"}
+    ),
+}
+
+DEFAULT_ENDPOINTS = "trend_month,trend_week,trend_day,compare"
+
+
+class Recorder:
+    """Latencies and errors per endpoint, recorded only while measuring"""
+
+    def __init__(self):
+        self.measuring = False
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.throttled: Dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, seconds: float, status: Optional[int]):
+        """Record a response status (None for a transport error); 429s count as throttled, not errors"""
+        if not self.measuring:
+            return
+        self.latencies[endpoint].append(seconds)
+        if status == 429:
+            self.throttled[endpoint] += 1
+        elif status is None or status >= 400:
+            self.errors[endpoint] += 1
+
+    def report(self, duration: float) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint and total stats; latencies in milliseconds"""
+        report = {}
+        everything = []
+        for endpoint in sorted(self.latencies):
+            latencies = np.array(self.latencies[endpoint]) * 1000
+            everything.append(latencies)
+            report[endpoint] = self._stats(latencies, self.errors[endpoint], self.throttled[endpoint], duration)
+        if everything:
+            report["total"] = self._stats(
+                np.concatenate(everything), sum(self.errors.values()), sum(self.throttled.values()), duration
+            )
+        return report
+
+    @staticmethod
+    def _stats(latencies: np.ndarray, errors: int, throttled: int, duration: float) -> Dict[str, float]:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        return {
+            "requests": int(len(latencies)),
+            "errors": int(errors),
+            "throttled": int(throttled),
+            "rps": len(latencies) / duration,
+            "p50_ms": float(p50),
+            "p95_ms": float(p95),
+            "p99_ms": float(p99),
+            "max_ms": float(latencies.max()),
+        }
+
+
+def tenant_keys(count: int) -> List[str]:
+    return [f"bench-{i}" for i in range(count)]
+
+
+async def send(client: httpx.AsyncClient, recorder: Recorder, endpoint: str, request: Request, started: float,
+               api_key: str):
+    try:
+        response = await client.request(request.method, request.url, json=request.json,
+                                        headers={"X-API-Key": api_key})
+        await response.aread()
+        status = response.status_code
+    except httpx.HTTPError:
+        status = None
+    recorder.record(endpoint, time.perf_counter() - started, status)
+
+
+async def closed_loop(client, recorder, endpoints, chokepoints, api_key: str, worker: int, seed: int,
+                      stop_at: float):
+    rng = random.Random(seed * 1000 + worker)
+    while time.perf_counter() < stop_at:
+        endpoint = rng.choice(endpoints)
+        await send(client, recorder, endpoint, ENDPOINTS[endpoint](rng, chokepoints), time.perf_counter(), api_key)
+
+
+async def open_loop(client, recorder, endpoints, chokepoints, api_keys: List[str], rate: float, seed: int,
+                    stop_at: float):
+    rng = random.Random(seed)
+    interval = 1 / rate
+    scheduled = time.perf_counter()
+    tasks = set()
+    while scheduled < stop_at:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        endpoint = rng.choice(endpoints)
+        task = asyncio.create_task(send(
+            client, recorder, endpoint, ENDPOINTS[endpoint](rng, chokepoints), scheduled, rng.choice(api_keys)
+        ))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        scheduled += interval
+    await asyncio.gather(*tasks)
+
+
+async def run_load(args, chokepoints: List[str]) -> Dict[str, Dict[str, float]]:
+    endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = set(endpoints) - ENDPOINTS.keys()
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}. Choose from: {', '.join(ENDPOINTS)}")
+
+    recorder = Recorder()
+    api_keys = tenant_keys(args.tenants or args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        stop_at = time.perf_counter() + args.warmup + args.duration
+
+        async def measure():
+            await asyncio.sleep(args.warmup)
+            recorder.measuring = True
+
+        if args.rate:
+            load = open_loop(client, recorder, endpoints, chokepoints, api_keys, args.rate, args.seed, stop_at)
+        else:
+            load = asyncio.gather(*(
+                closed_loop(client, recorder, endpoints, chokepoints, api_keys[worker % len(api_keys)], worker,
+                            args.seed, stop_at)
+                for worker in range(args.concurrency)
+            ))
+        await asyncio.gather(measure(), load)
+
+    return recorder.report(args.duration)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_stack(args):
+    """Start the ClickHouse stub and the API; yields the API base URL"""
+    from benchmarks.clickhouse_stub import ClickHouseStub
+
+    dataset = SyntheticDataset(args.scale, args.seed)
+    stub = ClickHouseStub(dataset, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed).start()
+    print(f"🚀 ClickHouse stub on {stub.url}: {len(dataset):,} rows, {len(dataset.chokepoints)} chokepoints")
+
+    port = free_port()
+    env = {
+        **os.environ,
+        "CLICKHOUSE_URL": stub.url,
+        "REDIS_URL": "",
+        "DATABASE_URL": "postgresql://offline@127.0.0.1:1/offline",
+        "AGENT_SERVER_URL": "http://127.0.0.1:1",
+        "ANALYTICS_API_KEYS": ",".join(tenant_keys(args.tenants or args.concurrency)),
+    }
+    if args.no_cache:
+        env["ANALYTICS_CACHE_MAX_BYTES"] = "0"
+    if args.no_tenant_limits:
+        env["ANALYTICS_TENANT_RATE"] = "0"
+
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.api_workers), "--log-level", "warning"],
+        cwd=API_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if api.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("❌ API did not start")
+            time.sleep(0.2)
+        print(f"🚀 API on {base_url} ({args.api_workers} worker(s), cache {'off' if args.no_cache else 'on'})")
+        yield base_url
+    finally:
+        api.terminate()
+        api.wait()
+        stub.stop()
+
+
+def print_report(report: Dict[str, Dict[str, float]]):
+    print(f"{'endpoint':16} {'requests':>9} {'errors':>7} {'429':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for endpoint, stats in report.items():
+        print(f"{endpoint:16} {stats['requests']:9d} {stats['errors']:7d} {stats['throttled']:7d} {stats['rps']:9.1f} "
+              f"{stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f} {stats['max_ms']:9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the analytics API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoints", default=DEFAULT_ENDPOINTS, help=f"Comma-separated, from: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", type=int, default=32, help="Closed-loop workers / max connections")
+    parser.add_argument("--rate", type=float, default=0, help="Open-loop requests per second (overrides closed-loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before measuring")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--tenants", type=int, default=0, help="API keys to spread requests over (default: one per worker)")
+    parser.add_argument("--scale", type=int, default=1, choices=SCALES, help="Dataset volume (chokepoints requested)")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this file")
+
+    stack = parser.add_argument_group("local stack")
+    stack.add_argument("--start-stack", action="store_true", help="Start the ClickHouse stub and the API locally")
+    stack.add_argument("--latency-ms", type=float, default=2.0, help="Stub latency per query")
+    stack.add_argument("--jitter-ms", type=float, default=1.0, help="Stub random extra latency")
+    stack.add_argument("--no-cache", action="store_true", help="Disable the API result cache")
+    stack.add_argument("--no-tenant-limits", action="store_true", help="Disable per-tenant rate limits")
+    stack.add_argument("--api-workers", type=int, default=1)
+    args = parser.parse_args()
+
+    chokepoints = chokepoint_names(args.scale)
+
+    def run():
+        mode = f"{args.rate:g} req/s open-loop" if args.rate else f"{args.concurrency} closed-loop workers"
+        print(f"⏱️  {args.endpoints} against {args.base_url}: {mode}, {args.warmup:g}s warmup + {args.duration:g}s")
+        report = asyncio.run(run_load(args, chokepoints))
+        print_report(report)
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({"args": vars(args), "report": report}, f, indent=2)
+
+    if args.start_stack:
+        with local_stack(args) as base_url:
+            args.base_url = base_url
+            run()
+    else:
+        run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Micro-benchmarks
+Times the CPU-bound steps of a trend request in isolation: decoding the
+ClickHouse result, building the response models, summary statistics and
+rendering the JSON body
+
+Inputs are the stub's answer to a real trend query, so the sizes match
+production for the chosen years and granularity. No network is involved.
+
+Usage:
+    python -m benchmarks.micro --years 10 --granularity day
+    python -m benchmarks.micro --filter decode --json before.json
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict
+import numpy as np
+import orjson
+from benchmarks.clickhouse_stub import StubEngine, encode
+from benchmarks.data import SyntheticDataset
+from app.database.clickhouse import as_dates, clickhouse_client, load_pyarrow
+from app.models.analytics import MonthlyData
+from app.responses import AnalyticsJSONResponse, columnar_trend
+from app.services.analytics import AnalyticsService, _bucket_start, _next_bucket
+
+# Target duration of one timed sample
+SAMPLE_SECONDS = 0.2
+
+
+def time_call(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """
+    Time a callable
+
+    The number of calls per sample is calibrated so a sample takes about
+    SAMPLE_SECONDS; per-call times are reported in microseconds.
+    """
+    func()
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= SAMPLE_SECONDS / 10 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * SAMPLE_SECONDS / max(elapsed, 1e-9)))
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number * 1e6)
+
+    median = statistics.median(samples)
+    return {
+        "calls": number * repeat,
+        "median_us": median,
+        "min_us": min(samples),
+        "max_us": max(samples),
+        "ops_per_s": 1e6 / median if median > 0 else float("inf"),
+    }
+
+
+def trend_result(granularity: str, years: int, scale: int) -> Dict[str, np.ndarray]:
+    """Result columns of a trend query for suez-canal, as the stub computes them"""
+    end = date.today()
+    start = end - timedelta(days=years * 365)
+    engine = StubEngine(SyntheticDataset(scale, end_date=end))
+    params = {
+        "log_comment": f"trend_{granularity}",
+        "param_chokepoint": "suez-canal",
+        "param_start_date": start.isoformat(),
+        "param_end_date": end.isoformat(),
+        "param_fill_start": _bucket_start(start, granularity).isoformat(),
+        "param_fill_end": _next_bucket(_bucket_start(end, granularity), granularity).isoformat(),
+    }
+    result, _ = engine.execute("", params)
+    return result
+
+
+def build_cases(granularity: str, years: int, scale: int) -> Dict[str, Callable[[], Any]]:
+    """Benchmark name -> callable"""
+    result = trend_result(granularity, years, scale)
+    each_row, _ = encode(result, "JSONEachRow")
+    json_columns, _ = encode(result, "JSONColumns", quote_64bit=False)
+    pyarrow = load_pyarrow()
+
+    # Columns as ClickHouseClient.query_columns returns them
+    if pyarrow is not None:
+        arrow_stream, _ = encode(result, "ArrowStream", string_as_string=True)
+        table = pyarrow.ipc.open_stream(arrow_stream).read_all()
+        columns = {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+    else:
+        columns = {name: np.asarray(values) for name, values in json.loads(json_columns).items()}
+
+    # get_trend_analysis without the network round trip
+    async def query_columns(query, params=None):
+        return columns
+
+    clickhouse_client.query_columns = query_columns
+
+    loop = asyncio.new_event_loop()
+
+    def build_trend():
+        return loop.run_until_complete(AnalyticsService.get_trend_analysis("suez-canal", years, granularity))
+
+    trend = build_trend()
+    rows = [m.model_dump() for m in trend.monthly_data]
+    buckets = as_dates(columns["bucket"]).astype(str)
+    totals = columns["total_vessels"].astype(np.int64)
+    has_data = columns["has_data"].astype(bool)
+    response = AnalyticsJSONResponse(trend)
+
+    cases = {
+        "decode.json_each_row.stdlib": lambda: [json.loads(line) for line in each_row.splitlines()],
+        "decode.json_each_row.orjson": lambda: [orjson.loads(line) for line in each_row.splitlines()],
+        "decode.json_columns": lambda: {name: np.asarray(values) for name, values in json.loads(json_columns).items()},
+        "models.trend_response": build_trend,
+        "models.monthly_data_validated": lambda: [MonthlyData.model_validate(row) for row in rows],
+        "summary.trend_summary": lambda: AnalyticsService._trend_summary(buckets, totals, has_data),
+        "render.rows.response": lambda: response.render(trend),
+        "render.columnar.orjson": lambda: response.render(columnar_trend(trend)),
+        "render.rows.pydantic": lambda: trend.model_dump_json(),
+    }
+    if pyarrow is not None:
+        def decode_arrow():
+            table = pyarrow.ipc.open_stream(arrow_stream).read_all()
+            return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+
+        cases["decode.arrow_stream"] = decode_arrow
+    return dict(sorted(cases.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the trend request pipeline")
+    parser.add_argument("--granularity", default="day", choices=["day", "week", "month", "quarter"])
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--scale", type=int, default=1, choices=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=7, help="Timed samples per benchmark")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    cases = build_cases(args.granularity, args.years, args.scale)
+    print(f"📏 trend suez-canal, {args.years} years by {args.granularity}")
+    print(f"{'benchmark':34} {'median µs':>12} {'min µs':>12} {'max µs':>12} {'ops/s':>12}")
+
+    results: Dict[str, Dict[str, float]] = {}
+    for name, func in cases.items():
+        if args.filter not in name:
+            continue
+        stats = time_call(func, args.repeat)
+        results[name] = stats
+        print(f"{name:34} {stats['median_us']:12.1f} {stats['min_us']:12.1f} {stats['max_us']:12.1f} {stats['ops_per_s']:12.0f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Cache-Control of analytics responses
+
+nginx may store public responses and serve them without reaching the API,
+so responses to known API keys must be private to keep them rate limited.
+"""
+from app.responses import cache_headers, not_modified
+from app.services.admission import AdmissionController
+
+
+def test_anonymous_responses_are_public():
+    headers = cache_headers('W/"1-abc"')
+    assert headers["ETag"] == 'W/"1-abc"'
+    assert headers["Cache-Control"].startswith("public,")
+
+
+def test_keyed_responses_are_private():
+    assert cache_headers('W/"1-abc"', private=True)["Cache-Control"].startswith("private,")
+    assert not_modified('W/"1-abc"', private=True).headers["cache-control"].startswith("private,")
+
+
+def test_exports_are_never_stored():
+    assert cache_headers('W/"1-abc"', shared=False, private=True)["Cache-Control"] == "no-cache"
+    assert cache_headers(None)["Cache-Control"] == "no-cache"
+
+
+def test_only_configured_keys_are_known(monkeypatch):
+    monkeypatch.setenv("ANALYTICS_API_KEYS", "alpha, beta")
+    admission = AdmissionController()
+    assert admission.known_key("alpha")
+    assert not admission.known_key("made-up")
+    assert not admission.known_key(None)
+    assert admission.tenant("made-up", "10.0.0.1") == "ip:10.0.0.1"
+    assert admission.tenant("beta", "10.0.0.1") == "key:beta"
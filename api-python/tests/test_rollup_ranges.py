@@ -0,0 +1,61 @@
+"""
+Rollup routing of analytics date ranges
+
+Rows in [start, end] are read from the rollup for [rollup_start, rollup_end)
+and from raw rows for [start, rollup_start) and [rollup_end, end], as in
+COMPARE_MONTHLY_QUERY and the trend queries.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from app.services.analytics import AnalyticsService
+
+
+def assert_exact_cover(start, end, rollup_start, rollup_end):
+    """Every day of [start, end] is read exactly once, and nothing else"""
+    assert rollup_start <= rollup_end
+    read = []
+    day = start - timedelta(days=40)
+    while day <= end + timedelta(days=40):
+        raw = start <= day < rollup_start or rollup_end <= day <= end
+        rollup = rollup_start <= day < rollup_end
+        read.extend([day] * (raw + rollup))
+        day += timedelta(days=1)
+    assert read == [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def test_same_month_range_reads_only_the_requested_days():
+    start, end = date(2024, 3, 15), date(2024, 3, 20)
+    rollup_start, rollup_end = AnalyticsService._rollup_range(start, end)
+
+    assert (rollup_start, rollup_end) == (start, start)
+    assert_exact_cover(start, end, rollup_start, rollup_end)
+
+
+def test_same_week_range_reads_only_the_requested_days():
+    # Wednesday to Saturday of one ISO week
+    start, end = date(2024, 3, 13), date(2024, 3, 16)
+    rollup_start, rollup_end = AnalyticsService._trend_rollup_range(start, end, "week")
+
+    assert (rollup_start, rollup_end) == (start, start)
+    assert_exact_cover(start, end, rollup_start, rollup_end)
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    (date(2024, 3, 1), date(2024, 3, 20), (date(2024, 3, 1), date(2024, 3, 1))),
+    (date(2024, 3, 15), date(2024, 6, 20), (date(2024, 4, 1), date(2024, 6, 1))),
+    (date(2024, 3, 1), date(2024, 6, 20), (date(2024, 3, 1), date(2024, 6, 1))),
+    (date(2024, 3, 15), date(2024, 4, 2), (date(2024, 3, 15), date(2024, 3, 15))),
+])
+def test_month_ranges_cover_each_day_once(start, end, expected):
+    rollup_range = AnalyticsService._rollup_range(start, end)
+
+    assert rollup_range == expected
+    assert_exact_cover(start, end, *rollup_range)
+
+
+@pytest.mark.parametrize("granularity", ["day", "week", "month", "quarter"])
+def test_trend_ranges_cover_each_day_once(granularity):
+    start, end = date(2019, 10, 17), date(2024, 10, 16)
+    assert_exact_cover(start, end, *AnalyticsService._trend_rollup_range(start, end, granularity))
@@ -0,0 +1,101 @@
+"""
+Bulk Loader
+COPY-based upsert of vessel arrival DataFrames into PostgreSQL
+"""
+import io
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# CSV / table columns loaded into vessel_arrivals, in COPY order
+COLUMNS = [
+    'date', 'chokepoint', 'vessel_count', 'container', 'dry_bulk',
+    'general_cargo', 'roro', 'tanker', 'collected_at'
+]
+
+# Rows serialized and streamed per COPY round
+DEFAULT_CHUNK_SIZE = int(os.getenv('ETL_COPY_CHUNK_SIZE', '50000'))
+
+# Temporary tables are never WAL-logged (like UNLOGGED tables) and are
+# private to the session, so concurrent loaders don't see each other's rows
+CREATE_STAGING_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS vessel_arrivals_staging (
+        date DATE NOT NULL,
+        chokepoint VARCHAR(50) NOT NULL,
+        vessel_count INTEGER NOT NULL,
+        container INTEGER,
+        dry_bulk INTEGER,
+        general_cargo INTEGER,
+        roro INTEGER,
+        tanker INTEGER,
+        collected_at TIMESTAMPTZ
+    )
+"""
+
+COPY_SQL = f"""
+    COPY vessel_arrivals_staging ({', '.join(COLUMNS)})
+    FROM STDIN WITH (FORMAT csv)
+"""
+
+# DISTINCT ON keeps the latest row per key (by collected_at) across the
+# whole load, since ON CONFLICT cannot update the same row twice in one
+# statement
+UPSERT_SQL = f"""
+    INSERT INTO vessel_arrivals ({', '.join(COLUMNS)})
+    SELECT DISTINCT ON (date, chokepoint) {', '.join(COLUMNS)}
+    FROM vessel_arrivals_staging
+    ORDER BY date, chokepoint, collected_at DESC
+    ON CONFLICT (date, chokepoint) DO UPDATE SET
+        vessel_count = EXCLUDED.vessel_count,
+        container = EXCLUDED.container,
+        dry_bulk = EXCLUDED.dry_bulk,
+        general_cargo = EXCLUDED.general_cargo,
+        roro = EXCLUDED.roro,
+        tanker = EXCLUDED.tanker,
+        collected_at = EXCLUDED.collected_at,
+        updated_at = NOW()
+"""
+
+
+def bulk_upsert(conn, df, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Upsert a DataFrame of vessel arrivals into vessel_arrivals
+
+    The DataFrame is streamed as CSV through COPY into a staging table
+    chunk by chunk (bounding the CSV buffer), then merged with one
+    set-based INSERT ... ON CONFLICT, so duplicate keys are resolved to the
+    latest collected_at even when they land in different chunks. The
+    caller owns the transaction and must commit or roll back.
+
+    Args:
+        conn: psycopg2 connection
+        df: DataFrame containing at least COLUMNS
+        chunk_size: Rows per COPY round
+
+    Returns:
+        Number of rows staged
+    """
+    if df.empty:
+        return 0
+
+    df = df[COLUMNS]
+
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.execute("TRUNCATE vessel_arrivals_staging")
+
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+
+            buffer = io.StringIO()
+            chunk.to_csv(buffer, index=False, header=False)
+            buffer.seek(0)
+
+            cursor.copy_expert(COPY_SQL, buffer)
+
+        cursor.execute(UPSERT_SQL)
+        cursor.execute("TRUNCATE vessel_arrivals_staging")
+
+    return len(df)
@@ -0,0 +1,31 @@
+"""
+Analytics Cache Invalidation
+Bumps the analytics cache generation in Redis so every API process drops
+results computed before the latest ClickHouse sync. The generation is also
+the data version behind the API's ETags, so HTTP caches revalidate too.
+"""
+import os
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Must match GENERATION_KEY in api-python/app/services/cache.py
+GENERATION_KEY = "seesea:analytics:generation"
+
+def invalidate_analytics_cache():
+    """Invalidate cached analytics results (no-op when Redis is not configured)"""
+    redis_url = os.getenv('REDIS_URL')
+    if not redis_url:
+        return
+
+    try:
+        client = redis.Redis.from_url(redis_url)
+        generation = client.incr(GENERATION_KEY)
+        client.close()
+        print(f"🧹 Analytics cache invalidated (generation {generation})")
+    except redis.RedisError as e:
+        print(f"⚠️  Failed to invalidate analytics cache: {str(e)}")
+
+if __name__ == "__main__":
+    invalidate_analytics_cache()
@@ -0,0 +1,200 @@
+"""
+PostgreSQL to ClickHouse Backfill
+Copies a date range partition by partition with bounded memory, e.g. to
+populate a new or rebuilt analytics replica
+"""
+import os
+import time
+import queue
+import argparse
+import threading
+from datetime import date
+
+import psycopg2
+from dotenv import load_dotenv
+
+from clickhouse_common import (
+    INSERT_ANALYTICS_SQL, connect_clickhouse,
+    get_sync_state, set_sync_state, rebuild_rollups
+)
+from pg_to_clickhouse import JOB_NAME as SYNC_JOB_NAME
+from cache_invalidation import invalidate_analytics_cache
+from job_locks import job_lock
+
+load_dotenv()
+
+# Rows per fetch/insert round
+DEFAULT_CHUNK_SIZE = int(os.getenv('ETL_BACKFILL_CHUNK_SIZE', '50000'))
+
+# Chunks buffered between the PostgreSQL reader and the ClickHouse writer.
+# At most (queue depth + 2) chunks are in memory at any time.
+DEFAULT_QUEUE_DEPTH = int(os.getenv('ETL_BACKFILL_QUEUE_DEPTH', '4'))
+
+# Queue markers
+_MONTH_DONE = 'month_done'
+_FINISHED = 'finished'
+_FAILED = 'failed'
+
+
+def month_partitions(start, end):
+    """Yield (partition, first_day, next_month_first_day) for every month in [start, end]"""
+    month = start.replace(day=1)
+    while month <= end:
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month.year * 100 + month.month, month, next_month
+        month = next_month
+
+
+def _put(chunks, item, stop):
+    """Put into the bounded queue, giving up once the writer has stopped"""
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _read_partitions(start, end, chunk_size, chunks, stop):
+    """Reader thread: stream each month from PostgreSQL as column-oriented chunks"""
+    pg_conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    try:
+        for partition, month_start, next_month in month_partitions(start, end):
+            with pg_conn.cursor(name=f'backfill_{partition}') as pg_cursor:
+                pg_cursor.itersize = chunk_size
+                pg_cursor.execute("""
+                    SELECT date, chokepoint, vessel_count, container, dry_bulk,
+                           general_cargo, roro, tanker, collected_at, updated_at
+                    FROM vessel_arrivals
+                    WHERE date >= %s AND date < %s
+                      AND date >= %s AND date <= %s
+                """, (month_start, next_month, start, end))
+
+                while True:
+                    rows = pg_cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    # Transpose to columns for a columnar native insert
+                    if not _put(chunks, ('rows', partition, [list(column) for column in zip(*rows)]), stop):
+                        return
+
+            pg_conn.commit()
+            if not _put(chunks, (_MONTH_DONE, partition, None), stop):
+                return
+
+        _put(chunks, (_FINISHED, None, None), stop)
+    except Exception as e:
+        _put(chunks, (_FAILED, None, e), stop)
+    finally:
+        pg_conn.close()
+
+
+def backfill_clickhouse(start, end, chunk_size=DEFAULT_CHUNK_SIZE, queue_depth=DEFAULT_QUEUE_DEPTH, set_watermark=False):
+    """
+    Backfill vessel_arrivals_analytics for a date range
+
+    A reader thread streams one month partition at a time from PostgreSQL
+    while the caller's thread inserts the previous chunk into ClickHouse,
+    with a bounded queue between them. The rollups are rebuilt for each
+    month once it has been copied.
+
+    Runs under the incremental sync's job lock (waiting for a running sync
+    to finish): both rebuild rollups through the same staging tables and
+    write the same watermark.
+
+    Args:
+        start: First date to copy
+        end: Last date to copy (inclusive)
+        chunk_size: Rows per fetch/insert round
+        queue_depth: Chunks buffered between reader and writer
+        set_watermark: Start the incremental sync from this backfill
+            (sets its watermark to when the backfill started)
+
+    Returns:
+        Number of rows copied
+    """
+    with job_lock(SYNC_JOB_NAME, wait=True):
+        return _backfill(start, end, chunk_size, queue_depth, set_watermark)
+
+
+def _backfill(start, end, chunk_size, queue_depth, set_watermark):
+    """backfill_clickhouse, with the sync's job lock held"""
+    ch_client = connect_clickhouse()
+
+    # Rows updated after this point are left to the incremental sync
+    with psycopg2.connect(os.getenv('DATABASE_URL')) as pg_conn:
+        with pg_conn.cursor() as cursor:
+            cursor.execute("SELECT NOW()")
+            started_at = cursor.fetchone()[0]
+    pg_conn.close()
+
+    print(f"Backfilling {start} → {end} (chunk size {chunk_size}, queue depth {queue_depth})")
+
+    chunks = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_partitions,
+        args=(start, end, chunk_size, chunks, stop),
+        daemon=True
+    )
+    reader.start()
+
+    total_rows = 0
+    month_rows = 0
+    run_started = month_started = time.monotonic()
+
+    try:
+        while True:
+            kind, partition, payload = chunks.get()
+
+            if kind == 'rows':
+                ch_client.execute(INSERT_ANALYTICS_SQL, payload, columnar=True)
+                month_rows += len(payload[0])
+
+            elif kind == _MONTH_DONE:
+                if month_rows:
+                    rebuild_rollups(ch_client, {partition})
+                elapsed = time.monotonic() - month_started
+                print(f"  ✅ {partition}: {month_rows} rows in {elapsed:.1f}s "
+                      f"({month_rows / elapsed if elapsed > 0 else 0:,.0f} rows/s)")
+                total_rows += month_rows
+                month_rows = 0
+                month_started = time.monotonic()
+
+            elif kind == _FAILED:
+                raise payload
+
+            else:
+                break
+    finally:
+        # Unblocks the reader if the writer failed
+        stop.set()
+        reader.join()
+
+    elapsed = time.monotonic() - run_started
+    print(f"✅ Backfilled {total_rows} rows in {elapsed:.1f}s "
+          f"({total_rows / elapsed if elapsed > 0 else 0:,.0f} rows/s)")
+
+    if set_watermark:
+        watermark, pending_partitions = get_sync_state(ch_client, SYNC_JOB_NAME)
+        watermark = max(watermark, started_at)
+        set_sync_state(ch_client, SYNC_JOB_NAME, watermark, pending_partitions)
+        print(f"Incremental sync watermark set to {watermark}")
+
+    if total_rows:
+        invalidate_analytics_cache()
+
+    return total_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill ClickHouse from PostgreSQL by month partition")
+    parser.add_argument('--start', type=date.fromisoformat, required=True, help="First date (YYYY-MM-DD)")
+    parser.add_argument('--end', type=date.fromisoformat, default=date.today(), help="Last date (YYYY-MM-DD, default today)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH)
+    parser.add_argument('--set-watermark', action='store_true',
+                        help="Start the incremental sync from the time this backfill began")
+    args = parser.parse_args()
+
+    backfill_clickhouse(args.start, args.end, args.chunk_size, args.queue_depth, args.set_watermark)
@@ -0,0 +1,168 @@
+"""
+ClickHouse Helpers
+Shared connection, sync-state and rollup maintenance for the ClickHouse jobs
+"""
+import os
+from datetime import datetime
+
+import pytz
+from clickhouse_driver import Client
+from dotenv import load_dotenv
+
+load_dotenv()
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+# Columns synced into vessel_arrivals_analytics, in insert order
+ANALYTICS_COLUMNS = [
+    'date', 'chokepoint', 'vessel_count', 'container', 'dry_bulk',
+    'general_cargo', 'roro', 'tanker', 'collected_at', 'updated_at'
+]
+
+INSERT_ANALYTICS_SQL = f"""
+    INSERT INTO vessel_arrivals_analytics
+    ({', '.join(ANALYTICS_COLUMNS)})
+    VALUES
+"""
+
+# Rebuilds one month of the rollup from deduplicated raw rows
+MONTHLY_SUMMARY_SELECT = """
+    SELECT
+        toStartOfMonth(date) as month,
+        chokepoint,
+        sum(toUInt64(vessel_count)),
+        avgState(vessel_count),
+        maxState(vessel_count),
+        minState(vessel_count),
+        sum(toUInt64(container)),
+        sum(toUInt64(dry_bulk)),
+        sum(toUInt64(general_cargo)),
+        sum(toUInt64(roro)),
+        sum(toUInt64(tanker))
+    FROM vessel_arrivals_analytics FINAL
+    WHERE toYYYYMM(date) = %(partition)s
+    GROUP BY month, chokepoint
+"""
+
+# Rebuilds the weeks starting in one month; their days may reach into the next
+WEEKLY_SUMMARY_SELECT = """
+    SELECT
+        toMonday(date) as week,
+        chokepoint,
+        sum(toUInt64(vessel_count)),
+        avgState(vessel_count),
+        maxState(vessel_count),
+        minState(vessel_count),
+        sum(toUInt64(container)),
+        sum(toUInt64(dry_bulk)),
+        sum(toUInt64(general_cargo)),
+        sum(toUInt64(roro)),
+        sum(toUInt64(tanker))
+    FROM vessel_arrivals_analytics FINAL
+    WHERE toYYYYMM(date) IN (%(partition)s, %(next_partition)s)
+      AND toYYYYMM(toMonday(date)) = %(partition)s
+    GROUP BY week, chokepoint
+"""
+
+
+def connect_clickhouse():
+    """Connect to ClickHouse over the native protocol"""
+    url = os.getenv('CLICKHOUSE_NATIVE_URL') or os.getenv('CLICKHOUSE_URL')
+    return Client.from_url(url)
+
+
+def get_sync_state(ch_client, job):
+    """
+    Get the persisted sync state of a job
+
+    Returns:
+        (watermark, pending_partitions): the updated_at watermark (EPOCH if
+        the job never ran) and YYYYMM partitions whose rollup still needs
+        rebuilding
+    """
+    rows = ch_client.execute("""
+        SELECT watermark, pending_partitions
+        FROM etl_sync_state FINAL
+        WHERE job = %(job)s
+    """, {'job': job})
+
+    if not rows:
+        return EPOCH, set()
+
+    watermark, pending = rows[0]
+    if watermark.tzinfo is None:
+        watermark = pytz.UTC.localize(watermark)
+    return watermark, set(pending)
+
+
+def set_sync_state(ch_client, job, watermark, pending_partitions):
+    """Persist the sync state of a job"""
+    ch_client.execute(
+        "INSERT INTO etl_sync_state (job, watermark, pending_partitions) VALUES",
+        [(job, watermark, sorted(pending_partitions))]
+    )
+
+
+def rebuild_monthly_summary(ch_client, partitions):
+    """
+    Recompute monthly_summary for the given YYYYMM partitions
+
+    monthly_summary_mv aggregates every inserted block, so rows re-synced
+    into the ReplacingMergeTree would be counted twice. Each month is
+    rebuilt from deduplicated (FINAL) raw rows into a staging table and
+    swapped in atomically with REPLACE PARTITION.
+    """
+    if not partitions:
+        return
+
+    ch_client.execute("CREATE TABLE IF NOT EXISTS monthly_summary_rebuild AS monthly_summary")
+
+    for partition in sorted(partitions):
+        ch_client.execute("TRUNCATE TABLE monthly_summary_rebuild")
+        ch_client.execute(
+            "INSERT INTO monthly_summary_rebuild " + MONTHLY_SUMMARY_SELECT,
+            {'partition': partition}
+        )
+        ch_client.execute(f"ALTER TABLE monthly_summary REPLACE PARTITION {int(partition)} FROM monthly_summary_rebuild")
+
+    print(f"🔁 Rebuilt monthly_summary for {len(partitions)} months")
+
+
+def _shift_partition(partition, months):
+    """Move a YYYYMM partition by a number of months"""
+    index = (int(partition) // 100) * 12 + int(partition) % 100 - 1 + months
+    return (index // 12) * 100 + index % 12 + 1
+
+
+def rebuild_weekly_summary(ch_client, partitions):
+    """
+    Recompute weekly_summary for weeks touching the given YYYYMM partitions
+
+    weekly_summary is partitioned by the month a week starts in, so rows
+    changed early in a month can belong to a week of the previous month's
+    partition; both are rebuilt, the same way as rebuild_monthly_summary.
+    """
+    if not partitions:
+        return
+
+    weekly_partitions = set()
+    for partition in partitions:
+        weekly_partitions.update((int(partition), _shift_partition(partition, -1)))
+
+    ch_client.execute("CREATE TABLE IF NOT EXISTS weekly_summary_rebuild AS weekly_summary")
+
+    for partition in sorted(weekly_partitions):
+        ch_client.execute("TRUNCATE TABLE weekly_summary_rebuild")
+        ch_client.execute(
+            "INSERT INTO weekly_summary_rebuild " + WEEKLY_SUMMARY_SELECT,
+            {'partition': partition, 'next_partition': _shift_partition(partition, 1)}
+        )
+        ch_client.execute(f"ALTER TABLE weekly_summary REPLACE PARTITION {partition} FROM weekly_summary_rebuild")
+
+    print(f"🔁 Rebuilt weekly_summary for {len(weekly_partitions)} months")
+
+
+def rebuild_rollups(ch_client, partitions):
+    """Recompute all rollups (monthly_summary, weekly_summary) for the given YYYYMM partitions"""
+    rebuild_monthly_summary(ch_client, partitions)
+    rebuild_weekly_summary(ch_client, partitions)
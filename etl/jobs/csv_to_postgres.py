@@ -7,9 +7,10 @@ from pathlib import Path
 
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_batch
 from dotenv import load_dotenv
 
+from bulk_loader import bulk_upsert
+
 load_dotenv()
 
 def load_csv_to_postgres():
@@ -17,7 +18,6 @@ def load_csv_to_postgres():
 
     # Database connection
     conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-    cursor = conn.cursor()
 
     # Find all CSV files from SeeSeaIntelligence repo
     # Path: ../../SeeSeaIntelligence/processed/logistics/chokepoints/
@@ -39,36 +39,8 @@ def load_csv_to_postgres():
             # Read CSV
             df = pd.read_csv(csv_file)
 
-            # Prepare batch data
-            records = []
-            for _, row in df.iterrows():
-                records.append((
-                    row['date'],
-                    row['chokepoint'],
-                    int(row['vessel_count']),
-                    int(row['container']),
-                    int(row['dry_bulk']),
-                    int(row['general_cargo']),
-                    int(row['roro']),
-                    int(row['tanker']),
-                    row['collected_at']
-                ))
-
-            # Batch insert for better performance
-            execute_batch(cursor, """
-                INSERT INTO vessel_arrivals
-                (date, chokepoint, vessel_count, container, dry_bulk,
-                 general_cargo, roro, tanker, collected_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (date, chokepoint) DO UPDATE SET
-                    vessel_count = EXCLUDED.vessel_count,
-                    container = EXCLUDED.container,
-                    dry_bulk = EXCLUDED.dry_bulk,
-                    general_cargo = EXCLUDED.general_cargo,
-                    roro = EXCLUDED.roro,
-                    tanker = EXCLUDED.tanker,
-                    collected_at = EXCLUDED.collected_at
-            """, records, page_size=100)
+            # Bulk upsert through COPY + staging table
+            bulk_upsert(conn, df)
 
             conn.commit()
             total_records += len(df)
@@ -79,7 +51,6 @@ def load_csv_to_postgres():
             print(f"❌ Error processing {csv_file.name}: {str(e)}")
             raise
 
-    cursor.close()
     conn.close()
 
     print(f"✅ Successfully loaded {total_records} total records from {len(csv_files)} CSV files to PostgreSQL")
@@ -1,19 +1,45 @@
 """
 Incremental CSV to PostgreSQL ETL Job
-Only processes new/updated records based on collected_at timestamp
+Only processes new/updated records: unchanged files are skipped via the
+ingestion manifest, appended rows are read from the last consumed offset,
+and full reads are filtered on the collected_at timestamp
 """
+import io
 import os
+import sys
+import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import NamedTuple, Optional
 import pytz
 
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
 
+from bulk_loader import bulk_upsert
+from ingest_manifest import IngestManifest, read_changes
+
 load_dotenv()
 
+# Parallel workers for CSV parsing and upserts (1 = sequential)
+DEFAULT_WORKERS = int(os.getenv('ETL_INGEST_WORKERS', '4'))
+
+# Vessel arrival CSVs, relative to the chokepoints directory
+CSV_PATTERN = '*/vessel_arrivals/vessel_arrivals.csv'
+
+
+class FileResult(NamedTuple):
+    """Outcome of syncing one CSV file"""
+    csv_file: Path
+    chokepoint: Optional[str]
+    status: str  # 'synced', 'unchanged', 'empty' or 'failed'
+    records: int = 0
+    error: Optional[str] = None
+
+
 def get_last_sync_time(cursor, chokepoint):
     """Get the last sync timestamp for a chokepoint"""
     cursor.execute("""
@@ -29,14 +55,8 @@ def get_last_sync_time(cursor, chokepoint):
     return result
 
 
-def load_incremental_csv_to_postgres():
-    """Load only new/updated CSV data to PostgreSQL"""
-
-    # Database connection
-    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-    cursor = conn.cursor()
-
-    # Find all CSV files from SeeSeaIntelligence repo
+def find_chokepoints_dir():
+    """Find the chokepoints directory of the SeeSeaIntelligence repo"""
     # Try Docker mount path first, then fall back to local development path
     docker_path = Path('/data/processed/logistics/chokepoints')
     local_path = Path(__file__).parent.parent.parent.parent / 'SeeSeaIntelligence' / 'processed' / 'logistics' / 'chokepoints'
@@ -50,87 +70,217 @@ def load_incremental_csv_to_postgres():
     else:
         raise FileNotFoundError(f"CSV directory not found. Tried: {docker_path} and {local_path}")
 
-    csv_files = list(base_path.glob('*/vessel_arrivals/vessel_arrivals.csv'))
+    return base_path
 
-    print(f"[{datetime.now()}] Found {len(csv_files)} CSV files")
 
-    total_new_records = 0
-    total_updated_records = 0
+def find_csv_files():
+    """Find all vessel arrival CSV files from the SeeSeaIntelligence repo"""
+    return list(find_chokepoints_dir().glob(CSV_PATTERN))
 
-    for csv_file in csv_files:
-        try:
-            # Read CSV
-            df = pd.read_csv(csv_file)
 
-            if df.empty:
-                continue
+def read_csv_file(csv_file, entry=None):
+    """
+    Read and parse the unconsumed part of a vessel arrivals CSV (runs in worker processes)
+
+    Args:
+        csv_file: Path to the CSV
+        entry: Manifest entry from the previous run, or None to read everything
 
-            # Get chokepoint name from first row
-            chokepoint = df.iloc[0]['chokepoint']
+    Returns:
+        (df, new_entry, is_delta), see ingest_manifest.read_changes
+    """
+    data, new_entry, is_delta = read_changes(csv_file, entry)
+    df = pd.read_csv(io.BytesIO(data))
 
-            # Get last sync time for this chokepoint
+    # Convert collected_at to datetime for filtering
+    df['collected_at_dt'] = pd.to_datetime(df['collected_at'])
+    return df, new_entry, is_delta
+
+
+def sync_csv_file(conn, csv_file, df, is_delta=False):
+    """
+    Upsert the new/updated rows of one parsed CSV and commit
+
+    Rows appended since the previous run (is_delta) are all new, so the
+    collected_at watermark is only queried for full reads.
+    Raises on database errors; the caller is responsible for rollback.
+    """
+    if df.empty:
+        return FileResult(csv_file, None, 'empty')
+
+    # Get chokepoint name from first row
+    chokepoint = df.iloc[0]['chokepoint']
+
+    if is_delta:
+        new_df = df
+    else:
+        # Get last sync time for this chokepoint
+        with conn.cursor() as cursor:
             last_sync = get_last_sync_time(cursor, chokepoint)
 
-            # Convert collected_at to datetime for filtering
-            df['collected_at_dt'] = pd.to_datetime(df['collected_at'])
-
-            # Filter only new/updated records
-            new_df = df[df['collected_at_dt'] > last_sync]
-
-            if new_df.empty:
-                print(f"  ⏭️  {chokepoint}: No new data since {last_sync}")
-                continue
-
-            print(f"  📥 {chokepoint}: Processing {len(new_df)} new/updated records")
-
-            # Prepare batch data
-            records = []
-            for _, row in new_df.iterrows():
-                records.append((
-                    row['date'],
-                    row['chokepoint'],
-                    int(row['vessel_count']),
-                    int(row['container']),
-                    int(row['dry_bulk']),
-                    int(row['general_cargo']),
-                    int(row['roro']),
-                    int(row['tanker']),
-                    row['collected_at']
-                ))
-
-            # Batch insert/update
-            execute_batch(cursor, """
-                INSERT INTO vessel_arrivals
-                (date, chokepoint, vessel_count, container, dry_bulk,
-                 general_cargo, roro, tanker, collected_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (date, chokepoint) DO UPDATE SET
-                    vessel_count = EXCLUDED.vessel_count,
-                    container = EXCLUDED.container,
-                    dry_bulk = EXCLUDED.dry_bulk,
-                    general_cargo = EXCLUDED.general_cargo,
-                    roro = EXCLUDED.roro,
-                    tanker = EXCLUDED.tanker,
-                    collected_at = EXCLUDED.collected_at,
-                    updated_at = NOW()
-            """, records, page_size=100)
-
-            conn.commit()
-            total_new_records += len(new_df)
-            print(f"  ✅ {chokepoint}: Synced {len(new_df)} records")
-
-        except Exception as e:
+        # Filter only new/updated records
+        new_df = df[df['collected_at_dt'] > last_sync]
+
+    if new_df.empty:
+        print(f"  ⏭️  {chokepoint}: No new data")
+        return FileResult(csv_file, chokepoint, 'unchanged')
+
+    print(f"  📥 {chokepoint}: Processing {len(new_df)} new/updated records")
+
+    # Bulk upsert through COPY + staging table
+    bulk_upsert(conn, new_df)
+
+    conn.commit()
+    print(f"  ✅ {chokepoint}: Synced {len(new_df)} records")
+    return FileResult(csv_file, chokepoint, 'synced', len(new_df))
+
+
+def _load_sequential(csv_files, manifest):
+    """
+    Sync files one by one on a single connection
+
+    A failing file is rolled back and recorded; the remaining files are
+    still synced.
+    """
+    conn = psycopg2.connect(os.getenv('DATABASE_URL'))
+    results = []
+
+    try:
+        for csv_file in csv_files:
+            try:
+                df, new_entry, is_delta = read_csv_file(csv_file, manifest.get(csv_file))
+                results.append(sync_csv_file(conn, csv_file, df, is_delta))
+                manifest.update(csv_file, new_entry)
+            except Exception as e:
+                conn.rollback()
+                print(f"  ❌ Error processing {csv_file.parent.parent.name}: {str(e)}")
+                results.append(FileResult(csv_file, None, 'failed', error=str(e)))
+    finally:
+        conn.close()
+
+    return results
+
+
+def _load_concurrent(csv_files, workers, manifest):
+    """
+    Parse CSVs in a process pool and upsert them through a connection pool
+
+    Each chokepoint is committed on its own connection; a failing file is
+    recorded and does not stop the others.
+    """
+    db_pool = ThreadedConnectionPool(1, workers, os.getenv('DATABASE_URL'))
+    results = []
+
+    def upsert(csv_file, df, is_delta):
+        conn = db_pool.getconn()
+        try:
+            return sync_csv_file(conn, csv_file, df, is_delta)
+        except Exception:
             conn.rollback()
-            print(f"  ❌ Error processing {csv_file.name}: {str(e)}")
             raise
+        finally:
+            db_pool.putconn(conn)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as parsers, \
+                ThreadPoolExecutor(max_workers=workers) as upserters:
+            parse_futures = {
+                parsers.submit(read_csv_file, f, manifest.get(f)): f
+                for f in csv_files
+            }
+            upsert_futures = {}
+
+            # Start each upsert as soon as its CSV has been parsed
+            for future in as_completed(parse_futures):
+                csv_file = parse_futures[future]
+                try:
+                    df, new_entry, is_delta = future.result()
+                    upsert_futures[upserters.submit(upsert, csv_file, df, is_delta)] = (csv_file, new_entry)
+                except Exception as e:
+                    print(f"  ❌ Error parsing {csv_file.parent.parent.name}: {str(e)}")
+                    results.append(FileResult(csv_file, None, 'failed', error=str(e)))
+
+            for future in as_completed(upsert_futures):
+                csv_file, new_entry = upsert_futures[future]
+                try:
+                    results.append(future.result())
+                    manifest.update(csv_file, new_entry)
+                except Exception as e:
+                    print(f"  ❌ Error processing {csv_file.parent.parent.name}: {str(e)}")
+                    results.append(FileResult(csv_file, None, 'failed', error=str(e)))
+    finally:
+        db_pool.closeall()
+
+    return results
+
 
-    cursor.close()
-    conn.close()
+def load_incremental_csv_to_postgres(csv_files=None, workers=DEFAULT_WORKERS, use_manifest=True):
+    """
+    Load only new/updated CSV data to PostgreSQL
 
-    if total_new_records > 0:
+    Args:
+        csv_files: CSV files to sync (default: all chokepoint CSVs)
+        workers: Parallel parse/upsert workers; 1 runs sequentially
+        (files unchanged since the previous run are skipped either way)
+        use_manifest: False re-reads every file in full (e.g. after a
+            database restore); the manifest is rebuilt from this run
+
+    Returns:
+        List of FileResult, one per CSV file; files that failed have
+        status 'failed' and do not stop the others from being committed
+    """
+    if csv_files is None:
+        csv_files = find_csv_files()
+
+    print(f"[{datetime.now()}] Found {len(csv_files)} CSV files")
+
+    # Files whose size and mtime match the manifest are skipped unopened
+    manifest = IngestManifest()
+    if not use_manifest:
+        manifest.entries = {}
+
+    results = []
+    changed_files = []
+    for csv_file in csv_files:
+        if manifest.is_unchanged(csv_file):
+            results.append(FileResult(csv_file, csv_file.parent.parent.name, 'unchanged'))
+        else:
+            changed_files.append(csv_file)
+
+    if len(changed_files) < len(csv_files):
+        print(f"  ⏭️  {len(csv_files) - len(changed_files)} unchanged files skipped")
+
+    try:
+        if workers > 1 and len(changed_files) > 1:
+            results += _load_concurrent(changed_files, min(workers, len(changed_files)), manifest)
+        else:
+            results += _load_sequential(changed_files, manifest)
+    finally:
+        # Record every file committed so far, even if a later one failed
+        manifest.save()
+
+    total_new_records = sum(r.records for r in results)
+    failed = [r for r in results if r.status == 'failed']
+
+    if failed:
+        names = ', '.join(r.csv_file.parent.parent.name for r in failed)
+        print(f"[{datetime.now()}] ⚠️  Incremental sync finished with errors: "
+              f"{total_new_records} records synced, {len(failed)} files failed ({names})")
+    elif total_new_records > 0:
         print(f"[{datetime.now()}] ✅ Incremental sync completed: {total_new_records} new/updated records")
     else:
         print(f"[{datetime.now()}] ✅ No new data to sync")
 
+    return results
+
 if __name__ == "__main__":
-    load_incremental_csv_to_postgres()
+    parser = argparse.ArgumentParser(description="Incremental CSV → PostgreSQL sync")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Parallel parse/upsert workers (1 = sequential)")
+    parser.add_argument('--ignore-manifest', action='store_true',
+                        help="Re-read every CSV in full instead of only changed/appended data")
+    args = parser.parse_args()
+
+    results = load_incremental_csv_to_postgres(workers=args.workers, use_manifest=not args.ignore_manifest)
+    if any(r.status == 'failed' for r in results):
+        sys.exit(1)
@@ -0,0 +1,128 @@
+"""
+Ingestion Manifest
+Persists per-file fingerprints so unchanged CSVs are skipped and
+append-only growth is read from the last consumed byte offset
+"""
+import os
+import json
+import hashlib
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MANIFEST_PATH = Path(os.getenv(
+    'ETL_MANIFEST_PATH',
+    str(Path(__file__).parent.parent / 'state' / 'ingest_manifest.json')
+))
+
+# Chunk size for hashing the consumed region
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint(f, offset):
+    """
+    sha256 of f[0:offset], the region consumed so far
+
+    The whole region is hashed, so any in-place edit (a corrected row, a
+    new header) is detected while appending leaves it unchanged. Returns
+    the hash object, which can be extended with the appended bytes.
+    """
+    digest = hashlib.sha256()
+    f.seek(0)
+    remaining = offset
+    while remaining > 0:
+        chunk = f.read(min(remaining, FINGERPRINT_CHUNK_SIZE))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest
+
+
+def read_changes(csv_file, entry):
+    """
+    Read the part of a CSV that has not been consumed yet
+
+    Only complete lines are consumed; a partially written last line is
+    left for the next run.
+
+    Args:
+        csv_file: Path to the CSV
+        entry: Manifest entry from the previous run, or None
+
+    Returns:
+        (data, new_entry, is_delta): CSV bytes including the header line,
+        the manifest entry to store once data is committed, and whether
+        data holds only rows appended since the previous run
+    """
+    with open(csv_file, 'rb') as f:
+        stat = os.fstat(f.fileno())
+
+        digest = None
+        if entry is not None and stat.st_size >= entry['offset']:
+            digest = fingerprint(f, entry['offset'])
+        is_delta = digest is not None and digest.hexdigest() == entry['fingerprint']
+
+        if is_delta:
+            header = entry['header'].encode()
+            body = f.read()
+            start = entry['offset']
+        else:
+            f.seek(0)
+            body = f.read()
+            header_end = body.find(b'\n') + 1
+            header, body = body[:header_end], body[header_end:]
+            start = header_end
+            digest = hashlib.sha256(header)
+
+        # Stop at the last complete line
+        body = body[:body.rfind(b'\n') + 1]
+        offset = start + len(body)
+        digest.update(body)
+
+        new_entry = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'offset': offset,
+            'fingerprint': digest.hexdigest(),
+            'header': header.decode(),
+        }
+
+    return header + body, new_entry, is_delta
+
+
+class IngestManifest:
+    """JSON manifest of consumed CSV files, keyed by absolute path"""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = Path(path)
+        self.entries = {}
+
+        if self.path.exists():
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def get(self, csv_file):
+        return self.entries.get(str(Path(csv_file).resolve()))
+
+    def update(self, csv_file, entry):
+        self.entries[str(Path(csv_file).resolve())] = entry
+
+    def is_unchanged(self, csv_file):
+        """True if size and mtime match the last run (the file is not opened)"""
+        entry = self.get(csv_file)
+        if entry is None:
+            return False
+
+        stat = os.stat(csv_file)
+        return stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']
+
+    def save(self):
+        """Write the manifest atomically"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
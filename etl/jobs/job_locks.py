@@ -0,0 +1,41 @@
+"""
+Job Locks
+Cross-process locks that keep ETL jobs touching the same ClickHouse state
+(watermarks, rollup staging tables) from running at the same time
+"""
+import os
+import fcntl
+from pathlib import Path
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STATE_DIR = Path(os.getenv('ETL_STATE_DIR', str(Path(__file__).parent.parent / 'state')))
+
+
+@contextmanager
+def job_lock(name, wait=False):
+    """
+    Cross-process lock for a job
+
+    Yields True if the lock was acquired, False if another run (in this or
+    any other process, e.g. a manual run or the watcher) holds it. With
+    wait=True, blocks until the other run releases it instead.
+    """
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(STATE_DIR / f'{name}.lock', 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            if not wait:
+                yield False
+                return
+            print(f"⏳ Waiting for the running {name} job to finish...")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
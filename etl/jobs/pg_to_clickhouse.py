@@ -1,56 +1,153 @@
 """
 PostgreSQL to ClickHouse Sync
-Syncs data from PostgreSQL to ClickHouse for analytics
+Incrementally syncs rows changed since the last run (by updated_at) from
+PostgreSQL to ClickHouse for analytics
 """
 import os
+import argparse
 import psycopg2
-from clickhouse_driver import Client
+import pytz
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+from cache_invalidation import invalidate_analytics_cache
+from clickhouse_common import (
+    EPOCH, INSERT_ANALYTICS_SQL, connect_clickhouse,
+    get_sync_state, set_sync_state, rebuild_rollups
+)
 
 load_dotenv()
 
-def sync_to_clickhouse():
-    """Sync PostgreSQL data to ClickHouse"""
+JOB_NAME = 'pg_to_clickhouse'
+
+# Rows fetched from the server-side cursor and inserted per round
+DEFAULT_CHUNK_SIZE = int(os.getenv('ETL_SYNC_CHUNK_SIZE', '10000'))
+
+# Re-read rows this far behind the watermark, to catch transactions that
+# committed after a later one with a smaller NOW(). Rows of the overlap that
+# ClickHouse already has (same updated_at) are skipped, see synced_versions.
+WATERMARK_OVERLAP = timedelta(seconds=int(os.getenv('ETL_SYNC_OVERLAP_SECONDS', '600')))
+
+
+def _micros(timestamp):
+    """updated_at as integer microseconds since the epoch (naive values are UTC)"""
+    if timestamp.tzinfo is None:
+        timestamp = pytz.UTC.localize(timestamp)
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def synced_versions(ch_client, since, until):
+    """
+    Row versions already in ClickHouse with since <= updated_at <= until
+
+    Returns:
+        Set of (chokepoint, date, updated_at microseconds)
+    """
+    rows = ch_client.execute("""
+        SELECT chokepoint, date, updated_at
+        FROM vessel_arrivals_analytics
+        WHERE updated_at >= %(since)s AND updated_at <= %(until)s
+    """, {'since': since, 'until': until})
+    return {(chokepoint, day, _micros(updated_at)) for chokepoint, day, updated_at in rows}
+
+
+def sync_to_clickhouse(chunk_size=DEFAULT_CHUNK_SIZE, full=False):
+    """
+    Sync PostgreSQL rows changed since the persisted watermark to ClickHouse
+
+    Rows are streamed in updated_at order through a server-side cursor and
+    inserted chunk by chunk; the watermark is persisted after every chunk,
+    so an interrupted run resumes where it stopped.
+
+    Rows re-read through WATERMARK_OVERLAP are only synced if ClickHouse
+    does not have that version yet (a late commit), so a run without
+    changes inserts nothing, rebuilds no rollups, keeps the analytics cache
+    (and its data version) and returns 0.
+
+    Args:
+        chunk_size: Rows per fetch/insert round
+        full: Ignore the watermark and resync every row
+
+    Returns:
+        Number of new or changed rows synced
+    """
+
+    # Connect to ClickHouse
+    ch_client = connect_clickhouse()
+
+    watermark, pending_partitions = get_sync_state(ch_client, JOB_NAME)
+    if full:
+        watermark = EPOCH
+    since = max(EPOCH, watermark - WATERMARK_OVERLAP)
+    previous_watermark = watermark
+    already_synced = synced_versions(ch_client, since, previous_watermark) if not full else set()
+
+    print(f"Syncing rows updated since {since}")
 
     # Connect to PostgreSQL
     pg_conn = psycopg2.connect(os.getenv('DATABASE_URL'))
-    pg_cursor = pg_conn.cursor()
+    total_rows = 0
 
-    # Connect to ClickHouse
-    ch_client = Client.from_url(os.getenv('CLICKHOUSE_URL'))
+    try:
+        # Named (server-side) cursor: rows are streamed, never fully materialized
+        with pg_conn.cursor(name='pg_to_clickhouse_sync') as pg_cursor:
+            pg_cursor.itersize = chunk_size
+            pg_cursor.execute("""
+                SELECT date, chokepoint, vessel_count, container, dry_bulk,
+                       general_cargo, roro, tanker, collected_at, updated_at
+                FROM vessel_arrivals
+                WHERE updated_at >= %s
+                ORDER BY updated_at
+            """, (since,))
 
-    # Get yesterday's data
-    yesterday = (datetime.now() - timedelta(days=1)).date()
+            while True:
+                rows = pg_cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
 
-    print(f"Syncing data for {yesterday}")
+                # Skip versions synced by a previous run (re-read through the overlap)
+                changed = [
+                    row for row in rows
+                    if row[-1] > previous_watermark
+                    or (row[1], row[0], _micros(row[-1])) not in already_synced
+                ]
 
-    # Fetch data from PostgreSQL
-    pg_cursor.execute("""
-        SELECT date, chokepoint, vessel_count, container, dry_bulk,
-               general_cargo, roro, tanker, collected_at
-        FROM vessel_arrivals
-        WHERE date = %s
-    """, (yesterday,))
+                # Insert into ClickHouse
+                if changed:
+                    ch_client.execute(INSERT_ANALYTICS_SQL, changed)
 
-    rows = pg_cursor.fetchall()
+                total_rows += len(changed)
+                pending_partitions.update(row[0].year * 100 + row[0].month for row in changed)
+                watermark = max(watermark, rows[-1][-1])
+                set_sync_state(ch_client, JOB_NAME, watermark, pending_partitions)
+    finally:
+        pg_conn.close()
 
-    if not rows:
-        print(f"No data found for {yesterday}")
-        return
+    # Also finishes rollups left pending by an interrupted run
+    rebuilt = bool(pending_partitions)
+    if rebuilt:
+        rebuild_rollups(ch_client, pending_partitions)
+        set_sync_state(ch_client, JOB_NAME, watermark, set())
 
-    # Insert into ClickHouse
-    ch_client.execute("""
-        INSERT INTO vessel_arrivals_analytics
-        (date, chokepoint, vessel_count, container, dry_bulk,
-         general_cargo, roro, tanker, collected_at)
-        VALUES
-    """, rows)
+    if total_rows == 0:
+        print(f"No changes since {since}")
+        # The interrupted run's rows (and rollups) changed results all the same
+        if rebuilt:
+            invalidate_analytics_cache()
+        return 0
 
-    print(f"✅ Synced {len(rows)} records to ClickHouse")
+    print(f"✅ Synced {total_rows} records to ClickHouse (watermark {watermark})")
 
-    pg_cursor.close()
-    pg_conn.close()
+    # Cached analytics results are stale now
+    invalidate_analytics_cache()
+
+    return total_rows
 
 if __name__ == "__main__":
-    sync_to_clickhouse()
+    parser = argparse.ArgumentParser(description="PostgreSQL → ClickHouse incremental sync")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignore the watermark and resync every row")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    sync_to_clickhouse(chunk_size=args.chunk_size, full=args.full)
@@ -1,60 +1,283 @@
 """
 ETL Scheduler
-Runs daily data synchronization tasks
+Runs data synchronization jobs as a small pipeline: jobs are locked against
+overlapping runs, downstream jobs are triggered when an upstream job
+changed data, missed runs are caught up, and run metrics are exported
+to Prometheus. In watch mode changed CSVs are ingested within seconds,
+with the hourly run kept as a safety sweep.
 """
 import os
 import sys
+import json
+import time
 from pathlib import Path
+from typing import NamedTuple, Tuple
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 
 # Add jobs directory to path
 sys.path.insert(0, str(Path(__file__).parent / 'jobs'))
 
+from job_locks import STATE_DIR, job_lock
+
 load_dotenv()
 
-def csv_to_postgres():
-    """Sync CSV files to PostgreSQL (incremental)"""
-    print(f"[{datetime.now()}] Running incremental CSV → PostgreSQL sync...")
-    try:
-        from jobs.incremental_csv_to_postgres import load_incremental_csv_to_postgres
-        load_incremental_csv_to_postgres()
-        print(f"[{datetime.now()}] ✅ Incremental CSV sync completed")
-    except Exception as e:
-        print(f"[{datetime.now()}] ❌ CSV sync failed: {str(e)}")
+SCHEDULER_STATE_PATH = STATE_DIR / 'scheduler_state.json'
+
+METRICS_PORT = int(os.getenv('ETL_METRICS_PORT', '9102'))
+
+# Missed runs within this window still run (once, coalesced) when the scheduler wakes up
+MISFIRE_GRACE_SECONDS = int(os.getenv('ETL_MISFIRE_GRACE_SECONDS', '3600'))
+
+# Run stale jobs immediately at startup (e.g. after the container was down)
+CATCH_UP_ON_START = os.getenv('ETL_CATCH_UP_ON_START', 'true').lower() == 'true'
+
+# Ingest CSVs as soon as they are written (see watcher.py)
+WATCH_ENABLED = os.getenv('ETL_WATCH', 'false').lower() == 'true'
+
+JOB_DURATION = Histogram(
+    'etl_job_duration_seconds', 'ETL job run duration', ['job'],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+)
+JOB_ROWS = Histogram(
+    'etl_job_rows', 'Rows written per ETL job run', ['job'],
+    buckets=(0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+)
+JOB_RUNS = Counter('etl_job_runs_total', 'ETL job runs by outcome', ['job', 'status'])
+JOB_LAST_SUCCESS = Gauge('etl_job_last_success_timestamp_seconds', 'Unix time of the last successful run', ['job'])
+
+
+class JobResult(NamedTuple):
+    """Rows a job committed, and the errors of the parts of it that failed"""
+    rows: int
+    errors: Tuple[str, ...] = ()
+
+
+def csv_to_postgres(csv_files=None):
+    """Sync CSV files to PostgreSQL (incremental; all chokepoints by default)"""
+    from jobs.incremental_csv_to_postgres import load_incremental_csv_to_postgres
+    results = load_incremental_csv_to_postgres(csv_files=csv_files)
+    errors = tuple(
+        f"{r.csv_file.parent.parent.name}: {r.error}"
+        for r in results if r.status == 'failed'
+    )
+    return JobResult(sum(r.records for r in results), errors)
 
 def pg_to_clickhouse():
     """Sync PostgreSQL to ClickHouse"""
-    print(f"[{datetime.now()}] Running PostgreSQL → ClickHouse sync...")
+    from jobs.pg_to_clickhouse import sync_to_clickhouse
+    return sync_to_clickhouse()
+
+
+class Pipeline:
+    """
+    Runs registered jobs on a scheduler and chains them
+
+    A job's downstream jobs are queued right after it commits a non-zero
+    row count (even if other parts of the run failed), so consumers never
+    run ahead of their producers.
+    """
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.jobs = {}
+        self.state = self._load_state()
+        # Triggered jobs that found themselves running; rerun once the current run ends
+        self.rerun = set()
+
+    def register(self, name, func, description, trigger=None, max_staleness=None, downstream=()):
+        """
+        Register a job
+
+        Args:
+            name: Job id
+            func: Callable returning the number of rows written, or a
+                JobResult when parts of the job can fail independently
+            description: Human-readable job name
+            trigger: Optional APScheduler trigger for scheduled runs
+            max_staleness: timedelta after which the job is caught up at startup
+            downstream: Job ids triggered when this job writes rows
+        """
+        self.jobs[name] = {
+            'func': func,
+            'description': description,
+            'max_staleness': max_staleness,
+            'downstream': list(downstream),
+        }
+
+        if trigger is not None:
+            options = {}
+            # next_run_time=None would add the job paused; leave it to the trigger instead
+            catch_up_time = self._catch_up_time(name, max_staleness)
+            if catch_up_time is not None:
+                options['next_run_time'] = catch_up_time
+
+            self.scheduler.add_job(
+                self.run,
+                trigger=trigger,
+                args=[name],
+                id=name,
+                name=description,
+                **options,
+            )
+
+    def trigger(self, name, reason):
+        """Queue a one-off run of a job as soon as possible"""
+        print(f"[{datetime.now()}] ⏩ Triggering {name} ({reason})")
+        self.scheduler.add_job(
+            self.run,
+            args=[name],
+            kwargs={'rerun_if_busy': True},
+            id=f'{name}:triggered',
+            name=f"{self.jobs[name]['description']} (triggered)",
+            replace_existing=True,
+        )
+
+    def run(self, name, *args, rerun_if_busy=False):
+        """
+        Run a job under its lock, record metrics and trigger downstream jobs
+
+        Args:
+            name: Job id
+            *args: Passed to the job function
+            rerun_if_busy: If the job is already running, run it again
+                once that run ends instead of just skipping
+
+        Returns:
+            False if the run was skipped because the job is already running
+        """
+        job = self.jobs[name]
+
+        with job_lock(name) as acquired:
+            if not acquired:
+                print(f"[{datetime.now()}] ⏭️  {name} is already running, skipping")
+                JOB_RUNS.labels(job=name, status='skipped').inc()
+                if rerun_if_busy:
+                    self.rerun.add(name)
+                return False
+
+            print(f"[{datetime.now()}] Running {job['description']}...")
+            started = time.monotonic()
+            try:
+                result = job['func'](*args) or 0
+            except Exception as e:
+                rows = 0
+                JOB_DURATION.labels(job=name).observe(time.monotonic() - started)
+                JOB_RUNS.labels(job=name, status='failed').inc()
+                print(f"[{datetime.now()}] ❌ {job['description']} failed: {str(e)}")
+            else:
+                if not isinstance(result, JobResult):
+                    result = JobResult(result)
+                rows = result.rows
+                duration = time.monotonic() - started
+                JOB_DURATION.labels(job=name).observe(duration)
+                JOB_ROWS.labels(job=name).observe(rows)
+                if result.errors:
+                    # Committed rows still go downstream, but the job is not
+                    # marked successful so it is caught up at the next start
+                    JOB_RUNS.labels(job=name, status='partial').inc()
+                    print(f"[{datetime.now()}] ⚠️  {job['description']} completed with "
+                          f"{len(result.errors)} errors: {rows} rows in {duration:.1f}s "
+                          f"({'; '.join(result.errors)})")
+                else:
+                    JOB_RUNS.labels(job=name, status='success').inc()
+                    JOB_LAST_SUCCESS.labels(job=name).set(time.time())
+                    self._record_success(name)
+                    print(f"[{datetime.now()}] ✅ {job['description']} completed: {rows} rows in {duration:.1f}s")
+
+        # Outside the lock, so the rerun cannot find this run still holding it
+        if name in self.rerun:
+            self.rerun.discard(name)
+            self.trigger(name, "requested while running")
+
+        if rows > 0:
+            for downstream in job['downstream']:
+                self.trigger(downstream, f"{name} wrote {rows} rows")
+
+        return True
+
+    def _catch_up_time(self, name, max_staleness):
+        """Return now if the job's last success is older than max_staleness, else None"""
+        if not CATCH_UP_ON_START or max_staleness is None:
+            return None
+
+        last_success = self.state.get(name)
+        if last_success is not None and datetime.fromisoformat(last_success) > datetime.now() - max_staleness:
+            return None
+
+        print(f"  ⏩ {name}: last success {last_success or 'never'}, catching up now")
+        return datetime.now()
+
+    def _load_state(self):
+        if SCHEDULER_STATE_PATH.exists():
+            with open(SCHEDULER_STATE_PATH) as f:
+                return json.load(f)
+        return {}
+
+    def _record_success(self, name):
+        self.state[name] = datetime.now().isoformat()
+        STATE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = SCHEDULER_STATE_PATH.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, SCHEDULER_STATE_PATH)
+
+
+def start_watcher(pipeline):
+    """Ingest only the chokepoints whose CSVs changed, shortly after they are written"""
+    from watcher import CsvWatcher
+    from jobs.incremental_csv_to_postgres import find_chokepoints_dir
+
     try:
-        from jobs.pg_to_clickhouse import sync_to_clickhouse
-        sync_to_clickhouse()
-        print(f"[{datetime.now()}] ✅ ClickHouse sync completed")
-    except Exception as e:
-        print(f"[{datetime.now()}] ❌ ClickHouse sync failed: {str(e)}")
+        base_path = find_chokepoints_dir()
+    except FileNotFoundError as e:
+        print(f"⚠️  Watch mode disabled: {str(e)}")
+        return None
+
+    watcher = CsvWatcher(base_path, lambda csv_files: pipeline.run('csv_to_postgres', csv_files))
+    watcher.start()
+    print(f"👀 Watching {base_path} (debounce {watcher.debounce}s)")
+    return watcher
+
 
 def main():
-    scheduler = BlockingScheduler()
+    # One instance per job; missed runs within the grace window collapse into one
+    scheduler = BlockingScheduler(job_defaults={
+        'max_instances': 1,
+        'coalesce': True,
+        'misfire_grace_time': MISFIRE_GRACE_SECONDS,
+    })
+    pipeline = Pipeline(scheduler)
 
-    # CSV to PostgreSQL: Every hour
-    scheduler.add_job(
+    # CSV to PostgreSQL: Every hour (a safety sweep in watch mode), then ClickHouse sync when rows changed
+    pipeline.register(
+        'csv_to_postgres',
         csv_to_postgres,
+        'CSV to PostgreSQL sync',
         trigger=CronTrigger(minute=0),
-        id='csv_to_postgres',
-        name='CSV to PostgreSQL sync'
+        max_staleness=timedelta(hours=1),
+        downstream=['pg_to_clickhouse'],
     )
 
-    # PostgreSQL to ClickHouse: Daily at 2 AM
-    scheduler.add_job(
+    # PostgreSQL to ClickHouse: triggered by CSV ingest, plus a daily safety run at 2 AM
+    pipeline.register(
+        'pg_to_clickhouse',
         pg_to_clickhouse,
+        'PostgreSQL to ClickHouse sync',
         trigger=CronTrigger(hour=2, minute=0),
-        id='pg_to_clickhouse',
-        name='PostgreSQL to ClickHouse sync'
+        max_staleness=timedelta(days=1),
     )
 
+    if WATCH_ENABLED:
+        start_watcher(pipeline)
+
+    start_http_server(METRICS_PORT)
+
     print("📅 ETL Scheduler started")
+    print(f"Metrics: http://0.0.0.0:{METRICS_PORT}/metrics")
     print("Jobs:")
     for job in scheduler.get_jobs():
         print(f"  - {job.name}")
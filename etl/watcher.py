@@ -0,0 +1,124 @@
+"""
+CSV Watcher
+Watches the chokepoints directory (inotify on Linux) and reports changed
+vessel arrival CSVs once writes to them have settled
+"""
+import os
+import time
+import threading
+from pathlib import Path, PurePath
+from datetime import datetime
+
+from dotenv import load_dotenv
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+from jobs.incremental_csv_to_postgres import CSV_PATTERN
+
+load_dotenv()
+
+# Quiet period after the last write before a file is ingested
+DEBOUNCE_SECONDS = float(os.getenv('ETL_WATCH_DEBOUNCE_SECONDS', '5'))
+
+# Upper bound on the wait for a file that keeps being written to
+MAX_DELAY_SECONDS = float(os.getenv('ETL_WATCH_MAX_DELAY_SECONDS', '30'))
+
+# Events that can change a file's contents ('closed' is close-after-write)
+WRITE_EVENTS = {'created', 'modified', 'moved', 'closed'}
+
+
+class CsvWatcher(FileSystemEventHandler):
+    """
+    Debounced watcher for vessel arrival CSVs
+
+    Bursts of events on a file are collapsed: the file is handed to
+    on_change once it has been quiet for `debounce` seconds, or after
+    `max_delay` seconds at the latest. Files becoming ready together are
+    handed over in one call. If on_change returns False (e.g. another
+    ingest holds the lock), the files are queued again.
+    """
+
+    def __init__(self, base_path, on_change, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS):
+        self.base_path = Path(base_path)
+        self.on_change = on_change
+        self.debounce = debounce
+        self.max_delay = max_delay
+
+        # csv_file -> (first event, last event) in monotonic time
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._observer = Observer()
+        self._thread = threading.Thread(target=self._flush_loop, name='csv-watcher', daemon=True)
+
+    def start(self):
+        self._observer.schedule(self, str(self.base_path), recursive=True)
+        self._observer.start()
+        self._thread.start()
+
+    def stop(self):
+        self._observer.stop()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._observer.join()
+        self._thread.join()
+
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in WRITE_EVENTS:
+            return
+
+        # Atomic writes show up as a rename onto the CSV
+        path = Path(event.dest_path if event.event_type == 'moved' else event.src_path)
+        if self._is_vessel_arrivals_csv(path):
+            self.add(path)
+
+    def add(self, csv_file):
+        """Mark a file as changed"""
+        now = time.monotonic()
+        with self._condition:
+            first_seen, _ = self._pending.get(csv_file, (now, now))
+            self._pending[csv_file] = (first_seen, now)
+            self._condition.notify()
+
+    def _is_vessel_arrivals_csv(self, path):
+        try:
+            relative = path.relative_to(self.base_path)
+        except ValueError:
+            return False
+        return len(relative.parts) == 3 and PurePath(relative).match(CSV_PATTERN)
+
+    def _take_ready(self):
+        """Wait until some files are ready and remove them from pending (None once stopped)"""
+        with self._condition:
+            while not self._stopped:
+                now = time.monotonic()
+                deadlines = {
+                    csv_file: min(last_seen + self.debounce, first_seen + self.max_delay)
+                    for csv_file, (first_seen, last_seen) in self._pending.items()
+                }
+                ready = sorted(f for f, deadline in deadlines.items() if deadline <= now)
+                if ready:
+                    for csv_file in ready:
+                        del self._pending[csv_file]
+                    return ready
+
+                self._condition.wait(min(deadlines.values()) - now if deadlines else None)
+        return None
+
+    def _flush_loop(self):
+        while True:
+            ready = self._take_ready()
+            if ready is None:
+                return
+
+            print(f"[{datetime.now()}] 👀 Changed: {', '.join(f.parent.parent.name for f in ready)}")
+            try:
+                handled = self.on_change(ready)
+            except Exception as e:
+                print(f"[{datetime.now()}] ❌ Watch ingest failed: {str(e)}")
+                continue
+
+            if handled is False:
+                for csv_file in ready:
+                    self.add(csv_file)
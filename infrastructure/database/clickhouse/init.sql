@@ -8,6 +8,8 @@ CREATE DATABASE IF NOT EXISTS seesea_analytics;
 USE seesea_analytics;
 
 -- Create main analytics table (columnar storage)
+-- Rows re-synced from PostgreSQL replace older versions by updated_at;
+-- read with FINAL where un-merged duplicates matter
 CREATE TABLE IF NOT EXISTS vessel_arrivals_analytics (
     date Date,
     chokepoint LowCardinality(String),
@@ -17,43 +19,97 @@ CREATE TABLE IF NOT EXISTS vessel_arrivals_analytics (
     general_cargo UInt16,
     roro UInt16,
     tanker UInt16,
-    collected_at DateTime
-) ENGINE = MergeTree()
+    collected_at DateTime,
+    updated_at DateTime64(6, 'UTC')
+) ENGINE = ReplacingMergeTree(updated_at)
 PARTITION BY toYYYYMM(date)
 ORDER BY (chokepoint, date)
 SETTINGS index_granularity = 8192;
 
--- Create monthly summary materialized view
+-- Create monthly rollup table
+-- avg/max/min are stored as aggregate states so partial parts merge correctly;
+-- sums use SimpleAggregateFunction since they merge by plain addition.
+-- Partitioned by month so the ETL can rebuild months touched by re-synced rows
+-- (see etl/jobs/clickhouse_common.py)
+CREATE TABLE IF NOT EXISTS monthly_summary (
+    month Date,
+    chokepoint LowCardinality(String),
+    total_vessels SimpleAggregateFunction(sum, UInt64),
+    avg_vessels AggregateFunction(avg, UInt32),
+    peak_vessels AggregateFunction(max, UInt32),
+    min_vessels AggregateFunction(min, UInt32),
+    total_containers SimpleAggregateFunction(sum, UInt64),
+    total_dry_bulk SimpleAggregateFunction(sum, UInt64),
+    total_general_cargo SimpleAggregateFunction(sum, UInt64),
+    total_roro SimpleAggregateFunction(sum, UInt64),
+    total_tankers SimpleAggregateFunction(sum, UInt64)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(month)
+ORDER BY (chokepoint, month);
+
+-- Create monthly summary materialized view (feeds monthly_summary on insert)
 CREATE MATERIALIZED VIEW IF NOT EXISTS monthly_summary_mv
-ENGINE = SummingMergeTree()
-PARTITION BY toYear(month)
-ORDER BY (chokepoint, month)
+TO monthly_summary
 AS SELECT
     toStartOfMonth(date) as month,
     chokepoint,
-    sum(vessel_count) as total_vessels,
-    avg(vessel_count) as avg_vessels,
-    max(vessel_count) as peak_vessels,
-    min(vessel_count) as min_vessels,
-    sum(container) as total_containers,
-    sum(tanker) as total_tankers
+    sum(toUInt64(vessel_count)) as total_vessels,
+    avgState(vessel_count) as avg_vessels,
+    maxState(vessel_count) as peak_vessels,
+    minState(vessel_count) as min_vessels,
+    sum(toUInt64(container)) as total_containers,
+    sum(toUInt64(dry_bulk)) as total_dry_bulk,
+    sum(toUInt64(general_cargo)) as total_general_cargo,
+    sum(toUInt64(roro)) as total_roro,
+    sum(toUInt64(tanker)) as total_tankers
 FROM vessel_arrivals_analytics
 GROUP BY month, chokepoint;
 
--- Create weekly summary materialized view
+-- Create weekly rollup table (ISO weeks starting on Monday), same layout as
+-- monthly_summary. Partitioned by the month the week starts in, so a week
+-- spanning two months is rebuilt with the earlier one.
+CREATE TABLE IF NOT EXISTS weekly_summary (
+    week Date,
+    chokepoint LowCardinality(String),
+    total_vessels SimpleAggregateFunction(sum, UInt64),
+    avg_vessels AggregateFunction(avg, UInt32),
+    peak_vessels AggregateFunction(max, UInt32),
+    min_vessels AggregateFunction(min, UInt32),
+    total_containers SimpleAggregateFunction(sum, UInt64),
+    total_dry_bulk SimpleAggregateFunction(sum, UInt64),
+    total_general_cargo SimpleAggregateFunction(sum, UInt64),
+    total_roro SimpleAggregateFunction(sum, UInt64),
+    total_tankers SimpleAggregateFunction(sum, UInt64)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(week)
+ORDER BY (chokepoint, week);
+
+-- Create weekly summary materialized view (feeds weekly_summary on insert)
 CREATE MATERIALIZED VIEW IF NOT EXISTS weekly_summary_mv
-ENGINE = SummingMergeTree()
-ORDER BY (chokepoint, week)
+TO weekly_summary
 AS SELECT
-    toStartOfWeek(date) as week,
+    toMonday(date) as week,
     chokepoint,
-    sum(vessel_count) as total_vessels,
-    avg(vessel_count) as avg_vessels,
-    sumIf(container, container > 0) as total_containers,
-    sumIf(tanker, tanker > 0) as total_tankers,
-    sumIf(dry_bulk, dry_bulk > 0) as total_dry_bulk
+    sum(toUInt64(vessel_count)) as total_vessels,
+    avgState(vessel_count) as avg_vessels,
+    maxState(vessel_count) as peak_vessels,
+    minState(vessel_count) as min_vessels,
+    sum(toUInt64(container)) as total_containers,
+    sum(toUInt64(dry_bulk)) as total_dry_bulk,
+    sum(toUInt64(general_cargo)) as total_general_cargo,
+    sum(toUInt64(roro)) as total_roro,
+    sum(toUInt64(tanker)) as total_tankers
 FROM vessel_arrivals_analytics
 GROUP BY week, chokepoint;
 
+-- ETL sync state (watermarks and pending rollup rebuilds per job)
+CREATE TABLE IF NOT EXISTS etl_sync_state (
+    job LowCardinality(String),
+    watermark DateTime64(6, 'UTC'),
+    pending_partitions Array(UInt32),
+    updated_at DateTime64(6) DEFAULT now64(6)
+) ENGINE = ReplacingMergeTree(updated_at)
+ORDER BY job;
+
 -- Create a sample query function for testing
 SELECT 'ClickHouse analytics database initialized successfully!' as status;
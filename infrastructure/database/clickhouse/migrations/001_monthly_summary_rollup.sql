@@ -0,0 +1,62 @@
+-- Migration: replace the SummingMergeTree monthly_summary_mv with the
+-- AggregatingMergeTree rollup from init.sql and backfill it.
+-- Run once against existing deployments (init.sql only runs on a fresh volume),
+-- while the ETL scheduler is stopped:
+--   clickhouse-client --multiquery < 001_monthly_summary_rollup.sql
+
+USE seesea_analytics;
+
+-- The old view summed avg/max/min and lacked dry_bulk, general_cargo and roro
+DROP VIEW IF EXISTS monthly_summary_mv;
+
+CREATE TABLE IF NOT EXISTS monthly_summary (
+    month Date,
+    chokepoint LowCardinality(String),
+    total_vessels SimpleAggregateFunction(sum, UInt64),
+    avg_vessels AggregateFunction(avg, UInt32),
+    peak_vessels AggregateFunction(max, UInt32),
+    min_vessels AggregateFunction(min, UInt32),
+    total_containers SimpleAggregateFunction(sum, UInt64),
+    total_dry_bulk SimpleAggregateFunction(sum, UInt64),
+    total_general_cargo SimpleAggregateFunction(sum, UInt64),
+    total_roro SimpleAggregateFunction(sum, UInt64),
+    total_tankers SimpleAggregateFunction(sum, UInt64)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYear(month)
+ORDER BY (chokepoint, month);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS monthly_summary_mv
+TO monthly_summary
+AS SELECT
+    toStartOfMonth(date) as month,
+    chokepoint,
+    sum(toUInt64(vessel_count)) as total_vessels,
+    avgState(vessel_count) as avg_vessels,
+    maxState(vessel_count) as peak_vessels,
+    minState(vessel_count) as min_vessels,
+    sum(toUInt64(container)) as total_containers,
+    sum(toUInt64(dry_bulk)) as total_dry_bulk,
+    sum(toUInt64(general_cargo)) as total_general_cargo,
+    sum(toUInt64(roro)) as total_roro,
+    sum(toUInt64(tanker)) as total_tankers
+FROM vessel_arrivals_analytics
+GROUP BY month, chokepoint;
+
+-- Backfill from existing raw data
+TRUNCATE TABLE monthly_summary;
+
+INSERT INTO monthly_summary
+SELECT
+    toStartOfMonth(date) as month,
+    chokepoint,
+    sum(toUInt64(vessel_count)),
+    avgState(vessel_count),
+    maxState(vessel_count),
+    minState(vessel_count),
+    sum(toUInt64(container)),
+    sum(toUInt64(dry_bulk)),
+    sum(toUInt64(general_cargo)),
+    sum(toUInt64(roro)),
+    sum(toUInt64(tanker))
+FROM vessel_arrivals_analytics
+GROUP BY month, chokepoint;
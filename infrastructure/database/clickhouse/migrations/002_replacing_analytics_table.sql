@@ -0,0 +1,122 @@
+-- Migration: convert vessel_arrivals_analytics to ReplacingMergeTree(updated_at),
+-- repartition monthly_summary by month and add ETL sync state.
+-- Run once after 001, while the ETL scheduler is stopped:
+--   clickhouse-client --multiquery < 002_replacing_analytics_table.sql
+-- The next pg_to_clickhouse run finds no watermark and resyncs every row,
+-- which also removes rows duplicated by earlier re-runs.
+
+USE seesea_analytics;
+
+-- Views reading the raw table are recreated against the new table
+DROP VIEW IF EXISTS monthly_summary_mv;
+DROP VIEW IF EXISTS weekly_summary_mv;
+
+RENAME TABLE vessel_arrivals_analytics TO vessel_arrivals_analytics_old;
+
+CREATE TABLE vessel_arrivals_analytics (
+    date Date,
+    chokepoint LowCardinality(String),
+    vessel_count UInt32,
+    container UInt16,
+    dry_bulk UInt16,
+    general_cargo UInt16,
+    roro UInt16,
+    tanker UInt16,
+    collected_at DateTime,
+    updated_at DateTime64(6, 'UTC')
+) ENGINE = ReplacingMergeTree(updated_at)
+PARTITION BY toYYYYMM(date)
+ORDER BY (chokepoint, date)
+SETTINGS index_granularity = 8192;
+
+-- Keep the latest collected row per (chokepoint, date)
+INSERT INTO vessel_arrivals_analytics
+SELECT
+    date,
+    chokepoint,
+    argMax(vessel_count, collected_at),
+    argMax(container, collected_at),
+    argMax(dry_bulk, collected_at),
+    argMax(general_cargo, collected_at),
+    argMax(roro, collected_at),
+    argMax(tanker, collected_at),
+    max(collected_at),
+    toDateTime64(max(collected_at), 6, 'UTC')
+FROM vessel_arrivals_analytics_old
+GROUP BY chokepoint, date;
+
+DROP TABLE monthly_summary;
+
+CREATE TABLE monthly_summary (
+    month Date,
+    chokepoint LowCardinality(String),
+    total_vessels SimpleAggregateFunction(sum, UInt64),
+    avg_vessels AggregateFunction(avg, UInt32),
+    peak_vessels AggregateFunction(max, UInt32),
+    min_vessels AggregateFunction(min, UInt32),
+    total_containers SimpleAggregateFunction(sum, UInt64),
+    total_dry_bulk SimpleAggregateFunction(sum, UInt64),
+    total_general_cargo SimpleAggregateFunction(sum, UInt64),
+    total_roro SimpleAggregateFunction(sum, UInt64),
+    total_tankers SimpleAggregateFunction(sum, UInt64)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(month)
+ORDER BY (chokepoint, month);
+
+INSERT INTO monthly_summary
+SELECT
+    toStartOfMonth(date) as month,
+    chokepoint,
+    sum(toUInt64(vessel_count)),
+    avgState(vessel_count),
+    maxState(vessel_count),
+    minState(vessel_count),
+    sum(toUInt64(container)),
+    sum(toUInt64(dry_bulk)),
+    sum(toUInt64(general_cargo)),
+    sum(toUInt64(roro)),
+    sum(toUInt64(tanker))
+FROM vessel_arrivals_analytics FINAL
+GROUP BY month, chokepoint;
+
+CREATE MATERIALIZED VIEW monthly_summary_mv
+TO monthly_summary
+AS SELECT
+    toStartOfMonth(date) as month,
+    chokepoint,
+    sum(toUInt64(vessel_count)) as total_vessels,
+    avgState(vessel_count) as avg_vessels,
+    maxState(vessel_count) as peak_vessels,
+    minState(vessel_count) as min_vessels,
+    sum(toUInt64(container)) as total_containers,
+    sum(toUInt64(dry_bulk)) as total_dry_bulk,
+    sum(toUInt64(general_cargo)) as total_general_cargo,
+    sum(toUInt64(roro)) as total_roro,
+    sum(toUInt64(tanker)) as total_tankers
+FROM vessel_arrivals_analytics
+GROUP BY month, chokepoint;
+
+CREATE MATERIALIZED VIEW weekly_summary_mv
+ENGINE = SummingMergeTree()
+ORDER BY (chokepoint, week)
+POPULATE
+AS SELECT
+    toStartOfWeek(date) as week,
+    chokepoint,
+    sum(vessel_count) as total_vessels,
+    avg(vessel_count) as avg_vessels,
+    sumIf(container, container > 0) as total_containers,
+    sumIf(tanker, tanker > 0) as total_tankers,
+    sumIf(dry_bulk, dry_bulk > 0) as total_dry_bulk
+FROM vessel_arrivals_analytics
+GROUP BY week, chokepoint;
+
+CREATE TABLE IF NOT EXISTS etl_sync_state (
+    job LowCardinality(String),
+    watermark DateTime64(6, 'UTC'),
+    pending_partitions Array(UInt32),
+    updated_at DateTime64(6) DEFAULT now64(6)
+) ENGINE = ReplacingMergeTree(updated_at)
+ORDER BY job;
+
+DROP TABLE vessel_arrivals_analytics_old;
@@ -0,0 +1,60 @@
+-- Migration: replace the SummingMergeTree weekly_summary_mv with the
+-- AggregatingMergeTree weekly_summary rollup from init.sql and backfill it.
+-- Run once after 002, while the ETL scheduler is stopped:
+--   clickhouse-client --multiquery < 003_weekly_summary_rollup.sql
+
+USE seesea_analytics;
+
+-- The old view summed avg, started weeks on Sunday and lacked general_cargo and roro
+DROP VIEW IF EXISTS weekly_summary_mv;
+
+CREATE TABLE IF NOT EXISTS weekly_summary (
+    week Date,
+    chokepoint LowCardinality(String),
+    total_vessels SimpleAggregateFunction(sum, UInt64),
+    avg_vessels AggregateFunction(avg, UInt32),
+    peak_vessels AggregateFunction(max, UInt32),
+    min_vessels AggregateFunction(min, UInt32),
+    total_containers SimpleAggregateFunction(sum, UInt64),
+    total_dry_bulk SimpleAggregateFunction(sum, UInt64),
+    total_general_cargo SimpleAggregateFunction(sum, UInt64),
+    total_roro SimpleAggregateFunction(sum, UInt64),
+    total_tankers SimpleAggregateFunction(sum, UInt64)
+) ENGINE = AggregatingMergeTree()
+PARTITION BY toYYYYMM(week)
+ORDER BY (chokepoint, week);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS weekly_summary_mv
+TO weekly_summary
+AS SELECT
+    toMonday(date) as week,
+    chokepoint,
+    sum(toUInt64(vessel_count)) as total_vessels,
+    avgState(vessel_count) as avg_vessels,
+    maxState(vessel_count) as peak_vessels,
+    minState(vessel_count) as min_vessels,
+    sum(toUInt64(container)) as total_containers,
+    sum(toUInt64(dry_bulk)) as total_dry_bulk,
+    sum(toUInt64(general_cargo)) as total_general_cargo,
+    sum(toUInt64(roro)) as total_roro,
+    sum(toUInt64(tanker)) as total_tankers
+FROM vessel_arrivals_analytics
+GROUP BY week, chokepoint;
+
+TRUNCATE TABLE weekly_summary;
+
+INSERT INTO weekly_summary
+SELECT
+    toMonday(date) as week,
+    chokepoint,
+    sum(toUInt64(vessel_count)),
+    avgState(vessel_count),
+    maxState(vessel_count),
+    minState(vessel_count),
+    sum(toUInt64(container)),
+    sum(toUInt64(dry_bulk)),
+    sum(toUInt64(general_cargo)),
+    sum(toUInt64(roro)),
+    sum(toUInt64(tanker))
+FROM vessel_arrivals_analytics FINAL
+GROUP BY week, chokepoint;
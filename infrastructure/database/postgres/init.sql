@@ -55,6 +55,8 @@ SELECT create_hypertable(
 CREATE INDEX IF NOT EXISTS idx_chokepoint_date ON vessel_arrivals(chokepoint, date DESC);
 CREATE INDEX IF NOT EXISTS idx_date ON vessel_arrivals(date DESC);
 CREATE INDEX IF NOT EXISTS idx_collected_at ON vessel_arrivals(collected_at DESC);
+-- The ClickHouse sync reads rows changed since its watermark by updated_at
+CREATE INDEX IF NOT EXISTS idx_updated_at ON vessel_arrivals(updated_at);
 
 -- Create materialized view for daily summary
 CREATE MATERIALIZED VIEW IF NOT EXISTS daily_summary AS
@@ -80,6 +82,38 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- Latest known position per vessel (one row per MMSI, upserted by the position feed)
+CREATE TABLE IF NOT EXISTS vessel_positions (
+    mmsi VARCHAR(9) PRIMARY KEY,
+    name VARCHAR(100),
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    speed REAL,
+    heading REAL,
+    status VARCHAR(20),
+    destination VARCHAR(100),
+    cargo VARCHAR(100),
+    teu INTEGER,
+    eta TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- The API reads incremental changes by updated_at
+CREATE INDEX IF NOT EXISTS idx_vessel_positions_updated_at ON vessel_positions(updated_at);
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS vessel_positions_touch ON vessel_positions;
+CREATE TRIGGER vessel_positions_touch
+    BEFORE INSERT OR UPDATE ON vessel_positions
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
 -- Grant permissions
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO admin;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO admin;
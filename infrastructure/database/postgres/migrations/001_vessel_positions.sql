@@ -0,0 +1,37 @@
+-- Migration: add the vessel_positions table served by the Python API's /ships routes.
+-- Run once against existing deployments (init.sql only runs on a fresh volume):
+--   psql "$DATABASE_URL" -f 001_vessel_positions.sql
+
+-- Latest known position per vessel (one row per MMSI, upserted by the position feed)
+CREATE TABLE IF NOT EXISTS vessel_positions (
+    mmsi VARCHAR(9) PRIMARY KEY,
+    name VARCHAR(100),
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    speed REAL,
+    heading REAL,
+    status VARCHAR(20),
+    destination VARCHAR(100),
+    cargo VARCHAR(100),
+    teu INTEGER,
+    eta TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- The API reads incremental changes by updated_at
+CREATE INDEX IF NOT EXISTS idx_vessel_positions_updated_at ON vessel_positions(updated_at);
+
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS vessel_positions_touch ON vessel_positions;
+CREATE TRIGGER vessel_positions_touch
+    BEFORE INSERT OR UPDATE ON vessel_positions
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+GRANT ALL PRIVILEGES ON vessel_positions TO admin;
@@ -0,0 +1,10 @@
+-- Migration: index vessel_arrivals.updated_at for the incremental ClickHouse sync
+-- (pg_to_clickhouse reads WHERE updated_at >= watermark ORDER BY updated_at).
+-- Run once against existing deployments (init.sql only runs on a fresh volume):
+--   psql "$DATABASE_URL" -f 002_vessel_arrivals_updated_at_index.sql
+--
+-- Hypertables do not support CREATE INDEX CONCURRENTLY; transaction_per_chunk
+-- builds the index one chunk at a time so writes are only blocked per chunk.
+
+CREATE INDEX IF NOT EXISTS idx_updated_at ON vessel_arrivals(updated_at)
+    WITH (timescaledb.transaction_per_chunk);